@@ -31,3 +31,18 @@ PROCESS_TASK_URL = f"{PROTOCOL}://{URL}"
 
 assert API_DOMAIN, "API_DOMAIN is not defined."
 assert PROCESS_TASK_API_PATH, "PROCESS_TASK_API_PATH is not defined."
+
+# "push" relays Eventarc push deliveries, "pull" runs a streaming pull worker
+QUEUE_MODE = os.getenv("QUEUE_MODE", "push").lower()
+QUEUE_SUBSCRIPTION = os.getenv("QUEUE_SUBSCRIPTION", "queue-topic-pull")
+# Flow control of the pull worker
+MAX_OUTSTANDING_MESSAGES = int(os.getenv("MAX_OUTSTANDING_MESSAGES", "10"))
+MAX_OUTSTANDING_BYTES = int(
+    os.getenv("MAX_OUTSTANDING_BYTES", str(10 * 1024 * 1024)))
+# Leases of messages being dispatched are extended up to this many seconds
+MAX_LEASE_DURATION = int(os.getenv("MAX_LEASE_DURATION", "3600"))
+DISPATCH_WORKERS = int(
+    os.getenv("DISPATCH_WORKERS", str(MAX_OUTSTANDING_MESSAGES)))
+# Backoff (seconds) between restarts of a streaming pull that stopped on error
+PULL_RESTART_BACKOFF_MIN = float(os.getenv("PULL_RESTART_BACKOFF_MIN", "1"))
+PULL_RESTART_BACKOFF_MAX = float(os.getenv("PULL_RESTART_BACKOFF_MAX", "60"))
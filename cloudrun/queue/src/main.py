@@ -22,10 +22,24 @@ from fastapi import FastAPI
 from fastapi import status
 
 import config
+from common.utils import metrics
 from routes import queue
+from utils.pull_worker import PullWorker
 
 # app = FastAPI(docs_url="/docs", redoc_url="/redoc", openapi_url="/openapi.json")
 app = FastAPI(title="Queue Task Dispatcher")
+pull_worker = PullWorker()
+
+
+@app.on_event("startup")
+def start_pull_worker():
+  if config.QUEUE_MODE == "pull":
+    pull_worker.start()
+
+
+@app.on_event("shutdown")
+def stop_pull_worker():
+  pull_worker.stop()
 
 
 @app.get("/ping")
@@ -33,6 +47,11 @@ def health_check():
   return True
 
 
+@app.get("/metrics")
+def get_metrics():
+  return metrics.metrics_response()
+
+
 @app.post("/")
 def health_check_post():
   return True
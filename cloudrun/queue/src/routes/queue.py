@@ -25,7 +25,9 @@ import json
 from fastapi import status, Response
 from config import PROCESS_TASK_URL, API_DOMAIN
 from common.config import STATUS_SUCCESS
+from common.utils import metrics
 from common.utils.iap import send_iap_request
+from common.utils.publisher import load_message_list
 from common.utils.logging_handler import Logger
 
 logger = Logger.get_logger(__name__)
@@ -83,33 +85,7 @@ async def publish_msg(request: Request, response: Response):
       msg_data = base64.b64decode(
           pubsub_message["data"]).decode("utf-8").strip()
       name = json.loads(msg_data)
-      payload = name.get("message_list")
-      request_body = {"configs": payload}
-      logger.info(f"queue - Pub/Sub message configs: {request_body}")
-      # Sample request body
-      # {
-      #   "configs": [
-      #     {
-      #       "case_id": "6075e034-2763-11ed-8345-aa81c3a89f04",
-      #       "uid": "jcdQmUqUKrcs8GGsmojp",
-      #       "gcs_url": "gs://sample-project-dev-document-upload/6075e034-2763-11ed-8345-aa81c3a89f04/jcdQmUqUKrcs8GGsmojp/arizona-application-form.pdf",
-      #       "context": "arizona"
-      #     }
-      #   ]
-      # }
-
-      start_time = time.time()
-      print(f"queue - Sending {len(name.get('message_list'))} data to {PROCESS_TASK_URL}:")
-      print(request_body)
-
-      process_task_response = send_iap_request(PROCESS_TASK_URL, method="POST", json=request_body)
-
-      process_time = time.time() - start_time
-      time_elapsed = round(process_time * 1000)
-      print(f"queue - Response from {PROCESS_TASK_URL}, Time elapsed: {str(time_elapsed)} ms")
-
-      print(f"queue - response={process_task_response.text} with status code={process_task_response.status_code}")
-
+      process_task_response = dispatch_message(name)
       response.status_code = process_task_response.status_code
       return response
   else:
@@ -122,6 +98,46 @@ async def publish_msg(request: Request, response: Response):
   return "", status.HTTP_204_NO_CONTENT
 
 
+def dispatch_message(name):
+  """Sends the message list of a queue message to the process_task API
+
+  Args:
+    name (dict): decoded Pub/Sub message
+  Returns:
+    response of the process_task API
+  """
+  # message lists of oversized messages are stored in GCS
+  payload = load_message_list(name)
+  request_body = {"configs": payload}
+  logger.info(f"queue - Pub/Sub message configs: {request_body}")
+  # Sample request body
+  # {
+  #   "configs": [
+  #     {
+  #       "case_id": "6075e034-2763-11ed-8345-aa81c3a89f04",
+  #       "uid": "jcdQmUqUKrcs8GGsmojp",
+  #       "gcs_url": "gs://sample-project-dev-document-upload/6075e034-2763-11ed-8345-aa81c3a89f04/jcdQmUqUKrcs8GGsmojp/arizona-application-form.pdf",
+  #       "context": "arizona"
+  #     }
+  #   ]
+  # }
+
+  start_time = time.time()
+  print(f"queue - Sending {len(payload or [])} data to {PROCESS_TASK_URL}:")
+  print(request_body)
+
+  process_task_response = send_iap_request(PROCESS_TASK_URL, method="POST", json=request_body)
+
+  process_time = time.time() - start_time
+  time_elapsed = round(process_time * 1000)
+  print(f"queue - Response from {PROCESS_TASK_URL}, Time elapsed: {str(time_elapsed)} ms")
+  metrics.observe(metrics.STAGE_DISPATCH, process_time)
+  metrics.count(metrics.STAGE_DISPATCH, documents=len(payload or []))
+
+  print(f"queue - response={process_task_response.text} with status code={process_task_response.status_code}")
+  return process_task_response
+
+
 # BATCH_PROCESS_QUOTA = int(os.environ.get("BATCH_PROCESS_QUOTA", 5))
 # print(f"BATCH_PROCESS_QUOTA={BATCH_PROCESS_QUOTA}")
 
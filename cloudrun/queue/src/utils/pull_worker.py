@@ -0,0 +1,154 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+""" Streaming pull worker dispatching queue messages to process_task """
+
+import json
+import threading
+import traceback
+from concurrent import futures
+from google.cloud import pubsub_v1
+from google.cloud.pubsub_v1.subscriber.scheduler import ThreadScheduler
+from config import QUEUE_SUBSCRIPTION, MAX_OUTSTANDING_MESSAGES
+from config import MAX_OUTSTANDING_BYTES, MAX_LEASE_DURATION, DISPATCH_WORKERS
+from config import PULL_RESTART_BACKOFF_MIN, PULL_RESTART_BACKOFF_MAX
+from common.config import PROJECT_ID
+from common.utils.logging_handler import Logger
+from routes.queue import dispatch_message
+
+logger = Logger.get_logger(__name__)
+
+
+class PullWorker:
+  """Pulls queue messages with flow control and dispatches them concurrently.
+
+  The subscriber keeps at most MAX_OUTSTANDING_MESSAGES (and bytes) leased
+  and extends their leases while process_task is running, so slow stages
+  slow down the pull instead of causing redeliveries. Messages are acked
+  when process_task succeeded and nacked otherwise. A streaming pull that
+  stops on error is restarted with exponential backoff.
+  """
+
+  def __init__(self, subscription=QUEUE_SUBSCRIPTION):
+    self.subscription = subscription
+    self.subscriber = None
+    self.streaming_pull_future = None
+    self.stopping = False
+    self.restart_attempts = 0
+    self.lock = threading.Lock()
+
+  def handle_message(self, message):
+    try:
+      name = json.loads(message.data.decode("utf-8").strip())
+      response = dispatch_message(name)
+    except Exception:
+      err = traceback.format_exc().replace("\n", " ")
+      logger.error(f"handle_message: dispatch of message {message.message_id}"
+                   f" failed: {err}")
+      message.nack()
+      return
+    if 200 <= response.status_code < 300:
+      message.ack()
+      # the stream is healthy again
+      self.restart_attempts = 0
+    else:
+      logger.error(f"handle_message: process_task returned"
+                   f" {response.status_code} for message"
+                   f" {message.message_id}, message nacked")
+      message.nack()
+
+  def start(self):
+    with self.lock:
+      self.stopping = False
+      if self.streaming_pull_future is not None:
+        return
+      self.subscribe()
+
+  def subscribe(self):
+    """Opens the streaming pull, the caller holds self.lock."""
+    self.subscriber = pubsub_v1.SubscriberClient()
+    subscription_path = self.subscriber.subscription_path(
+        PROJECT_ID, self.subscription)
+    flow_control = pubsub_v1.types.FlowControl(
+        max_messages=MAX_OUTSTANDING_MESSAGES,
+        max_bytes=MAX_OUTSTANDING_BYTES,
+        max_lease_duration=MAX_LEASE_DURATION)
+    scheduler = ThreadScheduler(
+        futures.ThreadPoolExecutor(max_workers=DISPATCH_WORKERS))
+    self.streaming_pull_future = self.subscriber.subscribe(
+        subscription_path,
+        callback=self.handle_message,
+        flow_control=flow_control,
+        scheduler=scheduler)
+    self.streaming_pull_future.add_done_callback(self.on_stopped)
+    logger.info(f"subscribe: pulling from {subscription_path} with"
+                f" {MAX_OUTSTANDING_MESSAGES} outstanding messages")
+
+  def on_stopped(self, streaming_pull_future):
+    if self.stopping:
+      return
+    exception = streaming_pull_future.exception() \
+      if not streaming_pull_future.cancelled() else None
+    logger.error(f"on_stopped: streaming pull stopped: {exception}")
+    self.schedule_restart(streaming_pull_future)
+
+  def schedule_restart(self, streaming_pull_future):
+    delay = min(PULL_RESTART_BACKOFF_MAX,
+                PULL_RESTART_BACKOFF_MIN * 2 ** self.restart_attempts)
+    self.restart_attempts += 1
+    logger.info(f"schedule_restart: restarting the streaming pull in"
+                f" {delay} seconds")
+    timer = threading.Timer(delay, self.restart, args=(streaming_pull_future,))
+    timer.daemon = True
+    timer.start()
+
+  def restart(self, streaming_pull_future):
+    """Replaces the stopped streaming_pull_future (None if none is open)."""
+    with self.lock:
+      # stopped or already restarted meanwhile
+      if self.stopping or \
+          self.streaming_pull_future is not streaming_pull_future:
+        return
+      if self.subscriber is not None:
+        try:
+          self.subscriber.close()
+        except Exception as e:
+          logger.error(f"restart: closing the subscriber failed: {e}")
+      self.streaming_pull_future = None
+      self.subscriber = None
+      try:
+        self.subscribe()
+      except Exception:
+        err = traceback.format_exc().replace("\n", " ")
+        logger.error(f"restart: streaming pull not restarted: {err}")
+        self.streaming_pull_future = None
+        self.subscriber = None
+        self.schedule_restart(None)
+
+  def stop(self):
+    self.stopping = True
+    with self.lock:
+      if self.streaming_pull_future is None:
+        return
+      # waits for the running dispatches, unacked messages are redelivered
+      self.streaming_pull_future.cancel()
+      try:
+        self.streaming_pull_future.result()
+      except Exception as e:
+        logger.error(f"stop: streaming pull stopped with error: {e}")
+      self.subscriber.close()
+      self.streaming_pull_future = None
+      self.subscriber = None
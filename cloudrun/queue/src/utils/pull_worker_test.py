@@ -0,0 +1,96 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+  Tests for the streaming pull worker
+"""
+import json
+import os
+import sys
+import time
+from concurrent.futures import Future
+from unittest import mock
+
+# disabling pylint rules that conflict with pytest fixtures
+# pylint: disable=unused-argument,redefined-outer-name,unused-import,wrong-import-position
+
+os.environ.setdefault("API_DOMAIN", "localhost")
+# routes.queue initializes Firebase on import, dispatch_message is patched
+with mock.patch.dict(sys.modules, {"routes.queue": mock.MagicMock()}):
+  from utils import pull_worker
+  from utils.pull_worker import PullWorker
+
+
+def get_message(name="doc-1"):
+  message = mock.MagicMock()
+  message.data = json.dumps(name).encode("utf-8")
+  message.message_id = "m-1"
+  return message
+
+
+def test_handle_message_acks_on_success():
+  message = get_message()
+  with mock.patch.object(pull_worker, "dispatch_message",
+                         return_value=mock.Mock(status_code=200)) as dispatch:
+    PullWorker().handle_message(message)
+  assert dispatch.call_args[0][0] == "doc-1"
+  message.ack.assert_called_once()
+  message.nack.assert_not_called()
+
+
+def test_handle_message_nacks_on_error_status():
+  message = get_message()
+  with mock.patch.object(pull_worker, "dispatch_message",
+                         return_value=mock.Mock(status_code=500)):
+    PullWorker().handle_message(message)
+  message.nack.assert_called_once()
+  message.ack.assert_not_called()
+
+
+def test_handle_message_nacks_on_exception():
+  message = get_message()
+  with mock.patch.object(pull_worker, "dispatch_message",
+                         side_effect=RuntimeError("process_task down")):
+    PullWorker().handle_message(message)
+  message.nack.assert_called_once()
+  message.ack.assert_not_called()
+
+
+def test_restart_after_stream_error():
+  first, second = Future(), mock.MagicMock()
+  second.result.side_effect = RuntimeError("stream closed on shutdown")
+  subscriber = mock.MagicMock()
+  subscriber.subscribe.side_effect = [first, second]
+  with mock.patch.object(pull_worker.pubsub_v1, "SubscriberClient",
+                         return_value=subscriber), \
+      mock.patch.object(pull_worker, "ThreadScheduler"), \
+      mock.patch.object(pull_worker, "PULL_RESTART_BACKOFF_MIN", 0):
+    worker = PullWorker()
+    worker.start()
+    first.set_exception(RuntimeError("stream closed"))
+    deadline = time.time() + 5
+    while worker.streaming_pull_future is not second \
+        and time.time() < deadline:
+      time.sleep(0.01)
+    assert worker.streaming_pull_future is second
+    assert subscriber.subscribe.call_count == 2
+    assert worker.restart_attempts == 1
+
+    # stop does not raise the stream's error
+    worker.stop()
+  second.cancel.assert_called_once()
+  assert worker.streaming_pull_future is None
+  assert subscriber.subscribe.call_count == 2
@@ -18,6 +18,7 @@ import uvicorn
 import asyncio
 import time
 import config
+from common.utils import metrics
 from common.utils.logging_handler import Logger
 from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, Request, status
@@ -32,6 +33,11 @@ def health_check():
   return True
 
 
+@app.get("/metrics")
+def get_metrics():
+  return metrics.metrics_response()
+
+
 @app.post("/")
 def health_check_post():
   return True
@@ -21,7 +21,9 @@ from common.config import STATUS_SUCCESS
 from common.models import Document
 from common.utils.copy_gcs_documents import copy_blob
 from common.utils.helper import split_uri_2_path_filename
+from common.utils import metrics
 from common.utils.iap import send_iap_request
+from common.utils import priority_scheduler
 from common.utils.publisher import publish_document
 
 logger = Logger.get_logger(__name__)
@@ -55,6 +57,8 @@ router = APIRouter(prefix="/start-pipeline", tags=["Start Pipeline"])
 @router.post("/run")
 async def start_pipeline(request: Request, response: Response):
   start_time = time.time()
+  # Bucket drops are backlogs, they yield to interactive and upload work
+  priority_scheduler.set_priority(priority_scheduler.PRIORITY_BULK)
 
   body = await request.body()
   if not body or body == "":
@@ -142,15 +146,31 @@ async def start_pipeline(request: Request, response: Response):
               f"start_pipeline - Handling {count}(th) document - case_id={case_id}, file_path={blob.name}, "
               f"file_name={blob_filename}, event_id={event_id}")
 
-          # create a record in database for uploaded document
-          output = create_document(case_id, blob.name, context)
-          uid = output
+          # create a record in database for uploaded document, the object
+          # generation makes redelivered events map to the same document
+          trace_id = metrics.new_trace_id()
+          idempotency_key = f"{bucket_name}/{blob.name}#{blob.generation}"
+          output = create_document(case_id, blob.name, context,
+                                   trace_id=trace_id,
+                                   idempotency_key=idempotency_key)
+          uid = output.get("uid") if output else None
           if uid is None:
             logger.error(f"Error: could not create a document")
             raise HTTPException(
                 status_code=500,
                 detail="Error "
                        "in uploading document in gcs bucket")
+          if not output.get("created", True):
+            # Keep the case_id of the first delivery for the whole folder
+            case_id = output.get("case_id") or case_id
+            case_ids[dir_name] = case_id
+            existing_document = Document.find_by_uid(uid)
+            if existing_document is not None and \
+                is_past_upload(existing_document):
+              logger.info(f"Skipping {blob.name}, already processed as "
+                          f"uid={uid} for case_id={case_id}")
+              uid_list.append(uid)
+              continue
 
           logger.info(f"Created document with uid={uid} for case_id={case_id}, "
                       f"file_path={blob.name}, file_name={blob_filename}, "
@@ -159,7 +179,11 @@ async def start_pipeline(request: Request, response: Response):
 
           # Copy document in GCS bucket
           new_file_name = f"{case_id}/{uid}/{blob_filename}"
+          upload_start_time = time.time()
           result = await run_in_threadpool(copy_blob, bucket_name, blob.name, new_file_name, BUCKET_NAME)
+          metrics.observe(metrics.STAGE_UPLOAD, time.time() - upload_start_time,
+                          trace_id, uid)
+          metrics.count(metrics.STAGE_UPLOAD, num_bytes=blob.size or 0)
           if result != STATUS_SUCCESS:
             # Update the document upload in GCS as failed
             document = Document.find_by_uid(uid)
@@ -197,7 +221,9 @@ async def start_pipeline(request: Request, response: Response):
                 "case_id": case_id,
                 "uid": uid,
                 "gcs_url": document.url,
-                "context": context
+                "context": context,
+                "trace_id": trace_id,
+                "priority": priority_scheduler.PRIORITY_BULK
             })
           else:
             logger.error(f"Could not retrieve document by id {uid}")
@@ -207,7 +233,10 @@ async def start_pipeline(request: Request, response: Response):
       # Pushing Message To Pubsub
       pubsub_msg = f"batch moved to bucket"
       message_dict = {"message": pubsub_msg, "message_list": message_list}
-      publish_document(message_dict)
+      with metrics.timed(metrics.STAGE_PUBLISH):
+        # chunks are published concurrently, wait before responding
+        for future in publish_document(message_dict):
+          future.result()
 
       process_time = time.time() - start_time
       time_elapsed = round(process_time * 1000)
@@ -242,19 +271,30 @@ async def start_pipeline(request: Request, response: Response):
                                 "in uploading document") from e
 
 
-def create_document(case_id, filename, context, user=None):
-  uid = None
+def is_past_upload(document):
+  """Whether the pipeline already moved the document beyond the upload"""
+  return any(status.get("stage") not in ("upload", "uploaded")
+             for status in document.system_status or [])
+
+
+def create_document(case_id, filename, context, user=None, trace_id=None,
+                    idempotency_key=None):
+  """Creates the document record, returns the response with uid, case_id
+  and created or None on error"""
+  output = None
   try:
     logger.info(f"create_document with case_id = {case_id} filename = {filename} context = {context}")
     base_url = f"{DOCUMENT_STATUS_URL}"
     req_url = f"{base_url}/create_document"
     url = f"{req_url}?case_id={case_id}&filename={filename}&context={context}&user={user}"
     logger.info(f"Posting request to {url}")
-    response = send_iap_request(url, method="POST")
-    response = response.json()
-    logger.info(f"Response received ={response}")
-    uid = response.get("uid")
+    response = send_iap_request(url, method="POST",
+                                headers=metrics.trace_headers(trace_id),
+                                params={"idempotency_key": idempotency_key}
+                                if idempotency_key else None)
+    output = response.json()
+    logger.info(f"Response received ={output}")
   except requests.exceptions.RequestException as err:
     logger.error(err)
 
-  return uid
+  return output
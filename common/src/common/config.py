@@ -70,6 +70,126 @@ DOCUMENT_STATUS_API_PATH = "document_status_service/v1"
 EXTRACTION_API_PATH = "extraction_service/v1"
 VALIDATION_API_PATH = "validation_service/v1"
 MATCHING_API_PATH = "matching_service/v1"
+# Number of files of one request uploaded to GCS at the same time
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "8"))
+# Files above this size use resumable uploads, must be a multiple of 256 KB
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+
+# Documents sent per Pub/Sub message, larger message lists are split up
+PUBLISH_CHUNK_SIZE = int(os.getenv("PUBLISH_CHUNK_SIZE", "20"))
+# Messages above this size are stored in GCS and only a pointer is published
+PUBLISH_MAX_MESSAGE_BYTES = int(
+    os.getenv("PUBLISH_MAX_MESSAGE_BYTES", str(1024 * 1024)))
+PUBLISH_BATCH_MAX_MESSAGES = int(os.getenv("PUBLISH_BATCH_MAX_MESSAGES", "100"))
+# Must stay above PUBLISH_MAX_MESSAGE_BYTES, single messages are never split
+PUBLISH_BATCH_MAX_BYTES = int(
+    os.getenv("PUBLISH_BATCH_MAX_BYTES", str(4 * 1024 * 1024)))
+PUBLISH_BATCH_MAX_LATENCY = float(
+    os.getenv("PUBLISH_BATCH_MAX_LATENCY", "0.05"))
+# Publishes with case_id as ordering key
+PUBLISH_ORDERING_ENABLED = os.getenv("PUBLISH_ORDERING_ENABLED",
+                                     "true").lower() == "true"
+PUBSUB_PAYLOAD_BUCKET = os.getenv("PUBSUB_PAYLOAD_BUCKET", BUCKET_NAME)
+PUBSUB_PAYLOAD_PREFIX = "pubsub_payloads"
+
+# ========= Pipeline orchestrator ================
+# Hands work between stages through per-stage Pub/Sub topics instead of
+# direct HTTP calls
+PIPELINE_ORCHESTRATOR_ENABLED = os.getenv("PIPELINE_ORCHESTRATOR_ENABLED",
+                                          "false").lower() == "true"
+PIPELINE_TOPIC_PREFIX = os.getenv("PIPELINE_TOPIC_PREFIX", "pipeline")
+# Failed stage tasks are retried up to this many times, then dead-lettered
+PIPELINE_MAX_ATTEMPTS = int(os.getenv("PIPELINE_MAX_ATTEMPTS", "5"))
+# Comma separated stages the workers of this deployment run, empty for all
+# stages registered by the service
+PIPELINE_WORKER_STAGES = [
+    stage.strip() for stage in os.getenv("PIPELINE_WORKER_STAGES",
+                                         "").split(",") if stage.strip()]
+PIPELINE_STAGE_CONCURRENCY = {
+    "classification": int(os.getenv("PIPELINE_CLASSIFICATION_CONCURRENCY",
+                                    "2")),
+    "extraction": int(os.getenv("PIPELINE_EXTRACTION_CONCURRENCY", "4")),
+    "validation": int(os.getenv("PIPELINE_VALIDATION_CONCURRENCY", "8")),
+}
+# Queued or failed tasks untouched for this long are published again
+PIPELINE_STALE_TASK_SECONDS = int(
+    os.getenv("PIPELINE_STALE_TASK_SECONDS", "900"))
+PIPELINE_SWEEP_INTERVAL_SECONDS = int(
+    os.getenv("PIPELINE_SWEEP_INTERVAL_SECONDS", "300"))
+
+# ========= Priority lanes =======================
+# Work items of each kind running at the same time per replica
+PRIORITY_CAPACITY = {
+    "docai": int(os.getenv("PRIORITY_DOCAI_CAPACITY", "8")),
+    "postprocess": int(os.getenv("PRIORITY_POSTPROCESS_CAPACITY", "4")),
+    "status": int(os.getenv("PRIORITY_STATUS_CAPACITY", "32")),
+    # DocAI batch operations running at the same time
+    "docai_lro": int(os.getenv("DOCAI_MAX_CONCURRENT_LROS", "5")),
+}
+# Share of the capacity only interactive (HITL) work may use
+PRIORITY_INTERACTIVE_RESERVED_RATIO = float(
+    os.getenv("PRIORITY_INTERACTIVE_RESERVED_RATIO", "0.25"))
+
+# ========= DocAI quota ==========================
+# Request rates per processor, lowered automatically on quota errors
+DOCAI_BATCH_REQUESTS_PER_MINUTE = float(
+    os.getenv("DOCAI_BATCH_REQUESTS_PER_MINUTE", "30"))
+DOCAI_ONLINE_REQUESTS_PER_MINUTE = float(
+    os.getenv("DOCAI_ONLINE_REQUESTS_PER_MINUTE", "120"))
+# How long batch submissions wait for quota before giving up
+DOCAI_SUBMIT_TIMEOUT_SECONDS = int(
+    os.getenv("DOCAI_SUBMIT_TIMEOUT_SECONDS", "3600"))
+DOCAI_BACKOFF_MAX_SECONDS = int(os.getenv("DOCAI_BACKOFF_MAX_SECONDS", "60"))
+
+# ========= DocAI document limits ================
+# PDFs over the processor limits are split into page range chunks, which
+# are processed in parallel and stitched back into a single Document.
+# 0 disables chunking.
+DOCAI_MAX_PAGES_PER_DOCUMENT = int(
+    os.getenv("DOCAI_MAX_PAGES_PER_DOCUMENT", "200"))
+DOCAI_MAX_BYTES_PER_DOCUMENT = int(
+    os.getenv("DOCAI_MAX_BYTES_PER_DOCUMENT", str(1024 * 1024 * 1024)))
+# Upper bound of pages per chunk, smaller chunks run with more parallelism
+DOCAI_CHUNK_PAGES = int(os.getenv("DOCAI_CHUNK_PAGES", "100"))
+
+# ========= DocAI field masks ===================
+# Field masks applied to DocAI output, so LRO results only carry the
+# fields read downstream (no page images, tokens, layout or styles).
+# DOCAI_ATTRIBUTES_TO_IGNORE is still stripped from what is returned.
+DOCAI_FIELD_MASK_ENABLED = (os.getenv(
+    "DOCAI_FIELD_MASK_ENABLED", "true").lower() == "true")
+
+FIELD_MASK_CLASSIFIER = "classifier"
+FIELD_MASK_CDE = "cde"
+FIELD_MASK_FORM_PARSER = "form_parser"
+FIELD_MASK_WAREHOUSE = "warehouse"
+
+DOCAI_FIELD_MASK_PROFILES = {
+    # document class and page range of each entity
+    FIELD_MASK_CLASSIFIER: [
+        "entities", "pages.pageNumber", "shardInfo"
+    ],
+    # entities with their page anchors, page size for the bounding boxes
+    FIELD_MASK_CDE: [
+        "text", "entities", "pages.pageNumber", "pages.dimension", "shardInfo"
+    ],
+    # key/value pairs resolved against the full text
+    FIELD_MASK_FORM_PARSER: [
+        "text", "pages.pageNumber", "pages.dimension", "pages.formFields",
+        "shardInfo"
+    ],
+    # text and entities stored with the document in Document AI Warehouse
+    FIELD_MASK_WAREHOUSE: [
+        "text", "entities", "pages.pageNumber", "pages.dimension", "shardInfo"
+    ],
+}
+
+# Processor type (processor.type_) to field mask profile
+DOCAI_FIELD_MASK_BY_PROCESSOR_TYPE = {
+    "CUSTOM_CLASSIFICATION_PROCESSOR": FIELD_MASK_CLASSIFIER,
+    "CUSTOM_EXTRACTION_PROCESSOR": FIELD_MASK_CDE,
+    "FORM_PARSER_PROCESSOR": FIELD_MASK_FORM_PARSER,
+}
 
 # ========= Validation ===========================
 BUCKET_NAME_VALIDATION = PROJECT_ID
@@ -77,6 +197,11 @@ PATH = f"gs://{PROJECT_ID}/Validation/rules.json"
 PATH_TEMPLATE = f"gs://{PROJECT_ID}/Validation/templates.json"
 BIGQUERY_DB = "validation.validation_table"
 VALIDATION_TABLE = f"{PROJECT_ID}.validation.validation_table"
+# Entities sink for BigQuery: "json" (entities JSON column of validation_table),
+# "typed" (repeated entity_values STRUCT of validation_table_typed) or "both"
+BQ_ENTITIES_SINK = os.environ.get("BQ_ENTITIES_SINK", "json").lower()
+BIGQUERY_TYPED_DB = "validation.validation_table_typed"
+VALIDATION_TABLE_TYPED = f"{PROJECT_ID}.{BIGQUERY_TYPED_DB}"
 
 CLASSIFIER = "classifier"
 CONFIG_BUCKET = os.environ.get("CONFIG_BUCKET")
@@ -273,6 +398,48 @@ def get_classification_default_class():
   return CLASSIFICATION_UNDETECTABLE
 
 
+# Documents up to these limits are sent to the synchronous DocAI
+# process_document endpoint instead of the batch LRO. Set
+# online_processing_max_pages to 0 to always use batch processing.
+def get_online_processing_max_pages():
+  settings = get_docai_settings()
+  return int(settings.get("online_processing_max_pages", 10))
+
+
+def get_online_processing_max_bytes():
+  settings = get_docai_settings()
+  return int(settings.get("online_processing_max_bytes", 10 * 1024 * 1024))
+
+
+def get_online_processing_max_workers():
+  settings = get_docai_settings()
+  return int(settings.get("online_processing_max_workers", 4))
+
+
+# Re-use DocAI output for documents with identical content
+def get_docai_result_cache_enabled():
+  settings = get_docai_settings()
+  return bool(settings.get("docai_result_cache", True))
+
+
+# Fields returned by DocAI for a profile or a processor type
+def get_field_mask(profile=None, processor_type=None):
+  """
+  Returns the DocAI field mask (comma separated field paths) for a profile
+  or, when no profile is given, for the processor type.
+  Returns None for unknown processor types or when masks are disabled,
+  in which case DocAI returns the full Document.
+  """
+  if not DOCAI_FIELD_MASK_ENABLED:
+    return None
+  if profile is None:
+    profile = DOCAI_FIELD_MASK_BY_PROCESSOR_TYPE.get(processor_type)
+  paths = DOCAI_FIELD_MASK_PROFILES.get(profile)
+  if not paths:
+    return None
+  return ",".join(paths)
+
+
 def get_document_type(doc_name):
   doc = get_document_types_config().get(doc_name)
   if doc:
@@ -331,6 +498,29 @@ ENTITY_KEYS = [
     "email",
     "phone_no",
 ]
+# Keep an in-memory search index of active documents in the HITL service
+SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED",
+                                 "true").lower() == "true"
+# fetch_file: total size of the in-memory cache of recently viewed documents,
+# largest document kept in the cache and size of the chunks streamed from GCS
+FETCH_FILE_CACHE_BYTES = int(os.getenv("FETCH_FILE_CACHE_BYTES",
+                                       str(256 * 1024 * 1024)))
+FETCH_FILE_CACHE_MAX_ITEM_BYTES = int(os.getenv(
+    "FETCH_FILE_CACHE_MAX_ITEM_BYTES", str(32 * 1024 * 1024)))
+FETCH_FILE_CHUNK_SIZE = int(os.getenv("FETCH_FILE_CHUNK_SIZE",
+                                      str(1024 * 1024)))
+
+# ========= Neo4j claim graph =======================
+NEO4J_URI = os.getenv("NEO4J_URI", "neo4j://localhost:7687")
+NEO4J_MAX_CONNECTION_POOL_SIZE = int(
+    os.getenv("NEO4J_MAX_CONNECTION_POOL_SIZE", "50"))
+# Number of claims written per transaction
+NEO4J_BATCH_SIZE = int(os.getenv("NEO4J_BATCH_SIZE", "500"))
+# Link written claims right away, otherwise they are linked by
+# neo4j_claim_linking.link_pending_claims
+NEO4J_LINK_ON_WRITE = os.getenv("NEO4J_LINK_ON_WRITE", "true").lower() == "true"
+# Renames keys of the claim document_details before writing to the graph
+DOCUMENT_DICT = {}
 
 # Misc
 
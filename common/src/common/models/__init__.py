@@ -5,3 +5,6 @@ Flatten import namespace for models
 from .base_model import *
 from .claim import *
 from .document import *
+from .docai_operation import *
+from .docai_result import *
+from .pipeline_task import *
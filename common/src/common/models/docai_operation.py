@@ -0,0 +1,72 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+DocAI long running operation object in the ORM
+"""
+import os
+from common.config import STATUS_IN_PROGRESS
+from common.models import BaseModel
+from fireo.fields import IDField, TextField, ListField, DateTime
+
+DATABASE_PREFIX = os.getenv("DATABASE_PREFIX", "")
+
+
+class DocaiOperation(BaseModel):
+  """DocAI batch operation ORM class, id is the operation id"""
+  id = IDField()
+  operation_name = TextField()
+  stage = TextField()
+  processor_name = TextField()
+  processor_type = TextField()
+  processor_version = TextField()
+  # DocAI field mask of the request, results are cached under it
+  field_mask = TextField()
+  input_uris = ListField()
+  uids = ListField()
+  status = TextField()
+  owner = TextField()
+  # priority lane of the submitting request
+  priority = TextField()
+  lease_expiry = DateTime()
+  created_timestamp = DateTime(auto=True)
+  updated_timestamp = DateTime()
+  error_detail = TextField()
+
+  class Meta:
+    ignore_none_field = False
+    collection_name = DATABASE_PREFIX + "docai_operation"
+
+  @classmethod
+  def find_by_operation_name(cls, operation_name):
+    """Find the operation record using the full operation name
+    Args:
+        operation_name (string): projects/*/locations/*/operations/*
+    Returns:
+        DocaiOperation: DocaiOperation Object
+    """
+    return DocaiOperation.find_by_id(operation_name.split("/")[-1])
+
+  @classmethod
+  def find_in_progress(cls, stage):
+    """Find all operations of the stage that are not finalized yet
+    Args:
+        stage (string): pipeline stage which submitted the operation
+    Returns:
+        List[DocaiOperation]: DocaiOperation Objects
+    """
+    return list(DocaiOperation.collection.filter("stage", "==", stage).filter(
+        "status", "==", STATUS_IN_PROGRESS).fetch())
@@ -0,0 +1,41 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Cached DocAI processing result object in the ORM
+"""
+import os
+from common.models import BaseModel
+from fireo.fields import IDField, TextField, ListField, DateTime
+
+DATABASE_PREFIX = os.getenv("DATABASE_PREFIX", "")
+
+
+class DocaiResult(BaseModel):
+  """DocAI result cache ORM class, id is derived from
+  (content_hash, processor_name, processor_version, field_mask)"""
+  id = IDField()
+  content_hash = TextField()
+  processor_name = TextField()
+  processor_version = TextField()
+  # DocAI field mask of the request, None for full Documents
+  field_mask = TextField()
+  output_uris = ListField()
+  created_timestamp = DateTime(auto=True)
+
+  class Meta:
+    ignore_none_field = False
+    collection_name = DATABASE_PREFIX + "docai_result"
@@ -18,8 +18,11 @@ limitations under the License.
 Document Status object in the ORM
 """
 import os
+import uuid
+import hashlib
 from common.models import BaseModel
-from fireo.fields import TextField, ListField, NumberField, BooleanField, DateTime
+from fireo.fields import IDField, TextField, ListField, NumberField, \
+  BooleanField, DateTime
 
 DATABASE_PREFIX = os.getenv("DATABASE_PREFIX", "")
 PROJECT_ID = os.environ.get("PROJECT_ID", "")
@@ -27,6 +30,7 @@ PROJECT_ID = os.environ.get("PROJECT_ID", "")
 
 class Document(BaseModel):
   """Documentstatus ORM class  """
+  id = IDField()
   case_id = TextField()
   uid = TextField()
   url = TextField()
@@ -50,6 +54,7 @@ class Document(BaseModel):
   external_case_id = TextField()
   extraction_status = TextField()
   error_detail = TextField()
+  trace_id = TextField()
 
   class Meta:
     ignore_none_field = False
@@ -64,3 +69,17 @@ class Document(BaseModel):
         Document: Document Object
     """
     return Document.collection.filter("uid", "==", uid).get()
+
+  @classmethod
+  def generate_id(cls, idempotency_key=None):
+    """Generates the document id on the client, so a new document is
+    written once with its uid. With an idempotency_key the id is
+    deterministic and retries map to the same document.
+    Args:
+        idempotency_key (string): e.g. bucket, object name and generation
+    Returns:
+        string: document id
+    """
+    if idempotency_key:
+      return hashlib.sha256(idempotency_key.encode("utf-8")).hexdigest()[:32]
+    return uuid.uuid4().hex
@@ -0,0 +1,62 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Pipeline stage task object in the ORM
+"""
+import os
+from common.models import BaseModel
+from fireo.fields import IDField, TextField, MapField, NumberField, DateTime
+
+DATABASE_PREFIX = os.getenv("DATABASE_PREFIX", "")
+
+TASK_QUEUED = "queued"
+TASK_RUNNING = "running"
+TASK_SUCCESS = "success"
+TASK_FAILED = "failed"
+TASK_DEAD_LETTER = "dead_letter"
+
+
+class PipelineTask(BaseModel):
+  """Work item of one pipeline stage, id is the task id"""
+  id = IDField()
+  stage = TextField()
+  status = TextField()
+  payload = MapField()
+  attempts = NumberField()
+  owner = TextField()
+  lease_expiry = DateTime()
+  trace_id = TextField()
+  priority = TextField()
+  created_timestamp = DateTime(auto=True)
+  updated_timestamp = DateTime()
+  error_detail = TextField()
+
+  class Meta:
+    ignore_none_field = False
+    collection_name = DATABASE_PREFIX + "pipeline_task"
+
+  @classmethod
+  def find_by_stage_status(cls, stage, status):
+    """Find all tasks of the stage with the given status
+    Args:
+        stage (string): pipeline stage of the task
+        status (string): one of the TASK_* statuses
+    Returns:
+        List[PipelineTask]: PipelineTask Objects
+    """
+    return list(PipelineTask.collection.filter("stage", "==", stage).filter(
+        "status", "==", status).fetch())
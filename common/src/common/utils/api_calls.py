@@ -25,6 +25,8 @@ from typing import List
 import requests
 
 import common.config
+from common.utils import metrics
+from common.utils import pipeline_orchestrator
 from common.utils.logging_handler import Logger
 logger = Logger.get_logger(__name__)
 
@@ -35,6 +37,11 @@ def extract_documents(docs: List[Dict], parser_name: str):
   logger.info(f"extract_documents with {len(docs)} docs={docs}, "
               f"parser_name={parser_name}")
 
+  if common.config.PIPELINE_ORCHESTRATOR_ENABLED:
+    pipeline_orchestrator.enqueue(pipeline_orchestrator.STAGE_EXTRACTION,
+                                  {"uids": docs, "parser_name": parser_name})
+    return
+
   extr_result = send_extraction_request(docs, parser_name)
 
   if extr_result and extr_result.status_code == 200:
@@ -57,7 +64,8 @@ def send_extraction_request(uids: List[Dict], parser_name: str):
     payload = {"configs": configs, "parser_name": parser_name}
     logger.info(
         f"send_extraction_request sending to base_url={base_url}, payload={payload}")
-    response = requests.post(base_url, json=payload)
+    response = requests.post(base_url, json=payload,
+                             headers=metrics.trace_headers())
     logger.info(f"send_extraction_request response {response} for {payload}")
     return response
   except requests.exceptions.RequestException as err:
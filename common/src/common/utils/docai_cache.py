@@ -0,0 +1,186 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+DocAI result cache keyed by (content hash, processor, processor version,
+field mask).
+
+Re-dropped, reassigned or re-run documents with identical bytes re-use the
+stored DocAI output (JSON in GCS) instead of being sent to DocAI again.
+The content hash is the MD5 (or CRC32C for composite objects) that GCS
+already keeps in the object metadata, so no download is needed to compute it.
+"""
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+import proto
+from google.cloud import documentai_v1 as documentai
+
+from common.config import get_docai_result_cache_enabled
+from common.docai_config import DOCAI_OUTPUT_BUCKET_NAME
+from common.models import DocaiResult
+from common.utils.docai_helper import get_storage_client
+from common.utils.helper import split_uri_2_bucket_prefix
+from common.utils.logging_handler import Logger
+
+logger = Logger.get_logger(__name__)
+
+CACHE_PREFIX = "docai_cache"
+
+
+def get_processor_version(processor: documentai.types.processor.Processor):
+  return processor.default_processor_version or processor.name
+
+
+def get_content_hash(uri: str) -> Optional[str]:
+  bucket_name, blob_name = split_uri_2_bucket_prefix(uri)
+  blob = get_storage_client().bucket(bucket_name).get_blob(blob_name)
+  if blob is None:
+    return None
+  if blob.md5_hash:
+    return f"md5:{blob.md5_hash}"
+  if blob.crc32c:
+    return f"crc32c:{blob.crc32c}:{blob.size}"
+  return None
+
+
+def get_cache_key(content_hash: str, processor_name: str,
+    processor_version: str, field_mask: Optional[str] = None) -> str:
+  """
+  Documents returned with a field mask only hold the masked fields, so the
+  mask is part of the key. Full Documents (no mask) keep the key without it.
+  """
+  key = f"{content_hash}|{processor_name}|{processor_version}"
+  if field_mask:
+    key += f"|{field_mask}"
+  return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def load_documents(output_uris: List[str]) -> List[documentai.Document]:
+  client = get_storage_client()
+  documents = []
+  for output_uri in output_uris:
+    bucket_name, blob_name = split_uri_2_bucket_prefix(output_uri)
+    content = client.bucket(bucket_name).blob(blob_name).download_as_bytes()
+    documents.append(documentai.Document.from_json(
+        content, ignore_unknown_fields=True))
+  return documents
+
+
+def lookup(processor: documentai.types.processor.Processor,
+    input_uris: List[str], field_mask: Optional[str] = None) -> Tuple[
+  Dict[str, List[documentai.Document]], List[str]]:
+  """
+  Returns cached Documents keyed by input uri (same shape as
+  docai_helper.load_batch_process_documents) and the uris that still need
+  to be sent to DocAI. field_mask is the mask of the request the cached
+  Documents replace.
+  """
+  if not get_docai_result_cache_enabled():
+    return {}, list(input_uris)
+
+  processor_version = get_processor_version(processor)
+  hits = {}
+  misses = []
+  for uri in input_uris:
+    try:
+      content_hash = get_content_hash(uri)
+      if not content_hash:
+        misses.append(uri)
+        continue
+      result = DocaiResult.find_by_id(
+          get_cache_key(content_hash, processor.name, processor_version,
+                        field_mask))
+      if not result or not result.output_uris:
+        misses.append(uri)
+        continue
+      hits[uri] = load_documents(result.output_uris)
+    except Exception as e:
+      # Output could have been cleaned up from the bucket
+      logger.warning(f"lookup - Cache miss for {uri}: {e}")
+      misses.append(uri)
+
+  logger.info(f"lookup - processor={processor.name}, hits={len(hits)}, "
+              f"misses={len(misses)}")
+  return hits, misses
+
+
+def save_result(content_hash: str, processor_name: str,
+    processor_version: str, output_uris: List[str],
+    field_mask: Optional[str] = None):
+  if not content_hash or not output_uris:
+    return
+  result = DocaiResult()
+  result.id = get_cache_key(content_hash, processor_name, processor_version,
+                            field_mask)
+  result.content_hash = content_hash
+  result.processor_name = processor_name
+  result.processor_version = processor_version
+  result.field_mask = field_mask
+  result.output_uris = output_uris
+  result.save()
+
+
+def store_batch_results(processor_name: str, processor_version: str,
+    metadata: documentai.BatchProcessMetadata,
+    field_mask: Optional[str] = None):
+  """Records output JSON locations of a finished batch operation"""
+  if not get_docai_result_cache_enabled():
+    return
+  client = get_storage_client()
+  for process in metadata.individual_process_statuses:
+    try:
+      if not process.output_gcs_destination:
+        continue
+      output_bucket, output_prefix = split_uri_2_bucket_prefix(
+          process.output_gcs_destination)
+      output_uris = [f"gs://{output_bucket}/{blob.name}" for blob in
+                     client.list_blobs(output_bucket,
+                                       prefix=output_prefix.rstrip("/") + "/")
+                     if ".json" in blob.name]
+      save_result(get_content_hash(process.input_gcs_source), processor_name,
+                  processor_version, output_uris, field_mask)
+    except Exception as e:
+      logger.warning(f"store_batch_results - Could not cache result for "
+                     f"{process.input_gcs_source}: {e}")
+
+
+def store_documents(processor: documentai.types.processor.Processor,
+    documents: Dict[str, List[documentai.Document]],
+    field_mask: Optional[str] = None):
+  """Saves online processing output as JSON in GCS and records it"""
+  if not get_docai_result_cache_enabled():
+    return
+  processor_version = get_processor_version(processor)
+  bucket = get_storage_client().bucket(DOCAI_OUTPUT_BUCKET_NAME)
+  for uri in documents:
+    try:
+      content_hash = get_content_hash(uri)
+      if not content_hash:
+        continue
+      key = get_cache_key(content_hash, processor.name, processor_version,
+                          field_mask)
+      output_uris = []
+      for index, document in enumerate(documents[uri]):
+        blob = bucket.blob(f"{CACHE_PREFIX}/{key}/{index}.json")
+        blob.upload_from_string(proto.Message.to_json(document),
+                                content_type="application/json")
+        output_uris.append(f"gs://{DOCAI_OUTPUT_BUCKET_NAME}/{blob.name}")
+      save_result(content_hash, processor.name, processor_version,
+                  output_uris, field_mask)
+    except Exception as e:
+      logger.warning(f"store_documents - Could not cache result for {uri}: "
+                     f"{e}")
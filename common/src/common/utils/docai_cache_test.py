@@ -0,0 +1,77 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+  Tests for the DocAI result cache
+"""
+import os
+from unittest import mock
+from . import docai_cache
+
+# disabling pylint rules that conflict with pytest fixtures
+# pylint: disable=unused-argument,redefined-outer-name,unused-import
+
+os.environ["FIRESTORE_EMULATOR_HOST"] = "localhost:8080"
+os.environ["GOOGLE_CLOUD_PROJECT"] = "fake-project"
+
+CLASSIFIER_MASK = "entities,pages.pageNumber"
+FORM_PARSER_MASK = "text,pages.pageNumber,pages.formFields"
+
+
+def test_get_cache_key_includes_field_mask():
+  key = docai_cache.get_cache_key("md5:abc", "processor", "v1")
+  assert key == docai_cache.get_cache_key("md5:abc", "processor", "v1", None)
+  assert key != docai_cache.get_cache_key("md5:abc", "processor", "v1",
+                                          CLASSIFIER_MASK)
+  assert docai_cache.get_cache_key("md5:abc", "processor", "v1",
+                                   CLASSIFIER_MASK) != \
+         docai_cache.get_cache_key("md5:abc", "processor", "v1",
+                                   FORM_PARSER_MASK)
+
+
+class FakeDocaiResult:
+  """In memory DocaiResult collection"""
+  results = {}
+
+  def save(self):
+    FakeDocaiResult.results[self.id] = self
+
+  @classmethod
+  def find_by_id(cls, result_id):
+    return cls.results.get(result_id)
+
+
+def test_lookup_misses_for_other_field_mask():
+  processor = mock.Mock(default_processor_version="v1")
+  processor.name = "processor"
+  uri = "gs://in/a.pdf"
+  with mock.patch.object(docai_cache, "get_docai_result_cache_enabled",
+                         return_value=True), \
+      mock.patch.object(docai_cache, "get_content_hash",
+                        return_value="md5:abc"), \
+      mock.patch.object(docai_cache, "DocaiResult", FakeDocaiResult), \
+      mock.patch.object(docai_cache, "load_documents",
+                        return_value=["document"]):
+    docai_cache.save_result("md5:abc", "processor", "v1",
+                            ["gs://out/0.json"], CLASSIFIER_MASK)
+    assert docai_cache.lookup(processor, [uri], CLASSIFIER_MASK) == \
+           ({uri: ["document"]}, [])
+    # Same content, other mask or full Document
+    assert docai_cache.lookup(processor, [uri], FORM_PARSER_MASK) == \
+           ({}, [uri])
+    assert docai_cache.lookup(processor, [uri]) == ({}, [uri])
+  result, = FakeDocaiResult.results.values()
+  assert result.field_mask == CLASSIFIER_MASK
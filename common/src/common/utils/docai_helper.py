@@ -14,15 +14,38 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 
+import io
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
 from google.cloud import documentai_v1 as documentai
+from google.cloud import storage
+from pikepdf import Pdf
 
 import common.config
+from common.config import PDF_MIME_TYPE
+from common.docai_config import DOCAI_OUTPUT_BUCKET_NAME
 from common.models import Document
 from common.utils.helper import get_processor_location
+from common.utils import docai_submitter
+from common.utils import metrics
+from common.utils import pdf_chunker
+from common.utils import priority_scheduler
+from common.utils.helper import split_uri_2_bucket_prefix
 from common.utils.logging_handler import Logger
 
 logger = Logger.get_logger(__name__)
 
+storage_client = None
+
+
+def get_storage_client():
+  global storage_client
+  if not storage_client:
+    storage_client = storage.Client()
+  return storage_client
+
 
 def get_docai_input(processor_name: str, configs):
   logger.info(f"get_docai_input - processor_name={processor_name}, "
@@ -60,3 +83,158 @@ def get_docai_input(processor_name: str, configs):
   logger.info(f"get_docai_input - processor={processor.name}, {processor.type_}"
               f"dai_client = {dai_client}, input_uris = {input_uris}")
   return processor, dai_client, input_uris
+
+
+def get_pdf_page_count(content: bytes) -> int:
+  with Pdf.open(io.BytesIO(content)) as pdf:
+    return len(pdf.pages)
+
+
+def split_online_batch(input_uris: List[str]) -> Tuple[Dict[str, bytes],
+                                                       List[str]]:
+  """
+  Pre-flight check of input documents, using the blob size and page count.
+  Splits them into the ones small enough for the synchronous
+  process_document endpoint and the ones that need a batch operation.
+  Documents over the processor limits are split into page range chunks
+  (see pdf_chunker), the chunk uris are batch processed in their place and
+  stitched back together in load_batch_process_documents.
+
+  Returns a dict of uri -> file content for online processing (content is
+  downloaded once here and re-used for the request) and a list of uris for
+  batch processing.
+  """
+  max_pages = common.config.get_online_processing_max_pages()
+  max_bytes = common.config.get_online_processing_max_bytes()
+  online_docs = {}
+  batch_uris = []
+  if max_pages <= 0 and not pdf_chunker.is_chunking_enabled():
+    return online_docs, list(input_uris)
+
+  client = get_storage_client()
+  for uri in input_uris:
+    try:
+      bucket_name, blob_name = split_uri_2_bucket_prefix(uri)
+      blob = client.bucket(bucket_name).get_blob(blob_name)
+      if blob is None or blob.size is None:
+        batch_uris.append(uri)
+        continue
+      if max_pages <= 0 or blob.size > max_bytes:
+        # too large to be held in memory for online processing, only the
+        # page count is read (with ranged reads) to decide on chunking
+        batch_uris.extend(
+            pdf_chunker.split_blob(uri, blob, DOCAI_OUTPUT_BUCKET_NAME))
+        continue
+      content = blob.download_as_bytes()
+      page_count = get_pdf_page_count(content)
+      if page_count > max_pages:
+        batch_uris.extend(pdf_chunker.split_pdf(
+            uri, io.BytesIO(content), blob.size, DOCAI_OUTPUT_BUCKET_NAME))
+        continue
+      online_docs[uri] = content
+    except Exception as e:
+      logger.warning(f"split_online_batch - Using batch processing for {uri}: "
+                     f"{e}")
+      batch_uris.append(uri)
+
+  logger.info(f"split_online_batch - online={len(online_docs)}, "
+              f"batch={len(batch_uris)} document(s)")
+  return online_docs, batch_uris
+
+
+def process_documents_online(processor: documentai.types.processor.Processor,
+    dai_client, online_docs: Dict[str, bytes],
+    field_mask: Optional[str] = None) -> Tuple[
+  Dict[str, List[documentai.Document]], List[str]]:
+  """
+  Sends documents to the synchronous process_document endpoint in parallel.
+
+  Returns processed documents keyed by input uri (same shape as
+  load_batch_process_documents) and the list of uris that failed and
+  should be retried with batch processing.
+  field_mask limits the fields returned (see docai_config.get_field_mask).
+  """
+  documents = {}
+  failed_uris = []
+  if not online_docs:
+    return documents, failed_uris
+
+  # executor threads do not inherit the lane of the caller
+  priority = priority_scheduler.get_priority()
+  docai_scheduler = priority_scheduler.get_scheduler(
+      priority_scheduler.SCHEDULER_DOCAI)
+
+  def process(content: bytes):
+    request = documentai.ProcessRequest(
+        name=processor.name,
+        raw_document=documentai.RawDocument(content=content,
+                                            mime_type=PDF_MIME_TYPE),
+        field_mask=field_mask)
+    with docai_scheduler.slot(priority):
+      return docai_submitter.process_online(dai_client, request).document
+
+  max_workers = min(common.config.get_online_processing_max_workers(),
+                    len(online_docs))
+  with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+    futures = {executor.submit(process, content): uri
+               for uri, content in online_docs.items()}
+    for future in as_completed(futures):
+      uri = futures[future]
+      try:
+        documents[uri] = [future.result()]
+      except Exception as e:
+        logger.warning(f"process_documents_online - Online processing failed "
+                       f"for {uri}, will use batch processing: {e}")
+        failed_uris.append(uri)
+
+  return documents, failed_uris
+
+
+def load_batch_process_documents(metadata: documentai.BatchProcessMetadata) \
+    -> Dict[str, List[documentai.Document]]:
+  """
+  Loads DocAI output Documents of a finished batch operation from GCS.
+  Returns a dict keyed by input uri, each with a list of (sharded) Documents,
+  chunks are stitched and keyed by the uri of the original document.
+  """
+  documents = {}
+  client = get_storage_client()
+  # One process per Input Document
+  for process in metadata.individual_process_statuses:
+    # output_gcs_destination format: gs://BUCKET/PREFIX/OPERATION_NUMBER/INPUT_FILE_NUMBER/
+    # The Cloud Storage API requires the bucket name and URI prefix separately
+    matches = re.match(r"gs://(.*?)/(.*)", process.output_gcs_destination)
+    if not matches:
+      logger.warning(
+          f"load_batch_process_documents - Could not parse output GCS "
+          f"destination:[{process.output_gcs_destination}]")
+      logger.warning(f"load_batch_process_documents - {process.status}")
+      continue
+
+    output_bucket, output_prefix = matches.groups()
+    input_gcs_source = process.input_gcs_source
+    logger.info(
+        f"load_batch_process_documents - Handling DocAI results for "
+        f"{input_gcs_source} using process output "
+        f"{process.output_gcs_destination}")
+    output_blobs = client.list_blobs(output_bucket,
+                                     prefix=output_prefix + "/")
+
+    # Document AI may output multiple JSON files per source file
+    # Sharding happens when the output JSON File gets over a size threshold
+    for blob in output_blobs:
+      # Document AI should only output JSON files to GCS
+      if ".json" not in blob.name:
+        logger.warning(
+            f"load_batch_process_documents - Skipping non-supported file: "
+            f"{blob.name} - Mimetype: {blob.content_type}")
+        continue
+
+      with metrics.timed(metrics.STAGE_SHARD_DOWNLOAD):
+        document = documentai.Document.from_json(
+            blob.download_as_bytes(), ignore_unknown_fields=True)
+      metrics.count(metrics.STAGE_SHARD_DOWNLOAD, num_bytes=blob.size or 0)
+      documents.setdefault(input_gcs_source, []).append(document)
+
+  # Chunks of oversized documents are returned as one Document
+  return pdf_chunker.stitch_chunks(documents)
@@ -0,0 +1,226 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Quota aware submission of DocAI requests.
+
+Requests go through a token bucket per processor (which includes its region)
+and kind of request, batch operations additionally hold one of
+DOCAI_MAX_CONCURRENT_LROS slots until the operation is done. A quota error
+(429 / RESOURCE_EXHAUSTED) halves the rate of the bucket and the request is
+retried with exponential backoff instead of failing the batch; successful
+requests slowly restore the configured rate. Token levels, rejections and
+running operations are exported as Prometheus metrics.
+"""
+import os
+import random
+import threading
+import time
+from typing import Dict, Tuple
+
+from google.api_core.exceptions import TooManyRequests
+from google.cloud import documentai_v1 as documentai
+from prometheus_client import Counter, Gauge
+
+from common.config import DOCAI_BATCH_REQUESTS_PER_MINUTE
+from common.config import DOCAI_ONLINE_REQUESTS_PER_MINUTE
+from common.config import DOCAI_SUBMIT_TIMEOUT_SECONDS
+from common.config import DOCAI_BACKOFF_MAX_SECONDS
+from common.utils import priority_scheduler
+from common.utils.logging_handler import Logger
+
+logger = Logger.get_logger(__name__)
+
+SERVICE_NAME = os.getenv("SERVICE_NAME", "cda")
+KIND_BATCH = "batch"
+KIND_ONLINE = "online"
+# The adaptive rate never drops below this share of the configured rate
+MIN_RATE_RATIO = 0.05
+BACKOFF_INITIAL_SECONDS = 1.0
+
+TOKENS = Gauge("cda_docai_tokens", "Tokens available in the DocAI bucket",
+               ["service", "processor", "kind"])
+RATE = Gauge("cda_docai_rate_per_second", "Current adaptive DocAI rate",
+             ["service", "processor", "kind"])
+REJECTIONS = Counter("cda_docai_quota_rejections",
+                     "DocAI requests rejected with a quota error",
+                     ["service", "processor", "kind"])
+
+
+class TokenBucket:
+  """Token bucket with an adaptive (AIMD) refill rate"""
+
+  def __init__(self, rate: float, burst: float):
+    self.max_rate = rate
+    self.rate = rate
+    self.burst = max(burst, 1.0)
+    self.tokens = self.burst
+    self.updated = time.monotonic()
+    self.lock = threading.Lock()
+
+  def refill(self):
+    now = time.monotonic()
+    self.tokens = min(self.burst,
+                      self.tokens + (now - self.updated) * self.rate)
+    self.updated = now
+
+  def try_acquire(self) -> float:
+    """Takes a token, returns 0 or the seconds until one is available"""
+    with self.lock:
+      self.refill()
+      if self.tokens >= 1:
+        self.tokens -= 1
+        return 0
+      return (1 - self.tokens) / self.rate
+
+  def acquire(self, deadline: float):
+    while True:
+      wait = self.try_acquire()
+      if not wait:
+        return
+      if time.monotonic() + wait > deadline:
+        raise TimeoutError("Timed out waiting for a DocAI token")
+      time.sleep(wait)
+
+  def on_quota_error(self):
+    with self.lock:
+      self.refill()
+      self.rate = max(self.rate / 2, self.max_rate * MIN_RATE_RATIO)
+      self.tokens = 0
+
+  def on_success(self):
+    with self.lock:
+      self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1)
+
+  def level(self) -> float:
+    with self.lock:
+      self.refill()
+      return self.tokens
+
+
+buckets: Dict[Tuple[str, str], TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(processor_name: str, kind: str) -> TokenBucket:
+  """Bucket of a processor, processor names include the region"""
+  key = (processor_name, kind)
+  if key not in buckets:
+    with _buckets_lock:
+      if key not in buckets:
+        per_minute = DOCAI_BATCH_REQUESTS_PER_MINUTE if kind == KIND_BATCH \
+          else DOCAI_ONLINE_REQUESTS_PER_MINUTE
+        rate = per_minute / 60
+        buckets[key] = TokenBucket(rate, burst=max(1.0, rate * 10))
+        TOKENS.labels(SERVICE_NAME, processor_name, kind).set_function(
+            buckets[key].level)
+  return buckets[key]
+
+
+def get_processor_name(request_name: str) -> str:
+  """Processor path of a request name, which may point at a version"""
+  return request_name.split("/processorVersions/")[0]
+
+
+def call_with_quota(kind: str, request_name: str, call,
+    timeout: float = DOCAI_SUBMIT_TIMEOUT_SECONDS):
+  """Calls DocAI within the rate of the processor, retrying quota errors
+
+  Args:
+    kind: KIND_BATCH or KIND_ONLINE
+    request_name: processor (version) the request is sent to
+    call: function sending the request
+    timeout: seconds after which waiting for quota gives up
+  """
+  processor_name = get_processor_name(request_name)
+  bucket = get_bucket(processor_name, kind)
+  deadline = time.monotonic() + timeout
+  attempt = 0
+  while True:
+    bucket.acquire(deadline)
+    try:
+      result = call()
+      bucket.on_success()
+      RATE.labels(SERVICE_NAME, processor_name, kind).set(bucket.rate)
+      return result
+    except TooManyRequests as e:
+      REJECTIONS.labels(SERVICE_NAME, processor_name, kind).inc()
+      bucket.on_quota_error()
+      RATE.labels(SERVICE_NAME, processor_name, kind).set(bucket.rate)
+      backoff = min(DOCAI_BACKOFF_MAX_SECONDS,
+                    BACKOFF_INITIAL_SECONDS * 2 ** attempt)
+      backoff *= random.uniform(0.5, 1)
+      attempt += 1
+      if time.monotonic() + backoff > deadline:
+        raise
+      logger.warning(f"call_with_quota - {kind} request for {processor_name}"
+                     f" hit the quota ({e}), retry {attempt} in"
+                     f" {round(backoff, 1)} s at"
+                     f" {round(bucket.rate * 60, 2)} requests/min")
+      time.sleep(backoff)
+
+
+def submit_batch(dai_client,
+    request: documentai.types.document_processor_service.BatchProcessRequest):
+  """Submits a batch process request once quota and an LRO slot are free
+
+  Blocks until submitted, run it in a thread from async code.
+  Raises TimeoutError when no slot or quota is available within
+  DOCAI_SUBMIT_TIMEOUT_SECONDS.
+  Returns:
+    the operation, its LRO slot is released when it is done
+  """
+  deadline = time.monotonic() + DOCAI_SUBMIT_TIMEOUT_SECONDS
+  lro_scheduler = priority_scheduler.get_scheduler(
+      priority_scheduler.SCHEDULER_DOCAI_LRO)
+  lane = lro_scheduler.acquire(timeout=DOCAI_SUBMIT_TIMEOUT_SECONDS)
+  try:
+    with priority_scheduler.get_scheduler(
+        priority_scheduler.SCHEDULER_DOCAI).slot(lane):
+      operation = call_with_quota(
+          KIND_BATCH, request.name,
+          lambda: dai_client.batch_process_documents(request),
+          timeout=max(deadline - time.monotonic(), 0))
+  except Exception:
+    lro_scheduler.release(lane)
+    raise
+  # Done callbacks stop polling after the default polling timeout (900 s),
+  # so the slot is released by a thread waiting without a timeout
+  threading.Thread(target=release_when_done,
+                   args=(operation, lro_scheduler, lane),
+                   name=f"docai-lro-{lane}", daemon=True).start()
+  return operation
+
+
+def release_when_done(operation, lro_scheduler, lane: str):
+  """Waits for the operation, however long it runs, and frees its slot"""
+  try:
+    operation.result(timeout=None)
+  except Exception as e:
+    # failed operations are handled by the done callback / lro_tracker
+    logger.info(f"release_when_done - {operation.operation.name} "
+                f"finished with {e}")
+  finally:
+    lro_scheduler.release(lane)
+
+
+def process_online(dai_client,
+    request: documentai.types.document_processor_service.ProcessRequest):
+  """Sends a synchronous process request within the processor's rate"""
+  return call_with_quota(
+      KIND_ONLINE, request.name,
+      lambda: dai_client.process_document(request=request),
+      timeout=DOCAI_BACKOFF_MAX_SECONDS)
@@ -0,0 +1,84 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+  Tests for the DocAI quota aware submitter
+"""
+import threading
+import time
+from unittest import mock
+from google.api_core.exceptions import ResourceExhausted
+from . import docai_submitter
+from . import priority_scheduler
+from .docai_submitter import TokenBucket
+
+# disabling pylint rules that conflict with pytest fixtures
+# pylint: disable=unused-argument,redefined-outer-name,unused-import
+
+PROCESSOR = "projects/p/locations/us/processors/abc"
+
+
+def test_token_bucket():
+  bucket = TokenBucket(rate=1, burst=2)
+  assert bucket.try_acquire() == 0
+  assert bucket.try_acquire() == 0
+  assert bucket.try_acquire() > 0
+
+  bucket.on_quota_error()
+  assert bucket.rate == 0.5
+  bucket.on_success()
+  assert bucket.rate == 0.6
+
+
+def test_call_with_quota_retries_quota_errors():
+  call = mock.MagicMock(side_effect=[ResourceExhausted("quota"), "operation"])
+  with mock.patch.object(docai_submitter, "DOCAI_BATCH_REQUESTS_PER_MINUTE",
+                         6000), \
+      mock.patch.object(docai_submitter.random, "uniform", return_value=0), \
+      mock.patch.object(docai_submitter.logger, "warning") as warning:
+    result = docai_submitter.call_with_quota(
+        docai_submitter.KIND_BATCH, f"{PROCESSOR}/processorVersions/v1", call)
+  assert result == "operation"
+  assert call.call_count == 2
+  warning.assert_called_once()
+  bucket = docai_submitter.get_bucket(PROCESSOR, docai_submitter.KIND_BATCH)
+  assert bucket.rate < bucket.max_rate
+
+
+def test_submit_batch_releases_slot_when_operation_is_done():
+  done = threading.Event()
+  operation = mock.MagicMock()
+  operation.result.side_effect = lambda timeout: done.wait(5)
+  dai_client = mock.MagicMock()
+  dai_client.batch_process_documents.return_value = operation
+  request = mock.MagicMock()
+  request.name = PROCESSOR
+  lro_scheduler = priority_scheduler.get_scheduler(
+      priority_scheduler.SCHEDULER_DOCAI_LRO)
+
+  def in_flight():
+    return sum(lane["in_flight"] for lane in lro_scheduler.stats().values())
+
+  assert docai_submitter.submit_batch(dai_client, request) is operation
+  assert in_flight() == 1
+
+  done.set()
+  deadline = time.time() + 5
+  while in_flight() and time.time() < deadline:
+    time.sleep(0.01)
+  assert in_flight() == 0
+  # no polling timeout, the slot is held for as long as the operation runs
+  operation.result.assert_called_once_with(timeout=None)
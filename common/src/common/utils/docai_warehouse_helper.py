@@ -18,6 +18,7 @@ import traceback
 from typing import Any
 from typing import Dict
 from typing import List
+from typing import Tuple
 
 import pandas as pd
 import proto
@@ -25,11 +26,19 @@ from google.cloud import contentwarehouse_v1
 from google.type import datetime_pb2
 
 from common.utils.document_ai_utils import get_key_values_dic
+from common.utils.helper import parse_date
 from common.utils.logging_handler import Logger
 from .document_warehouse_utils import DocumentWarehouseUtils
 
 logger = Logger.get_logger(__name__)
 
+PROPERTY_TYPES = ["text_type_options", "date_time_type_options",
+                  "float_type_options", "integer_type_options"]
+
+dw_utils_cache: Dict[Tuple[str, str], DocumentWarehouseUtils] = {}
+document_schema_cache: Dict[Tuple[str, str, str], Any] = {}
+schema_property_types_cache: Dict[Tuple[str, str], Dict[str, str]] = {}
+
 
 def get_key_value_pairs(document_ai_output):
   json_string = proto.Message.to_json(document_ai_output)
@@ -91,20 +100,50 @@ def extract_entities_as_properties(
     return properties
 
 
+def get_dw_utils(project_number: str,
+    api_location: str) -> DocumentWarehouseUtils:
+  """Re-uses DocumentWarehouseUtils (and its clients) for the process life."""
+  key = (project_number, api_location)
+  if key not in dw_utils_cache:
+    dw_utils_cache[key] = DocumentWarehouseUtils(project_number=project_number,
+                                                 api_location=api_location)
+  return dw_utils_cache[key]
+
+
+def get_document_schema(dw_utils: DocumentWarehouseUtils,
+    document_schema_id: str) -> contentwarehouse_v1.DocumentSchema:
+  key = (dw_utils.project_number, dw_utils.api_location, document_schema_id)
+  if key not in document_schema_cache:
+    document_schema_cache[key] = dw_utils.get_document_schema(
+        document_schema_id)
+  return document_schema_cache[key]
+
+
+def get_schema_property_types(schema) -> Dict[str, str]:
+  """
+  Returns property name -> type option for the schema.
+  Compiled once per schema (name and update time) and cached across documents.
+  """
+  cache_key = (schema.name, str(schema.update_time))
+  property_types = schema_property_types_cache.get(cache_key)
+  if property_types is None:
+    property_types = {}
+    for prop in schema.property_definitions:
+      for t in PROPERTY_TYPES:
+        if t in prop:
+          property_types.setdefault(prop.name, t)
+          break
+    schema_property_types_cache[cache_key] = property_types
+  return property_types
+
+
 def get_metadata_properties(key_values, schema) -> List[
   contentwarehouse_v1.Property]:
-  def get_type_using_schema(property_name):
-    for prop in schema.property_definitions:
-        if prop.name == property_name:
-            for t in ["text_type_options", "date_time_type_options",
-                      "float_type_options", "integer_type_options", ]:
-                if t in prop:
-                    return t
-    return None
+  property_types = get_schema_property_types(schema)
   metadata_properties = []
 
   for key, value in key_values:
-    value_type = get_type_using_schema(key)
+    value_type = property_types.get(key)
     if value_type is not None:
       logger.info(f"get_metadata_properties key={key}, value={value}, type={value_type}")
       one_property = contentwarehouse_v1.Property()
@@ -120,7 +159,10 @@ def get_metadata_properties(key_values, schema) -> List[
           one_property.integer_values = contentwarehouse_v1.IntegerArray(
               values=[int(value)])
         elif value_type == "date_time_type_options":
-          date_time = pd.to_datetime(value)
+          date_time = parse_date(value)
+          if date_time is None:
+            # Format not covered by the precompiled patterns
+            date_time = pd.to_datetime(value)
 
           dt = datetime_pb2.DateTime(year=date_time.year,
                                      month=date_time.month,
@@ -159,10 +201,9 @@ def process_document(project_number: str,
                 f"display_name={display_name}, document_schema_id="
                 f"{document_schema_id}, caller_user={caller_user}, "
                 f"bucket_name={bucket_name}, document_path={document_path}")
-    dw_utils = DocumentWarehouseUtils(project_number=project_number,
-                                      api_location=api_location)
+    dw_utils = get_dw_utils(project_number, api_location)
 
-    schema = dw_utils.get_document_schema(document_schema_id)
+    schema = get_document_schema(dw_utils, document_schema_id)
     keys = get_key_value_pairs(document_ai_output)
     metadata_properties = get_metadata_properties(keys, schema)
 
@@ -15,12 +15,18 @@ limitations under the License.
 """
 import json
 import re
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict
+from typing import Iterator
 from typing import List
+from typing import Optional
+from typing import Tuple
 
 from google.cloud import documentai_v1
 from google.api_core.client_options import ClientOptions
 from .storage_utils import read_binary_object
+from common.utils import docai_submitter
+from common.utils import pdf_chunker
 from common.utils.logging_handler import Logger
 from google.cloud import documentai_v1 as documentai
 import time
@@ -122,6 +128,28 @@ class DocumentaiUtils:
     def batch_extraction(self, processor_id: str, input_uris: List[str], gcs_output_bucket: str, timeout=600):
         if len(input_uris) == 0:
             return []
+        operation = self.start_batch_extraction(processor_id, input_uris, gcs_output_bucket)
+        try:
+            documents = self.get_batch_output_files(operation, timeout=timeout)
+        # Catch exception when operation doesn't finish before timeout
+        except (RetryError, InternalServerError) as e:
+            logger.error(e.message)
+            logger.error("batch_extraction - Failed to process documents")
+            return [], False
+
+        result = {}
+        for doc in documents:
+            result[doc] = merge_json_files(documents[doc])
+
+        return result
+
+    def start_batch_extraction(self, processor_id: str, input_uris: List[str], gcs_output_bucket: str,
+                               field_mask: Optional[str] = None):
+        """
+        Submits a batch process operation and returns it without waiting.
+        field_mask limits the fields written to the output json
+        (see docai_config.get_field_mask), by default all fields are returned.
+        """
         client = self.get_docai_client()
         parent = self.get_parent()
 
@@ -140,38 +168,43 @@ class DocumentaiUtils:
         # folder will be created automatically not the bucket
         destination_uri = f"gs://{gcs_output_bucket}/"
 
+        gcs_output_config = documentai.DocumentOutputConfig.GcsOutputConfig(
+            gcs_uri=destination_uri, field_mask=field_mask)
         output_config = documentai.DocumentOutputConfig(
-            gcs_output_config={"gcs_uri": destination_uri})
+            gcs_output_config=gcs_output_config)
 
         logger.info(f"batch_extraction - input_config = {input_config}")
         logger.info(f"batch_extraction - output_config = {output_config}")
         logger.info(
-            f"batch_extraction - Calling Processor API for {len(input_uris)} document(s) "
             f"batch_extraction - Calling DocAI API for {len(input_uris)} document(s) "
             f" using {processor.display_name} processor "
             f"type={processor.type_}, path={processor.name}")
 
-        start = time.time()
         # request for Doc AI
         request = documentai.types.document_processor_service.BatchProcessRequest(
             name=processor.name,
             input_documents=input_config,
             document_output_config=output_config,
         )
-        operation = client.batch_process_documents(request)
+        # waits for processor quota and a free LRO slot, retrying quota errors
+        operation = docai_submitter.submit_batch(client, request)
+        # Format: projects/PROJECT_NUMBER/locations/LOCATION/operations/OPERATION_ID
+        logger.info(
+            f"batch_extraction - Started operation {operation.operation.name}")
+        return operation
 
+    @staticmethod
+    def get_batch_output_files(operation, timeout=600) -> Dict[str, List[str]]:
+        """
+        Waits for a batch process operation to complete and returns the output
+        JSON files per input document, keys are path to original document.
+        """
+        start = time.time()
         # Continually polls the operation until it is complete.
         # This could take some time for larger files
-        # Format: projects/PROJECT_NUMBER/locations/LOCATION/operations/OPERATION_ID
-        try:
-            logger.info(
-                f"batch_extraction - Waiting for operation {operation.operation.name} to complete...")
-            operation.result(timeout=timeout)
-        # Catch exception when operation doesn't finish before timeout
-        except (RetryError, InternalServerError) as e:
-            logger.error(e.message)
-            logger.error("batch_extraction - Failed to process documents")
-            return [], False
+        logger.info(
+            f"batch_extraction - Waiting for operation {operation.operation.name} to complete...")
+        operation.result(timeout=timeout)
 
         elapsed = "{:.0f}".format(time.time() - start)
         logger.info(
@@ -184,10 +217,9 @@ class DocumentaiUtils:
             raise ValueError(
                 f"batch_extraction - Batch Process Failed: {metadata.state_message}")
 
-        documents = {}  # Contains per processed document, keys are path to original document
+        documents = {}
 
         # One process per Input Document
-        blob_count = 0
         for process in metadata.individual_process_statuses:
             # output_gcs_destination format: gs://BUCKET/PREFIX/OPERATION_NUMBER/INPUT_FILE_NUMBER/
             # The Cloud Storage API requires the bucket name and URI prefix separately
@@ -222,11 +254,91 @@ class DocumentaiUtils:
                     documents[input_gcs_source] = []
                 documents[input_gcs_source].append(f"gs://{output_bucket}/{blob.name}")
 
-        result = {}
-        for doc in documents:
-            result[doc] = merge_json_files(documents[doc])
+        return documents
+
+    def stream_batch_extraction(self, processor_id: str, input_uris: List[str],
+                                gcs_output_bucket: str, chunk_size: int = 100,
+                                timeout=600, field_mask: Optional[str] = None
+                                ) -> Iterator[Tuple[str, documentai.Document]]:
+        """
+        Processes input_uris in chunks of chunk_size and yields
+        (input uri, merged Document) one at a time.
+        The operation for chunk N+1 is submitted before documents of chunk N
+        are yielded, so DocAI processing overlaps with consuming the results,
+        and only one Document is held in memory at a time.
+        PDFs over the processor page limit are split into page range chunks
+        (see pdf_chunker), their Documents are held until all chunks are
+        processed and yielded stitched, under the uri of the original PDF.
+        """
+        input_uris, source_uris = self.split_oversized_documents(input_uris, gcs_output_bucket)
+        part_counts = {}
+        for source_uri in source_uris.values():
+            part_counts[source_uri] = part_counts.get(source_uri, 0) + 1
+        parts = {}
+
+        chunks = [input_uris[i:i + chunk_size]
+                  for i in range(0, len(input_uris), chunk_size)]
+        if len(chunks) == 0:
+            return
+        logger.info(f"stream_batch_extraction - {len(input_uris)} document(s) "
+                    f"in {len(chunks)} chunk(s) of up to {chunk_size}")
+        operation = self.start_batch_extraction(processor_id, chunks[0], gcs_output_bucket,
+                                                field_mask=field_mask)
+        for i in range(len(chunks)):
+            try:
+                documents = self.get_batch_output_files(operation, timeout=timeout)
+            except (RetryError, InternalServerError, ValueError) as e:
+                logger.error(f"stream_batch_extraction - Failed to process "
+                             f"chunk {i + 1}/{len(chunks)}: {e}")
+                documents = {}
+
+            if i + 1 < len(chunks):
+                operation = self.start_batch_extraction(processor_id, chunks[i + 1], gcs_output_bucket,
+                                                        field_mask=field_mask)
+
+            for doc in documents:
+                source_uri = source_uris.get(doc)
+                if not source_uri:
+                    yield doc, merge_json_files(documents[doc])
+                    continue
+                parts.setdefault(source_uri, {})[doc] = [merge_json_files(documents[doc])]
+                if len(parts[source_uri]) == part_counts[source_uri]:
+                    stitched = pdf_chunker.stitch_chunks(parts.pop(source_uri), source_uris)
+                    yield source_uri, stitched[source_uri][0]
 
-        return result
+        for source_uri in parts:
+            logger.error(f"stream_batch_extraction - Skipping {source_uri}, only "
+                         f"{len(parts[source_uri])}/{part_counts[source_uri]} chunks processed")
+
+    @staticmethod
+    def split_oversized_documents(input_uris: List[str], gcs_output_bucket: str,
+                                  max_workers: int = 8) -> Tuple[List[str], Dict[str, str]]:
+        """
+        Pre-flight check of input_uris, replacing PDFs over the processor limits
+        with their page range chunks.
+        Returns the uris to process and a dict of chunk uri -> original uri.
+        """
+        if not pdf_chunker.is_chunking_enabled():
+            return list(input_uris), {}
+
+        def split(uri: str) -> List[str]:
+            try:
+                return pdf_chunker.split_document(uri, gcs_output_bucket)
+            except Exception as e:
+                logger.warning(f"split_oversized_documents - Could not check {uri}: {e}")
+                return [uri]
+
+        uris = []
+        source_uris = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for uri, part_uris in zip(input_uris, executor.map(split, input_uris)):
+                uris.extend(part_uris)
+                if part_uris != [uri]:
+                    source_uris.update({part_uri: uri for part_uri in part_uris})
+        if source_uris:
+            logger.info(f"split_oversized_documents - {len(set(source_uris.values()))} "
+                        f"document(s) split into {len(source_uris)} chunks")
+        return uris, source_uris
 
 
 def merge_json_files(files):
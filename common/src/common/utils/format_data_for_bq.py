@@ -15,6 +15,8 @@ limitations under the License.
 """
 
 import json
+from typing import List, Optional
+from common.utils.helper import INT_PATTERN, FLOAT_PATTERN, parse_date
 from common.utils.logging_handler import Logger
 logger = Logger.get_logger(__name__)
 
@@ -35,14 +37,81 @@ def format_data_for_bq(entities):
   if entities is not None:
     new_list = []
     for i in entities:
+      corrected_value = i.get("corrected_value")
+      effective_value = i.get("value") if corrected_value in (None, "") \
+        else corrected_value
+      # ISO date of the effective value, so that date rules in BigQuery
+      # accept the same formats as parse_date
       entity_dict = {"name": i.get("entity"),
                      "value": i.get("value"),
                      "confidence": i.get("extraction_confidence"),
-                     "corrected_value": i.get("corrected_value"),
-                     "page_no": i.get("page_no")}
+                     "corrected_value": corrected_value,
+                     "page_no": i.get("page_no"),
+                     "date_value": get_date_value(effective_value)}
       new_list.append(entity_dict)
     # res = dict(ChainMap(*new_list))
     new_json = json.dumps(new_list)
     return new_json
   else:
     return None
+
+
+def get_numeric_value(value) -> Optional[float]:
+  """
+    Returns the value as a number, ignoring currency signs and
+    thousands separators, or None when it is not numeric
+  """
+  if value is None or isinstance(value, bool):
+    return None
+  if isinstance(value, (int, float)):
+    return float(value)
+  value = str(value).strip().lstrip("$").replace(",", "")
+  if INT_PATTERN.match(value) or FLOAT_PATTERN.match(value):
+    return float(value)
+  return None
+
+
+def get_date_value(value) -> Optional[str]:
+  """
+    Returns the value as an ISO date (YYYY-MM-DD) or None when it is not
+    a date
+  """
+  if value is None or isinstance(value, (bool, int, float)):
+    return None
+  date = parse_date(value)
+  return date.date().isoformat() if date else None
+
+
+def format_data_for_bq_typed(entities) -> Optional[List[dict]]:
+  """
+    Converts entities to the repeated entity_values STRUCT of
+    the typed BigQuery table
+    Args :
+    entities : string returned by format_data_for_bq or list of dictionaries
+               in the same format
+    output : list of dictionaries with name, value, corrected_value,
+             numeric_value, date_value, confidence and page_no
+  """
+  if entities is None:
+    return None
+  if isinstance(entities, str):
+    entities = json.loads(entities)
+
+  entity_values = []
+  for entity in entities:
+    value = entity.get("value")
+    corrected_value = entity.get("corrected_value")
+    # Typed columns hold the effective value, corrected in HITL if present
+    effective_value = value if corrected_value in (None, "") \
+      else corrected_value
+    page_no = get_numeric_value(entity.get("page_no"))
+    entity_values.append(
+        {"name": entity.get("name"),
+         "value": None if value is None else str(value),
+         "corrected_value": None if corrected_value is None
+           else str(corrected_value),
+         "numeric_value": get_numeric_value(effective_value),
+         "date_value": get_date_value(effective_value),
+         "confidence": get_numeric_value(entity.get("confidence")),
+         "page_no": None if page_no is None else int(page_no)})
+  return entity_values
@@ -19,7 +19,7 @@ limitations under the License.
 """
 import os
 import json
-from .format_data_for_bq import format_data_for_bq
+from .format_data_for_bq import format_data_for_bq, format_data_for_bq_typed
 
 # disabling pylint rules that conflict with pytest fixtures
 # pylint: disable=unused-argument,redefined-outer-name,unused-import
@@ -35,3 +35,22 @@ def test_format_data_for_bq():
   expected_output = json.dumps(({"last_naame": "Doe", "name": "Max"}))
   assert output==expected_output
 
+
+def test_format_data_for_bq_typed():
+  input_value = json.dumps([
+      {"name": "hours", "value": "1,200.5", "confidence": 0.9,
+       "corrected_value": None, "page_no": 1},
+      {"name": "dob", "value": "01/31/1990", "confidence": "0.5",
+       "corrected_value": "1990-02-01", "page_no": "2"},
+      {"name": "name", "value": "Max", "confidence": None,
+       "corrected_value": None, "page_no": None}])
+  output = format_data_for_bq_typed(input_value)
+  assert output[0]["numeric_value"] == 1200.5
+  assert output[0]["date_value"] is None
+  assert output[1]["date_value"] == "1990-02-01"
+  assert output[1]["value"] == "01/31/1990"
+  assert output[1]["confidence"] == 0.5
+  assert output[1]["page_no"] == 2
+  assert output[2]["numeric_value"] is None
+  assert output[2]["date_value"] is None
+  assert format_data_for_bq_typed(None) is None
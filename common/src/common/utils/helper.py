@@ -15,12 +15,13 @@ limitations under the License.
 """
 
 
+import datetime
 import re
 import os
+from typing import Optional
 from google.cloud import storage
 from common.utils.logging_handler import Logger
 from common import models
-import pandas as pd
 
 storage_client = storage.Client()
 logger = Logger.get_logger(__name__)
@@ -74,14 +75,61 @@ def get_processor_location(processor_path):
   return None
 
 
+# Precompiled patterns used for type inference of extracted values,
+# much cheaper than a pd.to_datetime call per value
+INT_PATTERN = re.compile(r"^[+-]?\d+$")
+FLOAT_PATTERN = re.compile(r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$")
+TIME_PATTERN = r"(?:[T ](?P<hour>\d{1,2}):(?P<minute>\d{2})(?::(?P<second>\d{2}))?(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?)?"
+DATE_PATTERNS = [
+    # 2023-01-31, 2023/01/31 with optional time
+    re.compile(r"^(?P<year>\d{4})[-/.](?P<month>\d{1,2})[-/.](?P<day>\d{1,2})"
+               + TIME_PATTERN + "$"),
+    # 01/31/2023, 01-31-23 with optional time
+    re.compile(r"^(?P<month>\d{1,2})[-/.](?P<day>\d{1,2})[-/.](?P<year>\d{4}|\d{2})"
+               + TIME_PATTERN + "$"),
+    # Jan 31, 2023 / January 31 2023
+    re.compile(r"^(?P<month_name>[A-Za-z]{3,9})\.? (?P<day>\d{1,2}),? (?P<year>\d{4})$"),
+    # 31 Jan 2023
+    re.compile(r"^(?P<day>\d{1,2}) (?P<month_name>[A-Za-z]{3,9})\.?,? (?P<year>\d{4})$"),
+]
+MONTH_NAMES = {name: i + 1 for i, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct",
+     "nov", "dec"])}
+
+
+def parse_date(string: str) -> Optional[datetime.datetime]:
+  """
+  Parses the string as a date using DATE_PATTERNS, returns None when the
+  string is not a date.
+  """
+  string = str(string).strip()
+  for pattern in DATE_PATTERNS:
+    match = pattern.match(string)
+    if not match:
+      continue
+    parts = match.groupdict()
+    if parts.get("month_name"):
+      month = MONTH_NAMES.get(parts["month_name"][:3].lower())
+      if month is None:
+        return None
+    else:
+      month = int(parts["month"])
+    year = int(parts["year"])
+    if year < 100:
+      year += 2000 if year < 70 else 1900
+    try:
+      return datetime.datetime(year, month, int(parts["day"]),
+                               int(parts.get("hour") or 0),
+                               int(parts.get("minute") or 0),
+                               int(parts.get("second") or 0))
+    except ValueError:
+      return None
+  return None
+
+
 def is_date(string: str):
   """
   Return whether the string can be interpreted as a date.
   """
-  try:
-    converted = pd.to_datetime(string)
-    return True
-
-  except Exception:
-    return False
+  return parse_date(string) is not None
 
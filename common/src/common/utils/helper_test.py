@@ -0,0 +1,53 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+  Tests for type inference helpers
+"""
+import datetime
+import os
+from .helper import FLOAT_PATTERN, INT_PATTERN, is_date, parse_date
+
+# disabling pylint rules that conflict with pytest fixtures
+# pylint: disable=unused-argument,redefined-outer-name,unused-import
+
+os.environ["FIRESTORE_EMULATOR_HOST"] = "localhost:8080"
+os.environ["GOOGLE_CLOUD_PROJECT"] = "fake-project"
+
+
+def test_parse_date():
+  assert parse_date("2023-01-31") == datetime.datetime(2023, 1, 31)
+  assert parse_date("01/31/2023") == datetime.datetime(2023, 1, 31)
+  assert parse_date("1/31/23") == datetime.datetime(2023, 1, 31)
+  assert parse_date("Jan 31, 2023") == datetime.datetime(2023, 1, 31)
+  assert parse_date("31 January 2023") == datetime.datetime(2023, 1, 31)
+  assert parse_date("2023-01-31T10:15:30Z") == datetime.datetime(
+      2023, 1, 31, 10, 15, 30)
+
+
+def test_is_date():
+  assert is_date("12/25/2022")
+  assert not is_date("13/45/2022")
+  assert not is_date("12345")
+  assert not is_date("John Doe")
+
+
+def test_number_patterns():
+  assert INT_PATTERN.match("42")
+  assert not INT_PATTERN.match("4.2")
+  assert FLOAT_PATTERN.match("4.2")
+  assert FLOAT_PATTERN.match("-1e5")
+  assert not FLOAT_PATTERN.match("1.2.3")
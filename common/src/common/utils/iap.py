@@ -86,10 +86,9 @@ def make_iap_request(url, client_id, method='GET', **kwargs):
   # Fetch the Identity-Aware Proxy-protected URL, including an
   # Authorization header containing "Bearer " followed by a
   # Google-issued OpenID Connect token for the service account.
-  resp = requests.request(
-      method, url,
-      headers={'Authorization': 'Bearer {}'.format(
-          open_id_connect_token)}, **kwargs)
+  headers = kwargs.pop("headers", None) or {}
+  headers["Authorization"] = "Bearer {}".format(open_id_connect_token)
+  resp = requests.request(method, url, headers=headers, **kwargs)
   if resp.status_code == 403:
     raise Exception('Service account does not have permission to '
                     'access the IAP-protected application.')
@@ -0,0 +1,238 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Persistent registry of DocAI batch operations (LRO).
+
+Each submitted operation is recorded in Firestore together with the stage
+that submitted it and its input documents. The result is handled either by
+the in-process done callback of the submitting replica or, when that replica
+is gone, by the poller of any other replica of the same service.
+A Firestore transaction makes sure only one replica handles each result.
+"""
+import asyncio
+import datetime
+import os
+import socket
+import traceback
+import uuid
+from typing import Callable, Dict, List, Optional
+
+import fireo
+from google.cloud import documentai_v1 as documentai
+
+from common.config import PROCESS_TIMEOUT_SECONDS
+from common.config import STATUS_ERROR
+from common.config import STATUS_IN_PROGRESS
+from common.config import STATUS_SUCCESS
+from common.models import DocaiOperation
+from common.utils import docai_cache
+from common.utils import pdf_chunker
+from common.utils import priority_scheduler
+from common.utils.helper import get_id_from_file_path
+from common.utils.logging_handler import Logger
+
+logger = Logger.get_logger(__name__)
+
+STAGE_CLASSIFICATION = "classification"
+STAGE_EXTRACTION = "extraction"
+
+# How often each replica looks for finished operations nobody handled
+LRO_POLL_INTERVAL_SECONDS = int(os.getenv("LRO_POLL_INTERVAL_SECONDS", "60"))
+# How long the submitting replica owns the operation before others may
+# pick it up (once the operation is done)
+LRO_LEASE_SECONDS = int(os.getenv("LRO_LEASE_SECONDS", "300"))
+
+REPLICA_ID = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+
+# stage -> handler(metadata: BatchProcessMetadata, processor_type: str)
+stage_handlers: Dict[str, Callable] = {}
+# DocAI clients per api location, used to query operation state
+dai_clients = {}
+
+
+def register_stage_handler(stage: str, handler: Callable):
+  stage_handlers[stage] = handler
+
+
+def utc_now():
+  return datetime.datetime.now(datetime.timezone.utc)
+
+
+def register_operation(operation_name: str, stage: str,
+    processor: documentai.types.processor.Processor,
+    input_uris: List[str],
+    field_mask: Optional[str] = None) -> Optional[DocaiOperation]:
+  """Stores a submitted operation, owned by this replica"""
+  try:
+    uids = []
+    for uri in input_uris:
+      _, uid = get_id_from_file_path(pdf_chunker.get_document_path_uri(uri))
+      uids.append(uid)
+
+    operation = DocaiOperation()
+    operation.id = operation_name.split("/")[-1]
+    operation.operation_name = operation_name
+    operation.stage = stage
+    operation.processor_name = processor.name
+    operation.processor_type = processor.type_
+    operation.processor_version = docai_cache.get_processor_version(processor)
+    operation.field_mask = field_mask
+    operation.input_uris = list(input_uris)
+    operation.uids = uids
+    operation.status = STATUS_IN_PROGRESS
+    operation.owner = REPLICA_ID
+    operation.priority = priority_scheduler.get_priority()
+    operation.lease_expiry = utc_now() + datetime.timedelta(
+        seconds=LRO_LEASE_SECONDS)
+    operation.updated_timestamp = utc_now()
+    operation.save()
+    logger.info(f"register_operation - {stage} operation {operation_name} "
+                f"registered for {len(input_uris)} document(s)")
+    return operation
+  except Exception as e:
+    logger.error(f"register_operation - Failed to register {operation_name}: "
+                 f"{e}")
+    err = traceback.format_exc().replace("\n", " ")
+    logger.error(err)
+    return None
+
+
+@fireo.transactional
+def claim_operation_transaction(transaction, operation_id: str, owner: str):
+  operation = DocaiOperation.collection.get(
+      fireo.utils.utils.generateKeyFromId(DocaiOperation, operation_id),
+      transaction=transaction)
+  if operation is None or operation.status != STATUS_IN_PROGRESS:
+    return False
+  now = utc_now()
+  if operation.owner != owner and operation.lease_expiry and \
+      operation.lease_expiry > now:
+    return False
+  operation.owner = owner
+  # Processing the results needs to finish within this time, otherwise
+  # another replica will retry
+  operation.lease_expiry = now + datetime.timedelta(
+      seconds=PROCESS_TIMEOUT_SECONDS)
+  operation.updated_timestamp = now
+  operation.update(transaction=transaction)
+  return True
+
+
+def claim_operation(operation_id: str) -> bool:
+  transaction = fireo.transaction()
+  return claim_operation_transaction(transaction, operation_id, REPLICA_ID)
+
+
+def finalize_operation(operation: DocaiOperation, status: str,
+    error_detail: Optional[str] = None):
+  operation.status = status
+  operation.error_detail = error_detail
+  operation.updated_timestamp = utc_now()
+  operation.update()
+
+
+def handle_operation_result(operation_name: str, stage: str,
+    metadata: documentai.BatchProcessMetadata,
+    processor_type: Optional[str] = None):
+  """
+  Runs the stage handler for the finished operation, unless another replica
+  already claimed it. Called from the done callback and from the poller.
+  """
+  handler = stage_handlers.get(stage)
+  if not handler:
+    logger.error(f"handle_operation_result - No handler registered for "
+                 f"stage {stage}")
+    return
+
+  operation = DocaiOperation.find_by_operation_name(operation_name)
+  if operation is None:
+    # Operation was not registered (e.g. registry unavailable at submit time)
+    logger.warning(f"handle_operation_result - {operation_name} is not "
+                   f"registered, handling without tracking")
+    if metadata.state != documentai.BatchProcessMetadata.State.SUCCEEDED:
+      raise ValueError(f"Batch Process Failed: {metadata.state_message}")
+    handler(metadata, processor_type)
+    return
+
+  if not claim_operation(operation.id):
+    logger.info(f"handle_operation_result - {operation_name} is already "
+                f"handled by another replica")
+    return
+
+  # done callbacks and the poller run outside of the submitting request
+  priority_scheduler.set_priority(operation.priority)
+  try:
+    if metadata.state != documentai.BatchProcessMetadata.State.SUCCEEDED:
+      raise ValueError(f"Batch Process Failed: {metadata.state_message}")
+    handler(metadata, operation.processor_type)
+    docai_cache.store_batch_results(operation.processor_name,
+                                    operation.processor_version, metadata,
+                                    operation.field_mask)
+    finalize_operation(operation, STATUS_SUCCESS)
+  except Exception as e:
+    logger.error(f"handle_operation_result - {stage} operation "
+                 f"{operation_name} failed: {e}")
+    err = traceback.format_exc().replace("\n", " ")
+    logger.error(err)
+    finalize_operation(operation, STATUS_ERROR, str(e))
+
+
+def get_dai_client(operation_name: str):
+  # Format: projects/PROJECT_NUMBER/locations/LOCATION/operations/OPERATION_ID
+  location = operation_name.split("/")[3]
+  if location not in dai_clients:
+    opts = {"api_endpoint": f"{location}-documentai.googleapis.com"}
+    dai_clients[location] = documentai.DocumentProcessorServiceClient(
+        client_options=opts)
+  return dai_clients[location]
+
+
+def resume_finished_operations(stage: str):
+  """
+  Handles operations of the stage which are done, but whose owner did not
+  process the result before its lease expired (e.g. pod was restarted).
+  """
+  now = utc_now()
+  for operation in DocaiOperation.find_in_progress(stage):
+    if operation.lease_expiry and operation.lease_expiry > now:
+      continue
+    try:
+      lro = get_dai_client(operation.operation_name).get_operation(
+          request={"name": operation.operation_name})
+      if not lro.done:
+        continue
+      logger.info(f"resume_finished_operations - Resuming {stage} operation "
+                  f"{operation.operation_name} submitted by {operation.owner}")
+      metadata = documentai.BatchProcessMetadata.deserialize(
+          lro.metadata.value)
+      handle_operation_result(operation.operation_name, stage, metadata)
+    except Exception as e:
+      logger.error(f"resume_finished_operations - Failed to resume "
+                   f"{operation.operation_name}: {e}")
+      err = traceback.format_exc().replace("\n", " ")
+      logger.error(err)
+
+
+async def poll_operations(stage: str):
+  """Background loop started on service startup"""
+  loop = asyncio.get_running_loop()
+  while True:
+    await asyncio.sleep(LRO_POLL_INTERVAL_SECONDS)
+    try:
+      await loop.run_in_executor(None, resume_finished_operations, stage)
+    except Exception as e:
+      logger.error(f"poll_operations - {e}")
@@ -0,0 +1,142 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Pipeline metrics shared by all services.
+
+Stage latencies are recorded as histograms and document/page/byte volumes as
+counters, exported in OpenMetrics format by the /metrics endpoint of every
+service. A trace_id travels with each document (Firestore record, Pub/Sub
+message configs and the X-Trace-Id HTTP header) and is attached to histogram
+observations as an exemplar and to the per-stage log line, so the time spent
+by a single document can be followed across services.
+"""
+import contextlib
+import contextvars
+import os
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from fastapi import Response
+from prometheus_client import Counter, Histogram, REGISTRY
+from prometheus_client.openmetrics.exposition import CONTENT_TYPE_LATEST
+from prometheus_client.openmetrics.exposition import generate_latest
+
+from common.utils import priority_scheduler
+from common.utils.logging_handler import Logger
+
+logger = Logger.get_logger(__name__)
+
+SERVICE_NAME = os.getenv("SERVICE_NAME", "cda")
+TRACE_HEADER = "X-Trace-Id"
+
+# Pipeline stages
+STAGE_UPLOAD = "upload"
+STAGE_PUBLISH = "publish"
+STAGE_DISPATCH = "dispatch"
+STAGE_CLASSIFY = "classify"
+STAGE_EXTRACT = "extract"
+STAGE_CLASSIFY_ONLINE = "classify_online"
+STAGE_CLASSIFY_LRO_WAIT = "classify_lro_wait"
+STAGE_EXTRACT_ONLINE = "extract_online"
+STAGE_EXTRACT_LRO_WAIT = "extract_lro_wait"
+STAGE_SHARD_DOWNLOAD = "shard_download"
+STAGE_MAPPING = "mapping"
+STAGE_BQ_STREAM = "bq_stream"
+STAGE_VALIDATE = "validate"
+STAGE_MATCH = "match"
+STAGE_APPROVE = "approve"
+STAGE_HITL_DOC_LIST = "hitl_doc_list"
+
+STAGE_DURATION = Histogram(
+    "cda_stage_duration_seconds", "Time spent in a pipeline stage",
+    ["service", "stage"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300,
+             600, 1800, 3600))
+DOCUMENTS = Counter("cda_documents", "Documents handled by a pipeline stage",
+                    ["service", "stage"])
+PAGES = Counter("cda_pages", "Pages handled by a pipeline stage",
+                ["service", "stage"])
+BYTES = Counter("cda_bytes", "Bytes handled by a pipeline stage",
+                ["service", "stage"])
+
+trace_id_var = contextvars.ContextVar("trace_id", default=None)
+
+# In-process listeners called with (stage, seconds) for every observation,
+# used by the benchmark harness to compute exact percentiles
+listeners: List[Callable[[str, float], None]] = []
+
+
+def add_listener(listener: Callable[[str, float], None]):
+  listeners.append(listener)
+
+
+def new_trace_id() -> str:
+  return uuid.uuid4().hex
+
+
+def get_trace_id() -> Optional[str]:
+  return trace_id_var.get()
+
+
+def set_trace_id(trace_id: Optional[str]):
+  trace_id_var.set(trace_id)
+
+
+def trace_headers(trace_id: Optional[str] = None) -> Dict[str, str]:
+  """HTTP headers propagating the trace_id and priority lane to the next
+  service"""
+  trace_id = trace_id or get_trace_id()
+  headers = {TRACE_HEADER: trace_id} if trace_id else {}
+  headers.update(priority_scheduler.priority_headers())
+  return headers
+
+
+def observe(stage: str, seconds: float, trace_id: Optional[str] = None,
+    uid: Optional[str] = None):
+  trace_id = trace_id or get_trace_id()
+  exemplar = {"trace_id": trace_id} if trace_id else None
+  STAGE_DURATION.labels(SERVICE_NAME, stage).observe(seconds,
+                                                     exemplar=exemplar)
+  for listener in listeners:
+    listener(stage, seconds)
+  logger.info(f"metrics - stage={stage}, trace_id={trace_id}, uid={uid}, "
+              f"duration_ms={round(seconds * 1000)}")
+
+
+@contextlib.contextmanager
+def timed(stage: str, trace_id: Optional[str] = None,
+    uid: Optional[str] = None):
+  start_time = time.perf_counter()
+  try:
+    yield
+  finally:
+    observe(stage, time.perf_counter() - start_time, trace_id, uid)
+
+
+def count(stage: str, documents: int = 1, pages: int = 0, num_bytes: int = 0):
+  if documents:
+    DOCUMENTS.labels(SERVICE_NAME, stage).inc(documents)
+  if pages:
+    PAGES.labels(SERVICE_NAME, stage).inc(pages)
+  if num_bytes:
+    BYTES.labels(SERVICE_NAME, stage).inc(num_bytes)
+
+
+def metrics_response() -> Response:
+  return Response(content=generate_latest(REGISTRY),
+                  media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,56 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+  Tests for pipeline metrics helpers
+"""
+import os
+
+os.environ["FIRESTORE_EMULATOR_HOST"] = "localhost:8080"
+os.environ["GOOGLE_CLOUD_PROJECT"] = "fake-project"
+
+# pylint: disable=wrong-import-position
+from prometheus_client import REGISTRY
+from . import metrics
+
+
+def get_count(stage):
+  return REGISTRY.get_sample_value("cda_stage_duration_seconds_count",
+                                   {"service": metrics.SERVICE_NAME,
+                                    "stage": stage}) or 0
+
+
+def test_trace_headers():
+  metrics.set_trace_id(None)
+  assert metrics.trace_headers() == {}
+  assert metrics.trace_headers("abc") == {metrics.TRACE_HEADER: "abc"}
+  metrics.set_trace_id("xyz")
+  assert metrics.trace_headers() == {metrics.TRACE_HEADER: "xyz"}
+  metrics.set_trace_id(None)
+
+
+def test_timed_observes_stage():
+  before = get_count(metrics.STAGE_MAPPING)
+  with metrics.timed(metrics.STAGE_MAPPING, trace_id="abc", uid="uid1"):
+    pass
+  assert get_count(metrics.STAGE_MAPPING) == before + 1
+
+
+def test_metrics_response_is_openmetrics():
+  metrics.count(metrics.STAGE_EXTRACT, documents=1, pages=2, num_bytes=10)
+  response = metrics.metrics_response()
+  assert b"cda_pages_total" in response.body
+  assert response.body.endswith(b"# EOF\n")
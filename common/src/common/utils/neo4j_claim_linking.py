@@ -0,0 +1,125 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Incremental claim linking in the neo4j graph.
+
+Claims sharing an attribute node (full name, date of birth, email, ...) are
+connected with a SAME_* relationship. Only claims with
+processed_flag = "false" (written since the last run) are linked, in batches
+of NEO4J_BATCH_SIZE claims per transaction.
+"""
+
+import time
+from typing import List
+from common.config import NEO4J_BATCH_SIZE
+from common.utils.logging_handler import Logger
+
+logger = Logger.get_logger(__name__)
+
+# (attribute node label, key property, relationship between claims)
+LINK_ATTRIBUTES = [
+    ("r_zip", "res_address_zipcode", "SAME_RZIP"),
+    ("full_name", "full_name", "SAME_FN"),
+    ("date_of_birth", "date_of_birth", "SAME_DOB"),
+    ("res_address", "res_address", "SAME_RA"),
+    ("mail_address", "mail_address", "SAME_MA"),
+    ("email", "email_address", "SAME_EMAIL"),
+    ("email_username", "email_username", "SAME_EMAIL_U"),
+    ("email_tokenised", "email_tokenised", "SAME_EMAIL_T"),
+    ("phone_num", "phone_num", "SAME_PH"),
+    ("itin_no", "itin_number", "SAME_TN"),
+    ("tf_no", "tf_number", "SAME_TF"),
+    ("dl_no", "dl_id_number", "SAME_DL"),
+    ("ip_address", "register_ip_address", "SAME_IP"),
+    ("rec_id", "rec_id_number", "SAME_RECID"),
+    ("fp_no", "foreign_passport_number", "SAME_FPNO"),
+    ("usp_id", "us_passport_document_id", "SAME_USPID"),
+]
+
+
+def create_constraints(driver):
+  """
+  Creates uniqueness constraints (which are backed by an index) on claim_id
+  and on the attribute node keys, and an index on processed_flag.
+  Safe to call on every start.
+  """
+  statements = [
+      "CREATE CONSTRAINT claim_claim_id IF NOT EXISTS "
+      "ON (c:claim) ASSERT c.claim_id IS UNIQUE",
+      "CREATE INDEX claim_processed_flag IF NOT EXISTS "
+      "FOR (c:claim) ON (c.processed_flag)",
+  ]
+  for label, key, _ in LINK_ATTRIBUTES:
+    statements.append(f"CREATE CONSTRAINT {label}_{key} IF NOT EXISTS "
+                      f"ON (n:{label}) ASSERT n.{key} IS UNIQUE")
+  with driver.session() as graph_session:
+    for statement in statements:
+      graph_session.run(statement)
+  logger.info(f"create_constraints - ensured {len(statements)} "
+              f"constraints/indexes")
+
+
+def link_claims(tx, claim_ids: List[str]):
+  """Links the claims with every claim sharing an attribute value."""
+  for label, key, relationship in LINK_ATTRIBUTES:
+    # Empty (or blank) values are not a match
+    tx.run(f"""
+      UNWIND $claim_ids AS claim_id
+      MATCH (c1:claim {{claim_id: claim_id}})-[:ATTACHED_TO]-(a:{label})
+      WHERE trim(a.{key}) <> ""
+      MATCH (a)-[:ATTACHED_TO]-(c2:claim)
+      WHERE c1 <> c2
+      MERGE (c1)-[:{relationship}]-(c2)
+    """,
+           parameters={"claim_ids": claim_ids})
+
+  tx.run("""
+    UNWIND $claim_ids AS claim_id
+    MATCH (c:claim {claim_id: claim_id})
+    SET c.processed_flag = "true"
+  """,
+         parameters={"claim_ids": claim_ids})
+
+
+def get_pending_claim_ids(tx, limit: int) -> List[str]:
+  result = tx.run("""
+    MATCH (c:claim {processed_flag: "false"})
+    RETURN c.claim_id AS claim_id
+    LIMIT $limit
+  """,
+                  parameters={"limit": limit})
+  return [record["claim_id"] for record in result]
+
+
+def link_pending_claims(driver, batch_size: int = NEO4J_BATCH_SIZE) -> int:
+  """
+  Links all claims written since the last run, batch_size claims per
+  transaction. Returns the number of linked claims.
+  """
+  start_time = time.time()
+  linked = 0
+  with driver.session() as graph_session:
+    while True:
+      claim_ids = graph_session.read_transaction(get_pending_claim_ids,
+                                                 batch_size)
+      if not claim_ids:
+        break
+      graph_session.write_transaction(link_claims, claim_ids)
+      linked += len(claim_ids)
+  logger.info(f"link_pending_claims - linked {linked} claims in "
+              f"{round((time.time() - start_time) * 1000)} ms")
+  return linked
@@ -18,18 +18,46 @@ limitations under the License.
 neo4j script to handle new claims via API and insert real time
 """
 
+import functools
 import os
 import re
-import pandas as pd
-from common.config import NEO4J_URI, DOCUMENT_DICT
+import threading
+from typing import Dict, List, Tuple
+from common.config import NEO4J_URI, DOCUMENT_DICT, NEO4J_BATCH_SIZE, \
+  NEO4J_MAX_CONNECTION_POOL_SIZE, NEO4J_LINK_ON_WRITE
+from common.utils import neo4j_claim_linking
+from common.utils.logging_handler import Logger
 from neo4j import GraphDatabase
 from google.cloud import secretmanager
 
 PROJECT_ID = os.environ.get("PROJECT_ID", os.environ.get("PROJECT_ID", ""))
 DATABASE_PREFIX = os.getenv("DATABASE_PREFIX", "")
 
+logger = Logger.get_logger(__name__)
 
-def authenticate_neo4j(neo4j_uri=NEO4J_URI):
+# Long-lived driver with its own connection pool, shared by all requests
+drivers = {}
+drivers_lock = threading.Lock()
+
+CLAIM_FIELDS = [
+    "claim_id", "full_name", "date_of_birth", "res_address", "mail_address",
+    "res_address_zipcode", "email_address", "email_username",
+    "email_tokenised", "phone_num", "itin_number", "tf_number",
+    "driver_license_id_number", "register_ip_address", "rec_id_number",
+    "foreign_passport_number", "us_passport_document_id"
+]
+
+# document_details key -> (claim field, id field inside the document)
+ID_DOCUMENT_FIELDS = {
+    "driver_license": ("driver_license_id_number", "id_number"),
+    "rec_id": ("rec_id_number", "id_number"),
+    "foreign_passport": ("foreign_passport_number", "passport_number"),
+    "us_passport": ("us_passport_document_id", "document_id"),
+}
+
+
+@functools.lru_cache(maxsize=1)
+def get_neo4j_credentials() -> Tuple[str, str]:
   client = secretmanager.SecretManagerServiceClient()
 
   # pylint: disable-next = line-too-long
@@ -41,9 +69,27 @@ def authenticate_neo4j(neo4j_uri=NEO4J_URI):
   pw_key = f"projects/{PROJECT_ID}/secrets/{PROJECT_ID}-neo4j-password/versions/latest"
   response = client.access_secret_version(request={"name": pw_key})
   neo4j_password = response.payload.data.decode("UTF-8")
+  return neo4j_user, neo4j_password
+
+
+def authenticate_neo4j(neo4j_uri=NEO4J_URI):
+  """Returns the shared driver for neo4j_uri, created on first use."""
+  with drivers_lock:
+    if neo4j_uri not in drivers:
+      logger.info(f"authenticate_neo4j - creating driver for {neo4j_uri}")
+      drivers[neo4j_uri] = GraphDatabase.driver(
+          neo4j_uri, auth=get_neo4j_credentials(),
+          max_connection_pool_size=NEO4J_MAX_CONNECTION_POOL_SIZE)
+      neo4j_claim_linking.create_constraints(drivers[neo4j_uri])
+    return drivers[neo4j_uri]
+
+
+def close_neo4j():
+  with drivers_lock:
+    for driver in drivers.values():
+      driver.close()
+    drivers.clear()
 
-  graph = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
-  return graph
 
 def map_key_names(claim_dict):
   doc_key_list = []
@@ -61,97 +107,76 @@ def map_key_names(claim_dict):
 
   return claim_dict
 
-def modify_claim_fields(claim_dict):
-  claim_dict = map_key_names(claim_dict)
-  if "driver_license" in claim_dict["document_details"].keys():
-    claim_dict["driver_license_id_number"] = claim_dict["document_details"]\
-    ["driver_license"]["id_number"]
-  else:
-    claim_dict["driver_license_id_number"] = ""
-  if "rec_id" in claim_dict["document_details"].keys():
-    claim_dict["rec_id_number"] = claim_dict["document_details"]\
-      ["rec_id"]["id_number"]
-  else:
-    claim_dict["rec_id_number"] = ""
-  if "foreign_passport" in claim_dict["document_details"].keys():
-    claim_dict["foreign_passport_number"] = claim_dict["document_details"]\
-      ["foreign_passport"]["passport_number"]
-  else:
-    claim_dict["foreign_passport_number"] = ""
-  if "us_passport" in claim_dict["document_details"].keys():
-    claim_dict["us_passport_document_id"] = claim_dict["document_details"]\
-      ["us_passport"]["document_id"]
-  else:
-    claim_dict["us_passport_document_id"] = ""
-  del claim_dict["document_details"]
-
-  new_claim_df = pd.DataFrame([claim_dict], columns=claim_dict.keys())
-  #replace null values
-  new_claim_df.fillna(value="", inplace=True)
-  #create new columns
-  new_claim_df["email_username"] = new_claim_df["email_address"].apply\
-  (lambda x:x.split("@")[0])
-  new_claim_df["email_tokenised"] = new_claim_df["email_username"].apply\
-  (lambda x: re.sub(r"[^A-Za-z]+", "", x).lower())
-  new_claim_df["full_name"] = new_claim_df["first_name"] + " " +\
-  new_claim_df["middle_name"] + " "+ new_claim_df["last_name"]
-  new_claim_df["full_name"] = new_claim_df["full_name"].str.lower()
-  new_claim_df["res_address"] = new_claim_df["res_address_line1"]+" "+\
-  new_claim_df["res_address_line2"]+" "+ new_claim_df["res_address_city"]+" "+\
-  new_claim_df["res_address_state"]
-  new_claim_df["res_address"] = new_claim_df["res_address"].apply\
-  (lambda x: re.sub(" +", " ", x).lower())
-  new_claim_df["mail_address"] = new_claim_df["mail_address_line1"]+" "+\
-  new_claim_df["mail_address_line2"]+" "+new_claim_df["mail_address_city"]+" "+\
-  new_claim_df["mail_address_state"]
-  new_claim_df["mail_address"] = new_claim_df["mail_address"].apply\
-  (lambda x: re.sub(" +", " ", x).lower())
-
-  col_list = [
-      "claim_id", "full_name", "date_of_birth", "res_address", "mail_address",
-      "res_address_zipcode", "email_address", "email_username",
-      "email_tokenised", "phone_num", "itin_number", "tf_number",
-      "driver_license_id_number", "register_ip_address", "rec_id_number",
-      "foreign_passport_number", "us_passport_document_id"
-  ]
-  new_claim_df = new_claim_df[col_list]
-  claim_dict = new_claim_df.to_dict("records")[0]
-  return claim_dict
 
+def get_field(claim_dict: Dict, key: str):
+  """Returns the value with None/NaN replaced by an empty string."""
+  value = claim_dict.get(key)
+  if value is None or value != value:  # NaN
+    return ""
+  return value
+
+
+def collapse_spaces(value: str) -> str:
+  return re.sub(" +", " ", value).lower()
 
-def delete_existing_claim(graph_session, claim_record):
-  graph_session.run("""
-    MATCH (c:claim)
-    WHERE c.claim_id = $claim_id
+
+def modify_claim_fields(claim_dict):
+  claim_dict = dict(claim_dict)
+  claim_dict["document_details"] = dict(claim_dict["document_details"])
+  claim_dict = map_key_names(claim_dict)
+  document_details = claim_dict.pop("document_details")
+  for document_key, (field, id_field) in ID_DOCUMENT_FIELDS.items():
+    if document_key in document_details:
+      claim_dict[field] = document_details[document_key][id_field]
+    else:
+      claim_dict[field] = ""
+
+  field = functools.partial(get_field, claim_dict)
+  email_username = str(field("email_address")).split("@")[0]
+  record = {key: field(key) for key in CLAIM_FIELDS}
+  record["email_username"] = email_username
+  record["email_tokenised"] = re.sub(r"[^A-Za-z]+", "",
+                                     email_username).lower()
+  # Stripped so that missing parts give "" rather than a shared blank value
+  record["full_name"] = f"{field('first_name')} {field('middle_name')} " \
+                        f"{field('last_name')}".lower().strip()
+  record["res_address"] = collapse_spaces(
+      f"{field('res_address_line1')} {field('res_address_line2')} "
+      f"{field('res_address_city')} {field('res_address_state')}").strip()
+  record["mail_address"] = collapse_spaces(
+      f"{field('mail_address_line1')} {field('mail_address_line2')} "
+      f"{field('mail_address_city')} {field('mail_address_state')}").strip()
+  return record
+
+
+def delete_existing_claims(tx, claim_ids: List[str]):
+  tx.run("""
+    UNWIND $claim_ids AS claim_id
+    MATCH (c:claim {claim_id: claim_id})
     DETACH DELETE c
   """,
-                    parameters={"claim_id": claim_record["claim_id"]})
+         parameters={"claim_ids": claim_ids})
 
 
-def add_to_graph(graph_session, claim_record):
-  graph_session.run("""
-    MERGE (c:claim {claim_id:$claim_id})
+def add_to_graph(tx, claim_records: List[Dict]):
+  # Identity document nodes are not created for empty values
+  tx.run("""
+    UNWIND $claims AS row
+    MERGE (c:claim {claim_id:row.claim_id})
     SET c.processed_flag = "false"
-    MERGE (fn:full_name {full_name:$full_name})
-    MERGE (dob:date_of_birth {date_of_birth:$date_of_birth})
-    MERGE (ra:res_address {res_address:$res_address})
-    MERGE (ma:mail_address {mail_address:$mail_address})
-
-    MERGE (rzip: r_zip{res_address_zipcode:$res_address_zipcode})
+    MERGE (fn:full_name {full_name:row.full_name})
+    MERGE (dob:date_of_birth {date_of_birth:row.date_of_birth})
+    MERGE (ra:res_address {res_address:row.res_address})
+    MERGE (ma:mail_address {mail_address:row.mail_address})
 
-    MERGE (e:email {email_address:$email_address})
-    MERGE (eu:email_username {email_username:$email_username})
-    MERGE (et:email_tokenised {email_tokenised:$email_tokenised})
+    MERGE (rzip: r_zip{res_address_zipcode:row.res_address_zipcode})
 
-    MERGE (ph:phone_num {phone_num:$phone_num})
-    MERGE (tn:itin_no {itin_number:$itin_number})
-    MERGE (tf:tf_no {tf_number:$tf_number})
-    MERGE (dl:dl_no {dl_id_number:$dl_id_number})
-    MERGE (ip:ip_address {register_ip_address:$register_ip_address})
+    MERGE (e:email {email_address:row.email_address})
+    MERGE (eu:email_username {email_username:row.email_username})
+    MERGE (et:email_tokenised {email_tokenised:row.email_tokenised})
 
-    MERGE(recid:rec_id {rec_id_number:$rec_id_number})
-    MERGE(fpno:fp_no {foreign_passport_number:$foreign_passport_number})
-    MERGE(uspid:usp_id {us_passport_document_id:$us_passport_document_id})
+    MERGE (ph:phone_num {phone_num:row.phone_num})
+    MERGE (ip:ip_address {register_ip_address:row.register_ip_address})
 
     MERGE (fn)-[:ATTACHED_TO]-(c)
     MERGE (dob)-[:ATTACHED_TO]-(c)
@@ -165,240 +190,90 @@ def add_to_graph(graph_session, claim_record):
     MERGE (et)-[:ATTACHED_TO]-(c)
 
     MERGE (ph)-[:ATTACHED_TO]-(c)
-    MERGE (tn)-[:ATTACHED_TO]-(c)
-    MERGE (tf)-[:ATTACHED_TO]-(c)
-    MERGE (dl)-[:ATTACHED_TO]-(c)
-
-    MERGE(ip)-[:ATTACHED_TO]-(c)
-
-    MERGE (recid)-[:ATTACHED_TO]-(c)
-    MERGE (fpno)-[:ATTACHED_TO]-(c)
-    MERGE (uspid)-[:ATTACHED_TO]-(c)
+    MERGE (ip)-[:ATTACHED_TO]-(c)
+
+    FOREACH (_ IN CASE WHEN row.itin_number <> "" THEN [1] ELSE [] END |
+      MERGE (tn:itin_no {itin_number:row.itin_number})
+      MERGE (tn)-[:ATTACHED_TO]-(c))
+    FOREACH (_ IN CASE WHEN row.tf_number <> "" THEN [1] ELSE [] END |
+      MERGE (tf:tf_no {tf_number:row.tf_number})
+      MERGE (tf)-[:ATTACHED_TO]-(c))
+    FOREACH (_ IN CASE WHEN row.driver_license_id_number <> "" THEN [1] ELSE [] END |
+      MERGE (dl:dl_no {dl_id_number:row.driver_license_id_number})
+      MERGE (dl)-[:ATTACHED_TO]-(c))
+    FOREACH (_ IN CASE WHEN row.rec_id_number <> "" THEN [1] ELSE [] END |
+      MERGE (recid:rec_id {rec_id_number:row.rec_id_number})
+      MERGE (recid)-[:ATTACHED_TO]-(c))
+    FOREACH (_ IN CASE WHEN row.foreign_passport_number <> "" THEN [1] ELSE [] END |
+      MERGE (fpno:fp_no {foreign_passport_number:row.foreign_passport_number})
+      MERGE (fpno)-[:ATTACHED_TO]-(c))
+    FOREACH (_ IN CASE WHEN row.us_passport_document_id <> "" THEN [1] ELSE [] END |
+      MERGE (uspid:usp_id {us_passport_document_id:row.us_passport_document_id})
+      MERGE (uspid)-[:ATTACHED_TO]-(c))
   """,
-                    parameters={
-                        "claim_id":
-                        claim_record["claim_id"],
-                        "full_name":
-                        claim_record["full_name"],
-                        "date_of_birth":
-                        claim_record["date_of_birth"],
-                        "res_address_zipcode":
-                        claim_record["res_address_zipcode"],
-                        "email_address":
-                        claim_record["email_address"],
-                        "email_username":
-                        claim_record["email_username"],
-                        "email_tokenised":
-                        claim_record["email_tokenised"],
-                        "phone_num":
-                        claim_record["phone_num"],
-                        "itin_number":
-                        claim_record["itin_number"],
-                        "tf_number":
-                        claim_record["tf_number"],
-                        "dl_id_number":
-                        claim_record["driver_license_id_number"],
-                        "register_ip_address":
-                        claim_record["register_ip_address"],
-                        "rec_id_number":
-                        claim_record["rec_id_number"],
-                        "foreign_passport_number":
-                        claim_record["foreign_passport_number"],
-                        "us_passport_document_id":
-                        claim_record["us_passport_document_id"],
-                        "res_address":
-                        claim_record["res_address"],
-                        "mail_address":
-                        claim_record["mail_address"]
-                    })
-
-
-def delete_empty_nodes(graph_session, claim_record):
-  #delete empty nodes
-  graph_session.run("""
-    MATCH (tf:tf_no {tf_number: ""})-[]-(c:claim)
-    WHERE c.claim_id = $claim_id
-    WITH tf as tf
-    DETACH DELETE tf
-    """,
-                    parameters={"claim_id": claim_record["claim_id"]})
-
-  graph_session.run("""
-    MATCH (tn:itin_no {itin_number: ""})-[]-(c:claim)
-    WHERE c.claim_id = $claim_id
-    WITH tn as tn
-    DETACH DELETE tn
-    """,
-                    parameters={"claim_id": claim_record["claim_id"]})
-
-  graph_session.run("""
-    MATCH (dl:dl_no {dl_id_number: ""})-[]-(c:claim)
-    WHERE c.claim_id = $claim_id
-    WITH dl as dl
-    DETACH DELETE dl
-    """,
-                    parameters={"claim_id": claim_record["claim_id"]})
-
-  graph_session.run("""
-    MATCH (recid:rec_id {rec_id_number: ""})-[]-(c:claim)
-    WHERE c.claim_id = $claim_id
-    WITH recid as recid
-    DETACH DELETE recid
-    """,
-                    parameters={"claim_id": claim_record["claim_id"]})
-
-  graph_session.run("""
-    MATCH (fpno:fp_no {foreign_passport_number: ""})-[]-(c:claim)
-    WHERE c.claim_id = $claim_id
-    WITH fpno as fpno
-    DETACH DELETE fpno
-    """,
-                    parameters={"claim_id": claim_record["claim_id"]})
-
-  graph_session.run("""
-    MATCH (uspid:usp_id {us_passport_document_id: ""})-[]-(c:claim)
-    WHERE c.claim_id = $claim_id
-    WITH uspid as uspid
-    DETACH DELETE uspid
-    """,
-                    parameters={"claim_id": claim_record["claim_id"]})
-
+         parameters={"claims": claim_records})
 
-def connect_claims_in_graph(graph_session, claim_id):
-  graph_session.run("""
-    MATCH (c1:claim)-[]-(rzip:r_zip)-[]-(c2:claim)
-    WHERE c1.claim_id = $claim_id
-    MERGE (c1)-[:SAME_RZIP]-(c2)
 
-    UNION ALL
+def batches(items: List, batch_size: int = NEO4J_BATCH_SIZE):
+  for i in range(0, len(items), batch_size):
+    yield items[i:i + batch_size]
 
-    MATCH (c1:claim)-[]-(fn:full_name)-[]-(c2:claim)
-    WHERE c1.claim_id = $claim_id
-    MERGE (c1)-[:SAME_FN]-(c2)
 
-    UNION ALL
+def write_claims(claim_records: List[Dict], replace_existing: bool):
+  """Writes claim records, NEO4J_BATCH_SIZE claims per transaction."""
 
-    MATCH (c1:claim)-[]-(dob:date_of_birth)-[]-(c2:claim)
-    WHERE c1.claim_id = $claim_id
-    MERGE (c1)-[:SAME_DOB]-(c2)
+  def write_batch(tx, batch):
+    if replace_existing:
+      delete_existing_claims(tx, [r["claim_id"] for r in batch])
+    add_to_graph(tx, batch)
 
-    UNION ALL
+  with authenticate_neo4j().session() as graph_session:
+    for batch in batches(claim_records):
+      graph_session.write_transaction(write_batch, batch)
+      if NEO4J_LINK_ON_WRITE:
+        graph_session.write_transaction(neo4j_claim_linking.link_claims,
+                                        [r["claim_id"] for r in batch])
+  logger.info(f"write_claims - wrote {len(claim_records)} claims, "
+              f"replace_existing={replace_existing}")
 
-    MATCH (c1:claim)-[]-(ra:res_address)-[]-(c2:claim)
-    WHERE c1.claim_id = $claim_id
-    MERGE (c1)-[:SAME_RA]-(c2)
 
-    UNION ALL
-
-    MATCH (c1:claim)-[]-(ma:mail_address)-[]-(c2:claim)
-    WHERE c1.claim_id = $claim_id
-    MERGE (c1)-[:SAME_MA]-(c2)
-
-    UNION ALL
-
-    MATCH (c1:claim)-[]-(e:email)-[]-(c2:claim)
-    WHERE c1.claim_id = $claim_id
-    MERGE (c1)-[:SAME_EMAIL]-(c2)
-
-    UNION ALL
-
-    MATCH (c1:claim)-[]-(eu:email_username)-[]-(c2:claim)
-    WHERE c1.claim_id = $claim_id
-    MERGE (c1)-[:SAME_EMAIL_U]-(c2)
-
-    UNION ALL
-
-    MATCH (c1:claim)-[]-(et:email_tokenised)-[]-(c2:claim)
-    WHERE c1.claim_id = $claim_id
-    MERGE (c1)-[:SAME_EMAIL_T]-(c2)
-
-    UNION ALL
-
-    MATCH (c1:claim)-[]-(ph:phone_num)-[]-(c2:claim)
-    WHERE c1.claim_id = $claim_id
-    MERGE (c1)-[:SAME_PH]-(c2)
-
-    UNION ALL
-
-    MATCH (c1:claim)-[]-(tn:itin_no)-[]-(c2:claim)
-    WHERE c1.claim_id = $claim_id
-    MERGE (c1)-[:SAME_TN]-(c2)
-
-    UNION ALL
-
-    MATCH (c1:claim)-[]-(tf:tf_no)-[]-(c2:claim)
-    WHERE c1.claim_id = $claim_id
-    MERGE (c1)-[:SAME_TF]-(c2)
-
-    UNION ALL
-
-    MATCH (c1:claim)-[]-(dl:dl_no)-[]-(c2:claim)
-    WHERE c1.claim_id = $claim_id
-    MERGE (c1)-[:SAME_DL]-(c2)
-
-    UNION ALL
-
-    MATCH (c1:claim)-[]-(ip:ip_address)-[]-(c2:claim)
-    WHERE c1.claim_id = $claim_id
-    MERGE (c1)-[:SAME_IP]-(c2)
-
-    UNION ALL
+def connect_claims_in_graph(graph_session, claim_id):
+  graph_session.write_transaction(neo4j_claim_linking.link_claims, [claim_id])
 
-    MATCH (c1:claim)-[]-(recid:rec_id)-[]-(c2:claim)
-    WHERE c1.claim_id = $claim_id
-    MERGE (c1)-[:SAME_RECID]-(c2)
 
-    UNION ALL
+def clean_graph_db():
+  with authenticate_neo4j().session() as graph_session:
+    graph_session.run("""
+      MATCH (n)
+      WHERE NOT (n:claim) AND NOT (n)-[]-(:claim)
+      DELETE n
+      """)
 
-    MATCH (c1:claim)-[]-(fpno:fp_no)-[]-(c2:claim)
-    WHERE c1.claim_id = $claim_id
-    MERGE (c1)-[:SAME_FPNO]-(c2)
 
-    UNION ALL
+def create_claims_neo4j(claim_dicts: List[Dict]):
+  write_claims([modify_claim_fields(c) for c in claim_dicts],
+               replace_existing=False)
 
-    MATCH (c1:claim)-[]-(uspid:usp_id)-[]-(c2:claim)
-    WHERE c1.claim_id = $claim_id
-    MERGE (c1)-[:SAME_USPID]-(c2)
 
-    UNION ALL
+def update_claims_neo4j(claim_dicts: List[Dict]):
+  write_claims([modify_claim_fields(c) for c in claim_dicts],
+               replace_existing=True)
 
-    MATCH (c1:claim)
-    WHERE c1.claim_id = $claim_id
-    SET c1.processed_flag = "true"
-  """,
-                    parameters={"claim_id": claim_id})
 
-
-def clean_graph_db():
-  graph = authenticate_neo4j()
-  graph_session = graph.session()
-  graph_session.run("""
-    MATCH (n)
-    WHERE NOT (n:claim) AND NOT (n)-[]-(:claim)
-    DELETE n
-    """)
+def delete_claims_neo4j(claim_dicts: List[Dict]):
+  claim_ids = [c["claim_id"] for c in claim_dicts]
+  with authenticate_neo4j().session() as graph_session:
+    for batch in batches(claim_ids):
+      graph_session.write_transaction(delete_existing_claims, batch)
 
 
 def create_claim_neo4j(claim_dict):
-  claim_dict = modify_claim_fields(claim_dict)
-  graph = authenticate_neo4j()
-  graph_session = graph.session()
-  add_to_graph(graph_session, claim_dict)
-  delete_empty_nodes(graph_session, claim_dict)
-  #connect_claims_in_graph(graph_session, claim_dict)
+  create_claims_neo4j([claim_dict])
 
 
 def update_claim_neo4j(claim_dict):
-  claim_dict = modify_claim_fields(claim_dict)
-  graph = authenticate_neo4j()
-  graph_session = graph.session()
-  delete_existing_claim(graph_session, claim_dict)
-  add_to_graph(graph_session, claim_dict)
-  delete_empty_nodes(graph_session, claim_dict)
-  #connect_claims_in_graph(graph_session, claim_dict)
+  update_claims_neo4j([claim_dict])
 
 
 def delete_claim_neo4j(claim_dict):
-  graph = authenticate_neo4j()
-  graph_session = graph.session()
-  delete_existing_claim(graph_session, claim_dict)
+  delete_claims_neo4j([claim_dict])
@@ -0,0 +1,79 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+  Tests claim field normalization for the neo4j graph
+"""
+import os
+from .neo4j_new_incoming_claim import CLAIM_FIELDS, batches, \
+  modify_claim_fields
+
+# disabling pylint rules that conflict with pytest fixtures
+# pylint: disable=unused-argument,redefined-outer-name,unused-import
+
+os.environ["FIRESTORE_EMULATOR_HOST"] = "localhost:8080"
+os.environ["GOOGLE_CLOUD_PROJECT"] = "fake-project"
+
+
+def test_modify_claim_fields():
+  claim = {
+      "claim_id": "c-1",
+      "first_name": "Jane",
+      "middle_name": None,
+      "last_name": "Doe",
+      "date_of_birth": "1980-01-01",
+      "email_address": "Jane.Doe_80@example.com",
+      "res_address_line1": "1  Main St",
+      "res_address_line2": "",
+      "res_address_city": "Austin",
+      "res_address_state": "TX",
+      "res_address_zipcode": "73301",
+      "mail_address_line1": "PO Box 1",
+      "mail_address_line2": None,
+      "mail_address_city": "Austin",
+      "mail_address_state": "TX",
+      "phone_num": "5550100",
+      "itin_number": None,
+      "tf_number": "",
+      "register_ip_address": "10.0.0.1",
+      "document_details": {"driver_license": {"id_number": "D123"}},
+  }
+  record = modify_claim_fields(claim)
+  assert sorted(record.keys()) == sorted(CLAIM_FIELDS)
+  assert record["full_name"] == "jane  doe"
+  assert record["email_username"] == "Jane.Doe_80"
+  assert record["email_tokenised"] == "janedoe"
+  assert record["res_address"] == "1 main st austin tx"
+  assert record["mail_address"] == "po box 1 austin tx"
+  assert record["driver_license_id_number"] == "D123"
+  assert record["us_passport_document_id"] == ""
+  assert record["itin_number"] == ""
+  # Input claim is not modified
+  assert "document_details" in claim
+
+
+def test_modify_claim_fields_empty_name_and_address():
+  claim = {key: None for key in CLAIM_FIELDS}
+  claim["claim_id"] = "c-2"
+  claim["document_details"] = {}
+  record = modify_claim_fields(claim)
+  assert record["full_name"] == ""
+  assert record["res_address"] == ""
+  assert record["mail_address"] == ""
+
+
+def test_batches():
+  assert list(batches([1, 2, 3, 4, 5], 2)) == [[1, 2], [3, 4], [5]]
@@ -0,0 +1,308 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Chunking of PDFs over the DocAI processor limits.
+
+A pre-flight check reads the size from the blob metadata and, only when the
+size does not decide it already, the page count. The PDF is opened straight
+from GCS, so pikepdf fetches just the byte ranges it parses (trailer, cross
+reference table and page tree) instead of the whole file. Documents over
+DOCAI_MAX_PAGES_PER_DOCUMENT or DOCAI_MAX_BYTES_PER_DOCUMENT are downloaded,
+split into page range chunks, written to the DocAI output bucket as
+gs://<output bucket>/chunks/<document path>/<start>-<end>_<file name>
+(removed by a bucket lifecycle rule) and sent to DocAI instead of the
+document, so all chunks are processed in parallel by the same batch
+operation.
+
+The resulting Documents are stitched back into one Document per original
+document (text offsets, page numbers and page references are shifted),
+before classification splitting and extraction mapping run on them.
+"""
+import io
+import math
+import posixpath
+import re
+import tempfile
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from google.cloud import documentai_v1 as documentai
+from google.cloud import storage
+from google.protobuf.descriptor import FieldDescriptor
+from pikepdf import Pdf
+
+from common.config import DOCAI_CHUNK_PAGES
+from common.config import DOCAI_MAX_BYTES_PER_DOCUMENT
+from common.config import DOCAI_MAX_PAGES_PER_DOCUMENT
+from common.config import PDF_MIME_TYPE
+from common.utils.helper import split_uri_2_bucket_prefix
+from common.utils.logging_handler import Logger
+
+logger = Logger.get_logger(__name__)
+
+CHUNKS_FOLDER = "chunks"
+# Blob metadata of a chunk pointing back to the original document
+SOURCE_URI_METADATA = "source_uri"
+# page count of the original document, to detect missing last chunks
+PAGE_COUNT_METADATA = "page_count"
+CHUNK_URI_PATTERN = re.compile(
+    rf"^gs://([^/]+)/{CHUNKS_FOLDER}/(?:(.+)/)?(\d{{5,}})-(\d{{5,}})_([^/]+)$")
+# Bytes fetched per ranged read while pikepdf parses a PDF in GCS
+RANGE_READ_BYTES = 256 * 1024
+
+storage_client = None
+
+
+def get_storage_client():
+  global storage_client
+  if not storage_client:
+    storage_client = storage.Client()
+  return storage_client
+
+
+def is_chunking_enabled() -> bool:
+  return DOCAI_MAX_PAGES_PER_DOCUMENT > 0
+
+
+def get_chunk_ranges(page_count: int, size: int) -> List[Tuple[int, int]]:
+  """
+  Returns 1-based, inclusive page ranges to process a document with.
+  A single range is returned when the document is within the limits,
+  otherwise pages are spread evenly over the fewest chunks that are each
+  within DOCAI_CHUNK_PAGES and (approximately) DOCAI_MAX_BYTES_PER_DOCUMENT.
+  """
+  if page_count <= 0:
+    return []
+  if not is_chunking_enabled() or (
+      page_count <= DOCAI_MAX_PAGES_PER_DOCUMENT and
+      size <= DOCAI_MAX_BYTES_PER_DOCUMENT):
+    return [(1, page_count)]
+
+  chunk_pages = min(DOCAI_CHUNK_PAGES,
+                    DOCAI_MAX_PAGES_PER_DOCUMENT) or DOCAI_MAX_PAGES_PER_DOCUMENT
+  chunk_count = max(math.ceil(page_count / chunk_pages),
+                    math.ceil(size / DOCAI_MAX_BYTES_PER_DOCUMENT))
+  chunk_count = min(chunk_count, page_count)
+  step = math.ceil(page_count / chunk_count)
+  return [(start, min(start + step - 1, page_count))
+          for start in range(1, page_count + 1, step)]
+
+
+def get_chunk_uri(uri: str, output_bucket: str, start: int, end: int) -> str:
+  _, blob_name = split_uri_2_bucket_prefix(uri)
+  dirs, file_name = posixpath.split(blob_name)
+  chunk_name = posixpath.join(CHUNKS_FOLDER, dirs,
+                              f"{start:05d}-{end:05d}_{file_name}")
+  return f"gs://{output_bucket}/{chunk_name}"
+
+
+def get_chunk_range(chunk_uri: str) -> Optional[Tuple[int, int]]:
+  """Returns the page range of a chunk uri, None for any other uri"""
+  match = CHUNK_URI_PATTERN.match(chunk_uri)
+  if not match:
+    return None
+  return int(match.group(3)), int(match.group(4))
+
+
+def get_document_path_uri(uri: str) -> str:
+  """
+  For a chunk uri returns it without the chunks folder and page range, so
+  the case_id and uid of the original document can be parsed from it
+  (helper.get_id_from_file_path). Other uris are returned as they are.
+  """
+  match = CHUNK_URI_PATTERN.match(uri)
+  if not match:
+    return uri
+  bucket_name, dirs, _, _, file_name = match.groups()
+  return f"gs://{bucket_name}/{posixpath.join(dirs or '', file_name)}"
+
+
+def get_chunk_metadata(chunk_uri: str) -> Dict[str, str]:
+  bucket_name, blob_name = split_uri_2_bucket_prefix(chunk_uri)
+  blob = get_storage_client().bucket(bucket_name).get_blob(blob_name)
+  if blob is None or not blob.metadata:
+    return {}
+  return blob.metadata
+
+
+def split_pdf(uri: str, pdf_file: BinaryIO, size: int,
+    output_bucket: str) -> List[str]:
+  """
+  Splits the PDF when it is over the processor limits.
+  Returns the uris of the uploaded chunks, or [uri] when the document can be
+  processed as is.
+  """
+  with Pdf.open(pdf_file) as pdf:
+    ranges = get_chunk_ranges(len(pdf.pages), size)
+    if len(ranges) <= 1:
+      return [uri]
+
+    logger.info(f"split_pdf - Splitting {uri} with {len(pdf.pages)} pages "
+                f"and {size} bytes into {len(ranges)} chunks")
+    bucket = get_storage_client().bucket(output_bucket)
+    chunk_uris = []
+    for start, end in ranges:
+      chunk = Pdf.new()
+      chunk.pages.extend(pdf.pages[start - 1:end])
+      content = io.BytesIO()
+      chunk.save(content)
+      chunk_uri = get_chunk_uri(uri, output_bucket, start, end)
+      _, blob_name = split_uri_2_bucket_prefix(chunk_uri)
+      blob = bucket.blob(blob_name)
+      blob.metadata = {SOURCE_URI_METADATA: uri,
+                       PAGE_COUNT_METADATA: str(len(pdf.pages))}
+      blob.upload_from_string(content.getvalue(), content_type=PDF_MIME_TYPE)
+      chunk_uris.append(chunk_uri)
+    return chunk_uris
+
+
+def get_page_count(blob: storage.Blob) -> int:
+  """Page count of a PDF in GCS, read with ranged requests"""
+  with blob.open("rb", chunk_size=RANGE_READ_BYTES) as reader:
+    with Pdf.open(reader) as pdf:
+      return len(pdf.pages)
+
+
+def split_blob(uri: str, blob: storage.Blob, output_bucket: str) -> List[str]:
+  """
+  Pre-flight check of a document in GCS, see split_pdf.
+  The document is only downloaded when it needs to be split, then into a
+  temporary file, so large PDFs are not held in memory.
+  """
+  if not is_chunking_enabled():
+    return [uri]
+  size = blob.size or 0
+  # over the size limit it is split whatever the page count is
+  if size <= DOCAI_MAX_BYTES_PER_DOCUMENT:
+    if len(get_chunk_ranges(get_page_count(blob), size)) <= 1:
+      return [uri]
+  with tempfile.TemporaryFile() as pdf_file:
+    blob.download_to_file(pdf_file)
+    pdf_file.seek(0)
+    return split_pdf(uri, pdf_file, size, output_bucket)
+
+
+def split_document(uri: str, output_bucket: str) -> List[str]:
+  """Pre-flight check of a document in GCS by uri, see split_blob"""
+  if not is_chunking_enabled():
+    return [uri]
+  bucket_name, blob_name = split_uri_2_bucket_prefix(uri)
+  blob = get_storage_client().bucket(bucket_name).get_blob(blob_name)
+  if blob is None:
+    return [uri]
+  return split_blob(uri, blob, output_bucket)
+
+
+def shift_anchors(message, text_offset: int, page_offset: int):
+  """
+  Shifts text anchors by text_offset characters and page references by
+  page_offset pages, in place, anywhere inside a raw Document proto.
+  """
+  name = message.DESCRIPTOR.name
+  if name == "TextAnchor":
+    for segment in message.text_segments:
+      segment.start_index += text_offset
+      segment.end_index += text_offset
+    return
+  if name == "PageRef":
+    message.page += page_offset
+    return
+  for field, value in message.ListFields():
+    if field.type != FieldDescriptor.TYPE_MESSAGE:
+      continue
+    if field.label == FieldDescriptor.LABEL_REPEATED:
+      if field.message_type.GetOptions().map_entry:
+        continue
+      for item in value:
+        shift_anchors(item, text_offset, page_offset)
+    else:
+      shift_anchors(value, text_offset, page_offset)
+
+
+def stitch_documents(
+    parts: List[Tuple[int, List[documentai.Document]]]) -> documentai.Document:
+  """
+  Stitches Documents of page range chunks into one Document.
+  parts are (first page of the chunk, sharded Documents of the chunk).
+  The given Documents are modified in place.
+  """
+  stitched = documentai.Document.pb(documentai.Document())
+  texts = []
+  text_offset = 0
+  for start, shards in sorted(parts, key=lambda part: part[0]):
+    page_offset = start - 1
+    # text anchors of shards are relative to the text of the whole chunk
+    chunk_text_offset = text_offset
+    for shard in sorted(shards, key=lambda d: int(d.shard_info.shard_index)):
+      shard_pb = documentai.Document.pb(shard)
+      shift_anchors(shard_pb, chunk_text_offset, page_offset)
+      for page in shard_pb.pages:
+        page.page_number += page_offset
+      stitched.pages.extend(shard_pb.pages)
+      stitched.entities.extend(shard_pb.entities)
+      if not stitched.mime_type:
+        stitched.mime_type = shard_pb.mime_type
+      texts.append(shard_pb.text)
+      text_offset += len(shard_pb.text)
+  stitched.text = "".join(texts)
+  return documentai.Document.wrap(stitched)
+
+
+def stitch_chunks(documents: Dict[str, List[documentai.Document]],
+    source_uris: Optional[Dict[str, str]] = None) \
+    -> Dict[str, List[documentai.Document]]:
+  """
+  Replaces the Documents of chunks in DocAI output (keyed by input uri) with
+  one stitched Document keyed by the original document uri.
+  source_uris maps chunk uris to original uris, the chunk blob metadata is
+  used for chunks not in it.
+  Documents whose chunks do not cover all pages (a chunk failed in the
+  batch operation) are left out of the result, as they are incomplete.
+  """
+  stitched = {}
+  chunks = {}
+  page_counts = {}
+  for uri, docs in documents.items():
+    chunk_range = get_chunk_range(uri)
+    source_uri = None
+    if chunk_range:
+      source_uri = (source_uris or {}).get(uri)
+      if not source_uri:
+        metadata = get_chunk_metadata(uri)
+        source_uri = metadata.get(SOURCE_URI_METADATA)
+        if metadata.get(PAGE_COUNT_METADATA):
+          page_counts[source_uri] = int(metadata[PAGE_COUNT_METADATA])
+    if not source_uri:
+      stitched[uri] = docs
+      continue
+    chunks.setdefault(source_uri, []).append((chunk_range, docs))
+
+  for source_uri, parts in chunks.items():
+    ranges = sorted(chunk_range for chunk_range, _ in parts)
+    covered = all(ranges[i][1] + 1 == ranges[i + 1][0]
+                  for i in range(len(ranges) - 1)) and ranges[0][0] == 1
+    page_count = page_counts.get(source_uri)
+    if page_count is not None and ranges[-1][1] != page_count:
+      covered = False
+    if not covered:
+      logger.error(f"stitch_chunks - Skipping {source_uri}, missing chunks: "
+                   f"got page ranges {ranges} of {page_count} pages")
+      continue
+    logger.info(f"stitch_chunks - Stitching {len(parts)} chunks of "
+                f"{source_uri}")
+    stitched[source_uri] = [stitch_documents(
+        [(chunk_range[0], docs) for chunk_range, docs in parts])]
+  return stitched
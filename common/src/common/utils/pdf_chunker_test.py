@@ -0,0 +1,140 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+  Tests for chunking of oversized PDFs and stitching of DocAI results
+"""
+from unittest import mock
+from google.cloud import documentai_v1 as documentai
+from . import pdf_chunker
+
+# disabling pylint rules that conflict with pytest fixtures
+# pylint: disable=unused-argument,redefined-outer-name,unused-import
+
+SOURCE_URI = "gs://bucket/case-1/uid-1/records.pdf"
+
+
+def get_chunk_document(text: str, page_count: int, entity_page: int,
+    entity_start: int, entity_end: int) -> documentai.Document:
+  return documentai.Document(
+      text=text,
+      pages=[documentai.Document.Page(page_number=i + 1)
+             for i in range(page_count)],
+      entities=[documentai.Document.Entity(
+          type_="diagnosis",
+          mention_text=text[entity_start:entity_end],
+          text_anchor=documentai.Document.TextAnchor(text_segments=[
+              documentai.Document.TextAnchor.TextSegment(
+                  start_index=entity_start, end_index=entity_end)]),
+          page_anchor=documentai.Document.PageAnchor(page_refs=[
+              documentai.Document.PageAnchor.PageRef(page=entity_page)]))])
+
+
+def test_get_chunk_ranges():
+  assert pdf_chunker.get_chunk_ranges(150, 1024) == [(1, 150)]
+  with mock.patch.object(pdf_chunker, "DOCAI_CHUNK_PAGES", 100):
+    assert pdf_chunker.get_chunk_ranges(250, 1024) == [(1, 84), (85, 168),
+                                                       (169, 250)]
+  with mock.patch.object(pdf_chunker, "DOCAI_MAX_BYTES_PER_DOCUMENT", 100):
+    assert pdf_chunker.get_chunk_ranges(10, 250) == [(1, 4), (5, 8), (9, 10)]
+  with mock.patch.object(pdf_chunker, "DOCAI_MAX_PAGES_PER_DOCUMENT", 0):
+    assert pdf_chunker.get_chunk_ranges(500, 1024) == [(1, 500)]
+
+
+def test_get_chunk_uri():
+  chunk_uri = pdf_chunker.get_chunk_uri(SOURCE_URI, "output", 201, 400)
+  assert chunk_uri == \
+         "gs://output/chunks/case-1/uid-1/00201-00400_records.pdf"
+  assert pdf_chunker.get_chunk_range(chunk_uri) == (201, 400)
+  assert pdf_chunker.get_chunk_range(SOURCE_URI) is None
+  assert pdf_chunker.get_document_path_uri(chunk_uri) == \
+         "gs://output/case-1/uid-1/records.pdf"
+  assert pdf_chunker.get_document_path_uri(SOURCE_URI) == SOURCE_URI
+
+
+def test_split_blob_reads_page_count_only_when_needed():
+  blob = mock.MagicMock()
+  blob.size = 1024
+  with mock.patch.object(pdf_chunker, "get_page_count",
+                         return_value=10) as page_count, \
+      mock.patch.object(pdf_chunker, "split_pdf") as split_pdf:
+    assert pdf_chunker.split_blob(SOURCE_URI, blob, "output") == [SOURCE_URI]
+    page_count.assert_called_once_with(blob)
+    blob.download_to_file.assert_not_called()
+    split_pdf.assert_not_called()
+
+    # over the size limit the page count does not matter
+    page_count.reset_mock()
+    with mock.patch.object(pdf_chunker, "DOCAI_MAX_BYTES_PER_DOCUMENT", 100):
+      pdf_chunker.split_blob(SOURCE_URI, blob, "output")
+    page_count.assert_not_called()
+    blob.download_to_file.assert_called_once()
+    split_pdf.assert_called_once()
+
+
+def test_stitch_chunks():
+  first_uri = pdf_chunker.get_chunk_uri(SOURCE_URI, "output", 1, 2)
+  second_uri = pdf_chunker.get_chunk_uri(SOURCE_URI, "output", 3, 4)
+  documents = {
+      second_uri: [get_chunk_document("gamma delta", 2, 1, 6, 11)],
+      first_uri: [get_chunk_document("alpha beta ", 2, 0, 0, 5)],
+      "gs://bucket/case-2/uid-2/other.pdf": [documentai.Document(text="x")],
+  }
+  source_uris = {first_uri: SOURCE_URI, second_uri: SOURCE_URI}
+
+  stitched = pdf_chunker.stitch_chunks(documents, source_uris)
+
+  assert set(stitched.keys()) == {SOURCE_URI,
+                                  "gs://bucket/case-2/uid-2/other.pdf"}
+  assert len(stitched[SOURCE_URI]) == 1
+  document = stitched[SOURCE_URI][0]
+  assert document.text == "alpha beta gamma delta"
+  assert [page.page_number for page in document.pages] == [1, 2, 3, 4]
+  pages = [entity.page_anchor.page_refs[0].page for entity in
+           document.entities]
+  assert pages == [0, 3]
+  for entity in document.entities:
+    segment = entity.text_anchor.text_segments[0]
+    assert document.text[segment.start_index:segment.end_index] == \
+           entity.mention_text
+
+
+def test_stitch_chunks_incomplete():
+  first_uri = pdf_chunker.get_chunk_uri(SOURCE_URI, "output", 1, 2)
+  second_uri = pdf_chunker.get_chunk_uri(SOURCE_URI, "output", 3, 4)
+  third_uri = pdf_chunker.get_chunk_uri(SOURCE_URI, "output", 5, 6)
+  other_uri = "gs://bucket/case-2/uid-2/other.pdf"
+
+  # Middle chunk failed
+  documents = {
+      first_uri: [get_chunk_document("alpha beta ", 2, 0, 0, 5)],
+      third_uri: [get_chunk_document("gamma delta", 2, 1, 6, 11)],
+      other_uri: [documentai.Document(text="x")],
+  }
+  source_uris = {first_uri: SOURCE_URI, third_uri: SOURCE_URI}
+  stitched = pdf_chunker.stitch_chunks(documents, source_uris)
+  assert set(stitched.keys()) == {other_uri}
+
+  # Last chunk failed, the page count comes from the chunk metadata
+  documents = {
+      first_uri: [get_chunk_document("alpha beta ", 2, 0, 0, 5)],
+      second_uri: [get_chunk_document("gamma delta", 2, 1, 6, 11)],
+  }
+  metadata = {pdf_chunker.SOURCE_URI_METADATA: SOURCE_URI,
+              pdf_chunker.PAGE_COUNT_METADATA: "6"}
+  with mock.patch.object(pdf_chunker, "get_chunk_metadata",
+                         return_value=metadata):
+    assert pdf_chunker.stitch_chunks(documents) == {}
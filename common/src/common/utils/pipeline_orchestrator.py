@@ -0,0 +1,338 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Stage based pipeline orchestrator.
+
+Every pipeline stage has its own Pub/Sub topic and a pool of workers pulling
+from it with the stage's own concurrency. Stage state is kept in Firestore as
+PipelineTask records: a stage enqueues the work of the next stage instead of
+calling it, so a slow stage only grows its own backlog and work in flight
+survives restarts. Failed tasks are retried by redelivery and moved to the
+dead letter topic after PIPELINE_MAX_ATTEMPTS attempts. Tasks whose message
+got lost (e.g. publishing failed after the task was stored) are published
+again by a periodic sweep.
+"""
+import asyncio
+import datetime
+import json
+import socket
+import threading
+import traceback
+import uuid
+from concurrent import futures
+from typing import Callable, Dict, Optional
+
+import fireo
+from google.cloud import pubsub_v1
+from google.cloud.pubsub_v1.subscriber.scheduler import ThreadScheduler
+
+from common.config import PROJECT_ID
+from common.config import PROCESS_TIMEOUT_SECONDS
+from common.config import PIPELINE_TOPIC_PREFIX
+from common.config import PIPELINE_MAX_ATTEMPTS
+from common.config import PIPELINE_WORKER_STAGES
+from common.config import PIPELINE_STAGE_CONCURRENCY
+from common.config import PIPELINE_STALE_TASK_SECONDS
+from common.config import PIPELINE_SWEEP_INTERVAL_SECONDS
+from common.models import PipelineTask
+from common.models import TASK_QUEUED, TASK_RUNNING, TASK_SUCCESS
+from common.models import TASK_FAILED, TASK_DEAD_LETTER
+from common.utils import metrics
+from common.utils import priority_scheduler
+from common.utils.logging_handler import Logger
+
+logger = Logger.get_logger(__name__)
+
+STAGE_CLASSIFICATION = "classification"
+STAGE_EXTRACTION = "extraction"
+# validation, matching and auto-approval of extracted documents
+STAGE_VALIDATION = "validation"
+STAGES = [STAGE_CLASSIFICATION, STAGE_EXTRACTION, STAGE_VALIDATION]
+
+DEAD_LETTER_TOPIC = f"{PIPELINE_TOPIC_PREFIX}-dead-letter"
+
+# Results of claiming a task
+CLAIMED = "claimed"
+DONE = "done"
+BUSY = "busy"
+
+REPLICA_ID = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+
+# stage -> handler(payload: dict), may be a coroutine function
+stage_handlers: Dict[str, Callable] = {}
+# stage -> running StageWorker
+workers: Dict[str, "StageWorker"] = {}
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def register_stage_handler(stage: str, handler: Callable):
+  stage_handlers[stage] = handler
+
+
+def utc_now():
+  return datetime.datetime.now(datetime.timezone.utc)
+
+
+def get_topic_id(stage: str) -> str:
+  return f"{PIPELINE_TOPIC_PREFIX}-{stage}"
+
+
+def get_subscription_id(stage: str) -> str:
+  return f"{get_topic_id(stage)}-worker"
+
+
+def get_publisher():
+  global _publisher
+  if _publisher is None:
+    with _publisher_lock:
+      if _publisher is None:
+        _publisher = pubsub_v1.PublisherClient()
+  return _publisher
+
+
+def publish(topic_id: str, message: Dict):
+  publisher = get_publisher()
+  return publisher.publish(publisher.topic_path(PROJECT_ID, topic_id),
+                           json.dumps(message).encode("utf-8"))
+
+
+def enqueue(stage: str, payload: Dict, trace_id: Optional[str] = None) -> str:
+  """Stores a task for the stage and publishes it to the stage topic
+
+  Args:
+    stage (str): one of STAGES
+    payload (dict): JSON serializable arguments of the stage handler
+  Returns:
+    id of the created PipelineTask
+  """
+  task = PipelineTask()
+  task.id = uuid.uuid4().hex
+  task.stage = stage
+  task.status = TASK_QUEUED
+  task.payload = payload
+  task.attempts = 0
+  task.trace_id = trace_id or metrics.get_trace_id()
+  task.priority = priority_scheduler.get_priority()
+  task.updated_timestamp = utc_now()
+  task.save()
+  publish(get_topic_id(stage), {"task_id": task.id}).result()
+  logger.info(f"enqueue - {stage} task {task.id} queued")
+  return task.id
+
+
+@fireo.transactional
+def claim_task_transaction(transaction, task_id: str, owner: str):
+  task = PipelineTask.collection.get(
+      fireo.utils.utils.generateKeyFromId(PipelineTask, task_id),
+      transaction=transaction)
+  if task is None or task.status in [TASK_SUCCESS, TASK_DEAD_LETTER]:
+    return DONE
+  now = utc_now()
+  # also when owned by this replica, e.g. a duplicate delivery of the message
+  if task.status == TASK_RUNNING and \
+      task.lease_expiry and task.lease_expiry > now:
+    return BUSY
+  task.status = TASK_RUNNING
+  task.owner = owner
+  task.attempts = (task.attempts or 0) + 1
+  # Another replica takes the task over when it does not finish in time
+  task.lease_expiry = now + datetime.timedelta(seconds=PROCESS_TIMEOUT_SECONDS)
+  task.updated_timestamp = now
+  task.update(transaction=transaction)
+  return CLAIMED
+
+
+def claim_task(task_id: str) -> str:
+  transaction = fireo.transaction()
+  return claim_task_transaction(transaction, task_id, REPLICA_ID)
+
+
+def finalize_task(task: PipelineTask, status: str,
+    error_detail: Optional[str] = None):
+  task.status = status
+  task.error_detail = error_detail
+  task.lease_expiry = None
+  task.updated_timestamp = utc_now()
+  task.update()
+
+
+def run_handler(handler: Callable, payload: Dict):
+  result = handler(payload)
+  if asyncio.iscoroutine(result):
+    # worker threads have no event loop of their own
+    asyncio.run(result)
+
+
+def run_task(task_id: str) -> bool:
+  """Runs the stage handler of the task
+
+  Returns:
+    True when the message can be acked, False to have it redelivered
+  """
+  claim = claim_task(task_id)
+  if claim == DONE:
+    return True
+  if claim == BUSY:
+    return False
+  task = PipelineTask.find_by_id(task_id)
+  handler = stage_handlers.get(task.stage)
+  metrics.set_trace_id(task.trace_id)
+  priority_scheduler.set_priority(task.priority)
+  try:
+    if not handler:
+      raise ValueError(f"No handler registered for stage {task.stage}")
+    run_handler(handler, task.payload)
+    finalize_task(task, TASK_SUCCESS)
+    return True
+  except Exception as e:
+    err = traceback.format_exc().replace("\n", " ")
+    logger.error(f"run_task - {task.stage} task {task_id} attempt"
+                 f" {task.attempts} failed: {err}")
+    if task.attempts >= PIPELINE_MAX_ATTEMPTS:
+      finalize_task(task, TASK_DEAD_LETTER, str(e))
+      publish(DEAD_LETTER_TOPIC, {"task_id": task_id, "stage": task.stage,
+                                  "error": str(e)})
+      return True
+    finalize_task(task, TASK_FAILED, str(e))
+    return False
+
+
+@fireo.transactional
+def touch_stale_task_transaction(transaction, task_id: str,
+    cutoff: datetime.datetime) -> bool:
+  """Marks a task which is still queued or failed since cutoff as re-sent"""
+  task = PipelineTask.collection.get(
+      fireo.utils.utils.generateKeyFromId(PipelineTask, task_id),
+      transaction=transaction)
+  if task is None or task.status not in [TASK_QUEUED, TASK_FAILED]:
+    return False
+  if task.updated_timestamp and task.updated_timestamp > cutoff:
+    return False
+  task.updated_timestamp = utc_now()
+  task.update(transaction=transaction)
+  return True
+
+
+def touch_stale_task(task_id: str, cutoff: datetime.datetime) -> bool:
+  transaction = fireo.transaction()
+  return touch_stale_task_transaction(transaction, task_id, cutoff)
+
+
+def republish_stale_tasks(stage: str) -> int:
+  """
+  Publishes tasks of the stage again which are queued or failed for longer
+  than PIPELINE_STALE_TASK_SECONDS, so tasks whose message never made it to
+  (or expired in) Pub/Sub are not stuck.
+  Returns the number of re-published tasks.
+  """
+  cutoff = utc_now() - datetime.timedelta(seconds=PIPELINE_STALE_TASK_SECONDS)
+  count = 0
+  for status in [TASK_QUEUED, TASK_FAILED]:
+    for task in PipelineTask.find_by_stage_status(stage, status):
+      if task.updated_timestamp and task.updated_timestamp > cutoff:
+        continue
+      try:
+        if touch_stale_task(task.id, cutoff):
+          publish(get_topic_id(stage), {"task_id": task.id}).result()
+          count += 1
+      except Exception as e:
+        logger.error(f"republish_stale_tasks - Failed to re-publish {stage} "
+                     f"task {task.id}: {e}")
+  if count:
+    logger.info(f"republish_stale_tasks - Re-published {count} {stage} "
+                f"task(s)")
+  return count
+
+
+async def sweep_tasks():
+  """Background loop started on service startup"""
+  loop = asyncio.get_running_loop()
+  while True:
+    await asyncio.sleep(PIPELINE_SWEEP_INTERVAL_SECONDS)
+    for stage in list(workers):
+      try:
+        await loop.run_in_executor(None, republish_stale_tasks, stage)
+      except Exception as e:
+        logger.error(f"sweep_tasks - {e}")
+
+
+class StageWorker:
+  """Pulls the tasks of one stage and runs them with bounded concurrency"""
+
+  def __init__(self, stage: str, concurrency: int):
+    self.stage = stage
+    self.concurrency = concurrency
+    self.subscriber = None
+    self.streaming_pull_future = None
+
+  def handle_message(self, message):
+    try:
+      task_id = json.loads(message.data.decode("utf-8"))["task_id"]
+      acked = run_task(task_id)
+    except Exception:
+      err = traceback.format_exc().replace("\n", " ")
+      logger.error(f"handle_message - {self.stage} message"
+                   f" {message.message_id} failed: {err}")
+      acked = False
+    if acked:
+      message.ack()
+    else:
+      message.nack()
+
+  def start(self):
+    self.subscriber = pubsub_v1.SubscriberClient()
+    subscription_path = self.subscriber.subscription_path(
+        PROJECT_ID, get_subscription_id(self.stage))
+    flow_control = pubsub_v1.types.FlowControl(
+        max_messages=self.concurrency,
+        max_lease_duration=PROCESS_TIMEOUT_SECONDS)
+    scheduler = ThreadScheduler(
+        futures.ThreadPoolExecutor(max_workers=self.concurrency))
+    self.streaming_pull_future = self.subscriber.subscribe(
+        subscription_path,
+        callback=self.handle_message,
+        flow_control=flow_control,
+        scheduler=scheduler)
+    logger.info(f"start - {self.stage} worker pulling from"
+                f" {subscription_path} with concurrency {self.concurrency}")
+
+  def stop(self):
+    if self.streaming_pull_future is None:
+      return
+    self.streaming_pull_future.cancel()
+    self.streaming_pull_future.result()
+    self.subscriber.close()
+    self.streaming_pull_future = None
+
+
+def start_workers():
+  """Starts a worker for every registered stage this deployment runs"""
+  for stage in stage_handlers:
+    if PIPELINE_WORKER_STAGES and stage not in PIPELINE_WORKER_STAGES:
+      continue
+    if stage in workers:
+      continue
+    worker = StageWorker(stage, PIPELINE_STAGE_CONCURRENCY.get(stage, 1))
+    worker.start()
+    workers[stage] = worker
+
+
+def stop_workers():
+  for stage in list(workers):
+    workers.pop(stage).stop()
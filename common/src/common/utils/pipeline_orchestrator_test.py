@@ -0,0 +1,115 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+  Tests for the pipeline orchestrator
+"""
+import datetime
+from unittest import mock
+from common.models import TASK_SUCCESS, TASK_FAILED, TASK_DEAD_LETTER
+from common.models import TASK_QUEUED
+from . import pipeline_orchestrator
+
+# disabling pylint rules that conflict with pytest fixtures
+# pylint: disable=unused-argument,redefined-outer-name,unused-import
+
+
+def get_task(attempts):
+  task = mock.MagicMock()
+  task.stage = "test_stage"
+  task.payload = {"uid": "uid1"}
+  task.attempts = attempts
+  task.trace_id = None
+  return task
+
+
+def run_task(task, handler, claim=pipeline_orchestrator.CLAIMED):
+  pipeline_orchestrator.register_stage_handler("test_stage", handler)
+  with mock.patch.object(pipeline_orchestrator, "claim_task",
+                         return_value=claim), \
+      mock.patch.object(pipeline_orchestrator, "PipelineTask") as model, \
+      mock.patch.object(pipeline_orchestrator, "finalize_task") as finalize, \
+      mock.patch.object(pipeline_orchestrator, "publish") as publish:
+    model.find_by_id.return_value = task
+    acked = pipeline_orchestrator.run_task("task1")
+  return acked, finalize, publish
+
+
+def test_run_task_success():
+  handler = mock.MagicMock()
+  task = get_task(1)
+  acked, finalize, publish = run_task(task, handler)
+  assert acked
+  handler.assert_called_once_with({"uid": "uid1"})
+  finalize.assert_called_once_with(task, TASK_SUCCESS)
+  publish.assert_not_called()
+
+
+def test_run_task_async_handler():
+  calls = []
+
+  async def handler(payload):
+    calls.append(payload)
+
+  acked, _, _ = run_task(get_task(1), handler)
+  assert acked
+  assert calls == [{"uid": "uid1"}]
+
+
+def test_run_task_retry_and_dead_letter():
+  handler = mock.MagicMock(side_effect=ValueError("failed"))
+  acked, finalize, publish = run_task(get_task(1), handler)
+  assert not acked
+  assert finalize.call_args[0][1] == TASK_FAILED
+  publish.assert_not_called()
+
+  attempts = pipeline_orchestrator.PIPELINE_MAX_ATTEMPTS
+  acked, finalize, publish = run_task(get_task(attempts), handler)
+  assert acked
+  assert finalize.call_args[0][1] == TASK_DEAD_LETTER
+  assert publish.call_args[0][0] == pipeline_orchestrator.DEAD_LETTER_TOPIC
+
+
+def test_run_task_claimed_elsewhere():
+  handler = mock.MagicMock()
+  acked, _, _ = run_task(get_task(1), handler, pipeline_orchestrator.BUSY)
+  assert not acked
+  acked, _, _ = run_task(get_task(1), handler, pipeline_orchestrator.DONE)
+  assert acked
+  handler.assert_not_called()
+
+
+def test_republish_stale_tasks():
+  now = pipeline_orchestrator.utc_now()
+  stale = get_task(0)
+  stale.id = "stale"
+  stale.updated_timestamp = now - datetime.timedelta(days=1)
+  recent = get_task(0)
+  recent.id = "recent"
+  recent.updated_timestamp = now
+
+  def find_by_stage_status(stage, status):
+    return [stale, recent] if status == TASK_QUEUED else []
+
+  with mock.patch.object(pipeline_orchestrator, "PipelineTask") as model, \
+      mock.patch.object(pipeline_orchestrator, "touch_stale_task",
+                        return_value=True) as touch, \
+      mock.patch.object(pipeline_orchestrator, "publish") as publish:
+    model.find_by_stage_status.side_effect = find_by_stage_status
+    assert pipeline_orchestrator.republish_stale_tasks("test_stage") == 1
+  assert touch.call_args[0][0] == "stale"
+  publish.assert_called_once_with(
+      pipeline_orchestrator.get_topic_id("test_stage"), {"task_id": "stale"})
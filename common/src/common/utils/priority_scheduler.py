@@ -0,0 +1,187 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Priority lanes for pipeline work.
+
+Work runs in one of three lanes: interactive (HITL reclassification and
+reassign of a single document), standard (uploads) and bulk (start pipeline
+backlogs). A PriorityScheduler bounds how much work of a kind runs at the
+same time and hands free slots to the highest waiting lane first, while
+part of the capacity is reserved for interactive work so a reviewer's fix
+never waits behind a backlog.
+
+The lane of the current work travels like the trace_id: in a context
+variable, the X-Priority HTTP header and the "priority" of Pub/Sub configs.
+Queue depth, in flight count and wait time per lane are exported as
+Prometheus metrics.
+"""
+import collections
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from prometheus_client import Gauge, Histogram
+
+from common.config import PRIORITY_CAPACITY
+from common.config import PRIORITY_INTERACTIVE_RESERVED_RATIO
+
+SERVICE_NAME = os.getenv("SERVICE_NAME", "cda")
+PRIORITY_HEADER = "X-Priority"
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_STANDARD = "standard"
+PRIORITY_BULK = "bulk"
+# Highest priority first
+LANES = [PRIORITY_INTERACTIVE, PRIORITY_STANDARD, PRIORITY_BULK]
+
+# Scheduled kinds of work
+SCHEDULER_DOCAI = "docai"
+SCHEDULER_DOCAI_LRO = "docai_lro"
+SCHEDULER_POSTPROCESS = "postprocess"
+SCHEDULER_STATUS = "status"
+
+QUEUE_DEPTH = Gauge("cda_priority_queue_depth",
+                    "Work items waiting for a slot", ["service", "scheduler",
+                                                      "lane"])
+IN_FLIGHT = Gauge("cda_priority_in_flight", "Work items holding a slot",
+                  ["service", "scheduler", "lane"])
+WAIT_DURATION = Histogram(
+    "cda_priority_wait_seconds", "Time spent waiting for a slot",
+    ["service", "scheduler", "lane"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 600))
+
+priority_var = contextvars.ContextVar("priority", default=None)
+
+
+def normalize_priority(priority: Optional[str]) -> str:
+  return priority if priority in LANES else PRIORITY_STANDARD
+
+
+def get_priority() -> str:
+  return normalize_priority(priority_var.get())
+
+
+def set_priority(priority: Optional[str]):
+  priority_var.set(normalize_priority(priority) if priority else None)
+
+
+def priority_headers(priority: Optional[str] = None) -> Dict[str, str]:
+  """HTTP headers propagating the lane to the next service"""
+  priority = priority or priority_var.get()
+  return {PRIORITY_HEADER: priority} if priority else {}
+
+
+class PriorityScheduler:
+  """Bounded slots handed out by lane priority, FIFO within a lane.
+
+  Lanes other than interactive together use at most capacity - reserved
+  slots, the reserved slots are only taken by interactive work.
+  """
+
+  def __init__(self, name: str, capacity: int, reserved: int):
+    self.name = name
+    self.capacity = max(capacity, 1)
+    self.reserved = min(max(reserved, 0), self.capacity - 1)
+    self.condition = threading.Condition()
+    self.waiting = {lane: collections.deque() for lane in LANES}
+    self.in_flight = {lane: 0 for lane in LANES}
+
+  def can_run(self, lane: str, ticket) -> bool:
+    if self.waiting[lane][0] is not ticket:
+      return False
+    used = sum(self.in_flight.values())
+    if used >= self.capacity:
+      return False
+    if lane != PRIORITY_INTERACTIVE and used - self.in_flight[
+        PRIORITY_INTERACTIVE] >= self.capacity - self.reserved:
+      return False
+    # a waiting higher lane gets the slot first
+    for higher in LANES[:LANES.index(lane)]:
+      if self.waiting[higher]:
+        return False
+    return True
+
+  def acquire(self, priority: Optional[str] = None,
+      timeout: Optional[float] = None) -> str:
+    """Waits for a slot, raises TimeoutError after timeout seconds"""
+    lane = normalize_priority(priority or get_priority())
+    ticket = object()
+    start_time = time.perf_counter()
+    with self.condition:
+      self.waiting[lane].append(ticket)
+      QUEUE_DEPTH.labels(SERVICE_NAME, self.name, lane).inc()
+      try:
+        if not self.condition.wait_for(lambda: self.can_run(lane, ticket),
+                                       timeout):
+          raise TimeoutError(f"Timed out waiting for a {self.name} slot")
+      finally:
+        self.waiting[lane].remove(ticket)
+        QUEUE_DEPTH.labels(SERVICE_NAME, self.name, lane).dec()
+        # the next waiter of the lane may be able to run now
+        self.condition.notify_all()
+      self.in_flight[lane] += 1
+    IN_FLIGHT.labels(SERVICE_NAME, self.name, lane).inc()
+    WAIT_DURATION.labels(SERVICE_NAME, self.name, lane).observe(
+        time.perf_counter() - start_time)
+    return lane
+
+  def release(self, lane: str):
+    with self.condition:
+      self.in_flight[lane] -= 1
+      self.condition.notify_all()
+    IN_FLIGHT.labels(SERVICE_NAME, self.name, lane).dec()
+
+  @contextlib.contextmanager
+  def slot(self, priority: Optional[str] = None):
+    lane = self.acquire(priority)
+    try:
+      yield lane
+    finally:
+      self.release(lane)
+
+  @contextlib.asynccontextmanager
+  async def async_slot(self, priority: Optional[str] = None):
+    lane = await run_in_threadpool(self.acquire,
+                                   priority or get_priority())
+    try:
+      yield lane
+    finally:
+      self.release(lane)
+
+  def stats(self) -> Dict[str, Dict[str, int]]:
+    with self.condition:
+      return {lane: {"queue_depth": len(self.waiting[lane]),
+                     "in_flight": self.in_flight[lane]} for lane in LANES}
+
+
+schedulers: Dict[str, PriorityScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(name: str) -> PriorityScheduler:
+  """Returns the process wide scheduler of a kind of work"""
+  if name not in schedulers:
+    with _schedulers_lock:
+      if name not in schedulers:
+        capacity = PRIORITY_CAPACITY.get(name, 8)
+        reserved = max(1, int(capacity * PRIORITY_INTERACTIVE_RESERVED_RATIO))
+        schedulers[name] = PriorityScheduler(name, capacity, reserved)
+  return schedulers[name]
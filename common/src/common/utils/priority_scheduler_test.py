@@ -0,0 +1,90 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+  Tests for the priority lane scheduler
+"""
+import threading
+import time
+from .priority_scheduler import PriorityScheduler
+from .priority_scheduler import PRIORITY_INTERACTIVE, PRIORITY_STANDARD
+from .priority_scheduler import PRIORITY_BULK
+
+# disabling pylint rules that conflict with pytest fixtures
+# pylint: disable=unused-argument,redefined-outer-name,unused-import
+
+
+def wait_until(condition, timeout=5):
+  deadline = time.time() + timeout
+  while not condition() and time.time() < deadline:
+    time.sleep(0.01)
+  return condition()
+
+
+def test_reserved_interactive_capacity():
+  scheduler = PriorityScheduler("test", capacity=2, reserved=1)
+  bulk_lane = scheduler.acquire(PRIORITY_BULK)
+  acquired = []
+  waiter = threading.Thread(
+      target=lambda: acquired.append(scheduler.acquire(PRIORITY_BULK)))
+  waiter.start()
+  assert wait_until(
+      lambda: scheduler.stats()[PRIORITY_BULK]["queue_depth"] == 1)
+
+  # the reserved slot is still free for interactive work
+  assert scheduler.acquire(PRIORITY_INTERACTIVE) == PRIORITY_INTERACTIVE
+  assert not acquired
+
+  scheduler.release(bulk_lane)
+  waiter.join(5)
+  assert acquired == [PRIORITY_BULK]
+
+
+def test_higher_lane_first():
+  scheduler = PriorityScheduler("test", capacity=1, reserved=0)
+  lane = scheduler.acquire(PRIORITY_STANDARD)
+  order = []
+
+  def run(priority):
+    with scheduler.slot(priority):
+      order.append(priority)
+
+  bulk = threading.Thread(target=run, args=(PRIORITY_BULK,))
+  bulk.start()
+  assert wait_until(
+      lambda: scheduler.stats()[PRIORITY_BULK]["queue_depth"] == 1)
+  interactive = threading.Thread(target=run, args=(PRIORITY_INTERACTIVE,))
+  interactive.start()
+  assert wait_until(
+      lambda: scheduler.stats()[PRIORITY_INTERACTIVE]["queue_depth"] == 1)
+
+  scheduler.release(lane)
+  bulk.join(5)
+  interactive.join(5)
+  assert order == [PRIORITY_INTERACTIVE, PRIORITY_BULK]
+
+
+def test_acquire_timeout():
+  scheduler = PriorityScheduler("test", capacity=1, reserved=0)
+  lane = scheduler.acquire(PRIORITY_BULK)
+  try:
+    scheduler.acquire(PRIORITY_BULK, timeout=0.05)
+    assert False, "acquire should time out"
+  except TimeoutError:
+    pass
+  assert scheduler.stats()[PRIORITY_BULK] == {"queue_depth": 0,
+                                              "in_flight": 1}
+  scheduler.release(lane)
@@ -7,6 +7,7 @@ from common.config import STATUS_SUCCESS
 from common.autoapproval_config import AUTO_APPROVAL_MAPPING
 import requests
 import common.config
+from common.utils import metrics
 from common.utils.logging_handler import Logger
 from common.config import get_extraction_confidence_threshold
 from common.config import get_extraction_confidence_threshold_per_field
@@ -14,37 +15,41 @@ from common.config import get_extraction_confidence_threshold_per_field
 logger = Logger.get_logger(__name__)
 
 def update_autoapproval_status(case_id: str, uid: str, a_status: str,
-    autoapproved_status: str, is_autoapproved: str):
+    autoapproved_status: str, is_autoapproved: str, trace_id=None):
   """Update auto approval status"""
   base_url = f"{common.config.get_document_status_service_url()}" \
              "/update_autoapproved_status"
   req_url = f"{base_url}?case_id={case_id}&uid={uid}" \
             f"&status={a_status}&autoapproved_status={autoapproved_status}" \
             f"&is_autoapproved={is_autoapproved}"
-  response = requests.post(req_url)
+  response = requests.post(req_url, headers=metrics.trace_headers(trace_id))
   return response
 
 
 def validate_match_approve(case_id, uid, extraction_score,
     min_extraction_score_per_field,
-    extraction_entities, document_class):
+    extraction_entities, document_class, trace_id=None):
   """Perform validation, matching and autoapproval for supporting documents"""
   validation_score = None
   matching_score = None
-  validation_res = get_validation_score(case_id, uid, document_class,
-                                        extraction_entities)
+  with metrics.timed(metrics.STAGE_VALIDATE, trace_id, uid):
+    validation_res = get_validation_score(case_id, uid, document_class,
+                                          extraction_entities, trace_id)
   if validation_res.status_code == 200:
     print("====Validation successful==========")
     logger.info(f"Validation successful for case_id: {case_id} uid:{uid}.")
     validation_score = validation_res.json().get("score")
-    matching_res = get_matching_score(case_id, uid)
+    with metrics.timed(metrics.STAGE_MATCH, trace_id, uid):
+      matching_res = get_matching_score(case_id, uid, trace_id)
     if matching_res.status_code == 200:
       print("====Matching successful==========")
       logger.info(f"Matching successful for case_id: {case_id} uid:{uid}.")
       matching_score = matching_res.json().get("score")
-      update_autoapproval(document_class, case_id, uid,
-                          validation_score, extraction_score,
-                          min_extraction_score_per_field, matching_score)
+      with metrics.timed(metrics.STAGE_APPROVE, trace_id, uid):
+        update_autoapproval(document_class, case_id, uid,
+                            validation_score, extraction_score,
+                            min_extraction_score_per_field, matching_score,
+                            trace_id)
     else:
       logger.error(f"Matching FAILED for case_id: {case_id} uid:{uid}")
   else:
@@ -89,7 +94,8 @@ def update_autoapproval(document_class,
     validation_score=None,
     extraction_score=None,
     min_extraction_score_per_field=None,
-    matching_score=None):
+    matching_score=None,
+    trace_id=None):
   """Get the autoapproval status and update."""
   autoapproval_status = get_autoapproval_status(validation_score,
                                                 extraction_score,
@@ -98,25 +104,26 @@ def update_autoapproval(document_class,
   logger.info(f"autoapproval_status for application:{autoapproval_status}\
       for case_id: {case_id} uid:{uid}")
   update_autoapproval_status(case_id, uid, STATUS_SUCCESS,
-                             autoapproval_status[0], "yes")
+                             autoapproval_status[0], "yes", trace_id)
 
 
-def get_matching_score(case_id: str, uid: str):
+def get_matching_score(case_id: str, uid: str, trace_id=None):
   """Call the matching API and get the matching score"""
   base_url = f"{common.config.get_matching_service_url()}/match_document"
   req_url = f"{base_url}?case_id={case_id}&uid={uid}"
-  response = requests.post(req_url)
+  response = requests.post(req_url, headers=metrics.trace_headers(trace_id))
   return response
 
 
 def get_validation_score(case_id: str, uid: str, document_class: str,
-    extraction_entities: List[Dict]):
+    extraction_entities: List[Dict], trace_id=None):
   """Call the validation API and get the validation score"""
   base_url = f"{common.config.get_validation_service_url()}/validation/" \
              "validation_api"
   req_url = f"{base_url}?case_id={case_id}&uid={uid}" \
             f"&doc_class={document_class}"
-  response = requests.post(req_url, json=extraction_entities)
+  response = requests.post(req_url, json=extraction_entities,
+                           headers=metrics.trace_headers(trace_id))
   return response
 
 
@@ -17,18 +17,140 @@ limitations under the License.
 """ Publishes the messages to pubsub """
 
 import json
+import threading
+import uuid
+from collections import OrderedDict
 from google.cloud import pubsub_v1
+from google.cloud import storage
 from common.config import PROJECT_ID, TOPIC_ID
+from common.config import PUBLISH_CHUNK_SIZE, PUBLISH_MAX_MESSAGE_BYTES
+from common.config import PUBLISH_BATCH_MAX_MESSAGES, PUBLISH_BATCH_MAX_LATENCY
+from common.config import PUBLISH_BATCH_MAX_BYTES
+from common.config import PUBLISH_ORDERING_ENABLED
+from common.config import PUBSUB_PAYLOAD_BUCKET, PUBSUB_PAYLOAD_PREFIX
+from common.utils.logging_handler import Logger
 
-publisher = pubsub_v1.PublisherClient()
-topic_path = publisher.topic_path(PROJECT_ID, TOPIC_ID)
+logger = Logger.get_logger(__name__)
+
+_publisher = None
+_storage_client = None
+_client_lock = threading.Lock()
+
+
+def get_publisher():
+  """Returns the batching publisher client shared by the process"""
+  global _publisher
+  if _publisher is None:
+    with _client_lock:
+      if _publisher is None:
+        _publisher = pubsub_v1.PublisherClient(
+            batch_settings=pubsub_v1.types.BatchSettings(
+                max_messages=PUBLISH_BATCH_MAX_MESSAGES,
+                max_bytes=PUBLISH_BATCH_MAX_BYTES,
+                max_latency=PUBLISH_BATCH_MAX_LATENCY),
+            publisher_options=pubsub_v1.types.PublisherOptions(
+                enable_message_ordering=PUBLISH_ORDERING_ENABLED))
+  return _publisher
+
+
+def get_storage_client():
+  global _storage_client
+  if _storage_client is None:
+    with _client_lock:
+      if _storage_client is None:
+        _storage_client = storage.Client()
+  return _storage_client
+
+
+def split_message_list(message_list, chunk_size=PUBLISH_CHUNK_SIZE):
+  """Groups the message list by case_id and splits every group in chunks
+
+  Returns:
+    list of (case_id, chunk) tuples, keeping the order of the message list
+  """
+  cases = OrderedDict()
+  for item in message_list:
+    cases.setdefault(item.get("case_id") or "", []).append(item)
+  chunks = []
+  for case_id, items in cases.items():
+    for start in range(0, len(items), chunk_size):
+      chunks.append((case_id, items[start:start + chunk_size]))
+  return chunks
+
+
+def store_payload(message_json):
+  """Stores an oversized message in GCS and returns its gs:// url"""
+  blob_name = f"{PUBSUB_PAYLOAD_PREFIX}/{uuid.uuid4().hex}.json"
+  bucket = get_storage_client().bucket(PUBSUB_PAYLOAD_BUCKET)
+  bucket.blob(blob_name).upload_from_string(
+      message_json, content_type="application/json")
+  return f"gs://{PUBSUB_PAYLOAD_BUCKET}/{blob_name}"
+
+
+def load_message_list(message_dict):
+  """Returns the message list of a published message
+
+  Resolves the GCS pointer of messages that were published as a claim check.
+  """
+  payload_url = message_dict.get("message_list_url")
+  if not payload_url:
+    return message_dict.get("message_list")
+  bucket_name, blob_name = payload_url[len("gs://"):].split("/", 1)
+  blob = get_storage_client().bucket(bucket_name).blob(blob_name)
+  return json.loads(blob.download_as_bytes()).get("message_list")
+
+
+def on_publish_done(future, ordering_key):
+  """Logs failed publishes and resumes the paused ordering key"""
+  exception = future.exception()
+  if exception is None:
+    return
+  logger.error(f"on_publish_done: publish for ordering key"
+               f" '{ordering_key}' failed: {exception}")
+  if ordering_key:
+    get_publisher().resume_publish(get_topic_path(), ordering_key)
+
+
+def get_topic_path():
+  return get_publisher().topic_path(PROJECT_ID, TOPIC_ID)
+
+
+def publish_message(message_dict, ordering_key=""):
+  """Publishes one message, storing it in GCS when it is too large
+
+  Returns:
+    future of the publish
+  """
+  message_json = json.dumps(message_dict).encode("utf-8")
+  if len(message_json) > PUBLISH_MAX_MESSAGE_BYTES:
+    payload_url = store_payload(message_json)
+    logger.info(f"publish_message: {len(message_json)} bytes message stored"
+                f" in {payload_url}")
+    message_json = json.dumps({
+        "message": message_dict.get("message"),
+        "message_list_url": payload_url
+    }).encode("utf-8")
+  if not PUBLISH_ORDERING_ENABLED:
+    ordering_key = ""
+  future = get_publisher().publish(
+      get_topic_path(), message_json, ordering_key=ordering_key)
+  future.add_done_callback(
+      lambda published: on_publish_done(published, ordering_key))
+  return future
 
 
 def publish_document(message_dict):
-  # print("inside publisher")
-  message_json = json.dumps(message_dict)
-  message_json = message_json.encode("utf-8")
-  print(f"Publishing {topic_path} topic message: {message_json}")
-  future = publisher.publish(topic_path, message_json)
-  return future.result()
+  """Publishes the message list in chunks of at most PUBLISH_CHUNK_SIZE
 
+  Every chunk holds documents of one case_id, which is used as ordering key.
+  Returns:
+    list of publish futures, the call does not wait for them
+  """
+  message_list = message_dict.get("message_list") or []
+  futures = []
+  for case_id, chunk in split_message_list(message_list):
+    chunk_message = dict(message_dict, message_list=chunk)
+    futures.append(publish_message(chunk_message, ordering_key=case_id))
+  logger.info(f"publish_document: publishing {len(message_list)} documents"
+              f" in {len(futures)} messages to {TOPIC_ID}")
+  return futures
@@ -0,0 +1,60 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+  Tests for the Pub/Sub publisher
+"""
+import json
+from unittest import mock
+from . import publisher
+
+# disabling pylint rules that conflict with pytest fixtures
+# pylint: disable=unused-argument,redefined-outer-name,unused-import
+
+
+def get_message_list(case_ids):
+  return [{"case_id": case_id, "uid": f"uid{i}", "context": "arkansas"}
+          for i, case_id in enumerate(case_ids)]
+
+
+def test_split_message_list():
+  message_list = get_message_list(["a", "b", "a", "a", "b"])
+  chunks = publisher.split_message_list(message_list, chunk_size=2)
+  assert [(case_id, [item["uid"] for item in chunk])
+          for case_id, chunk in chunks] == [("a", ["uid0", "uid2"]),
+                                            ("a", ["uid3"]),
+                                            ("b", ["uid1", "uid4"])]
+
+
+def test_publish_document_claim_check():
+  mock_publisher = mock.MagicMock()
+  message_list = get_message_list(["a", "b"])
+  message_list[1]["context"] = "x" * 200
+  message_dict = {"message": "batch", "message_list": message_list}
+  with mock.patch.object(publisher, "get_publisher",
+                         return_value=mock_publisher):
+    with mock.patch.object(publisher, "store_payload",
+                           return_value="gs://bucket/payload.json") as store:
+      with mock.patch.object(publisher, "PUBLISH_MAX_MESSAGE_BYTES", 150):
+        futures = publisher.publish_document(message_dict)
+  assert len(futures) == 2
+  store.assert_called_once()
+  calls = mock_publisher.publish.call_args_list
+  assert [call[1]["ordering_key"] for call in calls] == ["a", "b"]
+  messages = [json.loads(call[0][1]) for call in calls]
+  assert messages[0]["message_list"] == message_dict["message_list"][:1]
+  assert messages[1] == {"message": "batch",
+                         "message_list_url": "gs://bucket/payload.json"}
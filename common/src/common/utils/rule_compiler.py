@@ -0,0 +1,284 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Compiles validation rules into parameterized BigQuery queries and local
+predicates. Rules are compiled once per rules file generation, document
+specific values (case_id, uid, rule values) are bound as query parameters.
+"""
+
+import datetime
+import operator
+import re
+from typing import Callable, Dict, List, Optional, Union
+from google.cloud import bigquery
+from common.utils.helper import parse_date
+from common.utils.format_data_for_bq import get_numeric_value
+from common.utils.logging_handler import Logger
+
+logger = Logger.get_logger(__name__)
+
+OPERATORS = {">": operator.gt, "<": operator.lt, ">=": operator.ge,
+             "<=": operator.le, "=": operator.eq, "==": operator.eq,
+             "!=": operator.ne}
+KEY_PATTERN = re.compile(r"^\w+$")
+SELECT_PATTERN = re.compile(r"^\s*select\s+", re.IGNORECASE)
+# Entity names referenced by raw SQL rules: JSON paths ($.name') or
+# typed rules (name = 'name')
+RULE_ENTITY_PATTERN = re.compile(r"\$\.(\w+)'|\bname\s*=\s*'(\w+)'")
+
+# SQL expressions over a single entity e, per entities sink
+JSON_ENTITY_SQL = {
+    "entities": "UNNEST(JSON_QUERY_ARRAY(entities, \"$\"))",
+    "name": "JSON_VALUE(e, \"$.name\")",
+    "value": "IFNULL(NULLIF(JSON_VALUE(e, \"$.corrected_value\"), \"\"), "
+             "JSON_VALUE(e, \"$.value\"))",
+    # date_value is the value normalized with parse_date by
+    # format_data_for_bq, rows written before it only match ISO dates
+    "date": "COALESCE(SAFE_CAST(JSON_VALUE(e, \"$.date_value\") AS DATE), "
+            "SAFE_CAST(SUBSTR(IFNULL(NULLIF(JSON_VALUE(e, \"$.corrected_value\"), "
+            "\"\"), JSON_VALUE(e, \"$.value\")), 1, 10) AS DATE))",
+    "number": "SAFE_CAST(REGEXP_REPLACE(IFNULL(NULLIF(JSON_VALUE(e, "
+              "\"$.corrected_value\"), \"\"), JSON_VALUE(e, \"$.value\")), "
+              "r\"^\\$|,\", \"\") AS FLOAT64)",
+}
+TYPED_ENTITY_SQL = {
+    "entities": "UNNEST(entity_values)",
+    "name": "e.name",
+    "value": "IFNULL(NULLIF(e.corrected_value, \"\"), e.value)",
+    "date": "e.date_value",
+    "number": "e.numeric_value",
+}
+
+
+class CompiledRule:
+  """
+  A validation rule with its query text fixed at compile time.
+  query matches a single document (@case_id, @uid), batch_query returns the
+  uids out of @uids matching the rule. predicate, when set, evaluates the
+  rule locally on {entity name: value} without querying BigQuery.
+  """
+
+  def __init__(self, rule_id: str, keys: List[str], query: str,
+               batch_query: str,
+               parameters: List[bigquery.ScalarQueryParameter],
+               predicate: Optional[Callable[[Dict[str, str]], bool]] = None):
+    self.rule_id = rule_id
+    self.keys = keys
+    self.query = query
+    self.batch_query = batch_query
+    self.parameters = parameters
+    self.predicate = predicate
+
+  def document_job_config(self, case_id: str,
+                          uid: str) -> bigquery.QueryJobConfig:
+    return bigquery.QueryJobConfig(query_parameters=self.parameters + [
+        bigquery.ScalarQueryParameter("case_id", "STRING", case_id),
+        bigquery.ScalarQueryParameter("uid", "STRING", uid)])
+
+  def batch_job_config(self, uids: List[str]) -> bigquery.QueryJobConfig:
+    return bigquery.QueryJobConfig(query_parameters=self.parameters + [
+        bigquery.ArrayQueryParameter("uids", "STRING", uids)])
+
+
+def add_months(date: datetime.date, months: int) -> datetime.date:
+  """
+  Same as BigQuery DATE_ADD(date, INTERVAL months MONTH), the day is
+  clamped to the last day of the resulting month
+  """
+  month_index = date.year * 12 + date.month - 1 + months
+  year, month = divmod(month_index, 12)
+  month += 1
+  next_month = datetime.date(year + month // 12, month % 12 + 1, 1)
+  last_day = (next_month - datetime.timedelta(days=1)).day
+  return datetime.date(year, month, min(date.day, last_day))
+
+
+def get_operator(op: str) -> str:
+  if op not in OPERATORS:
+    raise ValueError(f"Unsupported operator {op}")
+  return "=" if op == "==" else op
+
+
+def get_key(key: str) -> str:
+  if not isinstance(key, str) or not KEY_PATTERN.match(key):
+    raise ValueError(f"Invalid entity name {key}")
+  return key
+
+
+def get_conditions(rule: dict) -> List[dict]:
+  """
+  Normalizes a structured rule, as written by utils/rules_update.py, into a
+  list of conditions which all have to match
+  """
+  template = rule.get("template")
+  if template == "Template1":
+    return [{"key": get_key(rule["key"]), "type": "date_between",
+             "value_before": int(rule["value_before"]),
+             "value_after": int(rule["value_after"])}]
+  if template == "Template2":
+    keys, operators, values = rule["key"], rule["operator"], rule["value"]
+    if not len(keys) == len(operators) == len(values):
+      raise ValueError("Template2 needs as many operators and values as keys")
+    return [{"key": get_key(key), "type": "compare",
+             "operator": get_operator(op), "value": value}
+            for key, op, value in zip(keys, operators, values)]
+  if template == "Template3":
+    return [{"key": get_key(rule["key"]), "type": "date",
+             "operator": get_operator(rule["operator"]),
+             "value": int(rule["value"])}]
+  if template == "Template4":
+    return [{"key": get_key(rule["key"]), "type": "compare",
+             "operator": get_operator(rule["operator"]),
+             "value": rule["value"]}]
+  if template == "Template5":
+    re.compile(rule["value"])
+    return [{"key": get_key(rule["key"]), "type": "regex",
+             "value": rule["value"]}]
+  raise ValueError(f"Unsupported rule template {template}")
+
+
+def get_condition_sql(condition: dict, i: int, sql: Dict[str, str]):
+  """
+  Returns the SQL of a condition on the entity e and its query parameters
+  """
+  key_param = bigquery.ScalarQueryParameter(f"key_{i}", "STRING",
+                                            condition["key"])
+  condition_type = condition["type"]
+  if condition_type == "date_between":
+    check = (f"{sql['date']} > DATE_ADD(CURRENT_DATE(), "
+             f"INTERVAL @value_before_{i} MONTH) AND {sql['date']} < "
+             f"DATE_ADD(CURRENT_DATE(), INTERVAL @value_after_{i} MONTH)")
+    parameters = [
+        bigquery.ScalarQueryParameter(f"value_before_{i}", "INT64",
+                                      condition["value_before"]),
+        bigquery.ScalarQueryParameter(f"value_after_{i}", "INT64",
+                                      condition["value_after"])]
+  elif condition_type == "date":
+    check = (f"{sql['date']} {condition['operator']} DATE_ADD(CURRENT_DATE(), "
+             f"INTERVAL @value_{i} MONTH)")
+    parameters = [bigquery.ScalarQueryParameter(f"value_{i}", "INT64",
+                                                condition["value"])]
+  elif condition_type == "regex":
+    check = f"REGEXP_CONTAINS({sql['value']}, @value_{i})"
+    parameters = [bigquery.ScalarQueryParameter(f"value_{i}", "STRING",
+                                                condition["value"])]
+  else:
+    number = get_numeric_value(condition["value"])
+    if number is not None:
+      check = f"{sql['number']} {condition['operator']} @value_{i}"
+      parameters = [bigquery.ScalarQueryParameter(f"value_{i}", "FLOAT64",
+                                                  number)]
+    else:
+      check = f"{sql['value']} {condition['operator']} @value_{i}"
+      parameters = [bigquery.ScalarQueryParameter(f"value_{i}", "STRING",
+                                                  str(condition["value"]))]
+  return (f"EXISTS (SELECT 1 FROM {sql['entities']} e "
+          f"WHERE {sql['name']} = @key_{i} AND {check})",
+          [key_param] + parameters)
+
+
+def check_condition(condition: dict, value, today: datetime.date) -> bool:
+  """
+  Evaluates a condition locally, same semantics as get_condition_sql on
+  entities written by format_data_for_bq (dates parsed with parse_date)
+  """
+  if value is None:
+    return False
+  condition_type = condition["type"]
+  if condition_type in ("date_between", "date"):
+    date = parse_date(value)
+    if date is None:
+      return False
+    date = date.date()
+    if condition_type == "date_between":
+      return add_months(today, condition["value_before"]) < date < \
+        add_months(today, condition["value_after"])
+    return OPERATORS[condition["operator"]](
+        date, add_months(today, condition["value"]))
+  if condition_type == "regex":
+    return re.search(condition["value"], str(value)) is not None
+  number = get_numeric_value(condition["value"])
+  if number is not None:
+    value = get_numeric_value(value)
+    return value is not None and OPERATORS[condition["operator"]](value,
+                                                                  number)
+  return OPERATORS[condition["operator"]](str(value), str(condition["value"]))
+
+
+def get_predicate(conditions: List[dict]) -> Callable[[Dict[str, str]], bool]:
+  def predicate(values: Dict[str, str]) -> bool:
+    today = datetime.date.today()
+    return all(check_condition(condition, values.get(condition["key"]), today)
+               for condition in conditions)
+  return predicate
+
+
+def compile_rule(rule_id: str, rule: Union[str, dict], table: str,
+                 typed: bool = False) -> CompiledRule:
+  """
+  Compiles a rule of the rules file.
+  Structured rules (dict) get parameterized queries and a local predicate,
+  raw SQL rules (str, `project_table` placeholder) only get the document
+  filters bound as parameters.
+  """
+  if isinstance(rule, str):
+    query = rule.replace("project_table", table)
+    keys = list(dict.fromkeys(
+        json_key or typed_key
+        for json_key, typed_key in RULE_ENTITY_PATTERN.findall(query)))
+    return CompiledRule(
+        rule_id, keys,
+        query + " and case_id = @case_id and uid = @uid",
+        SELECT_PATTERN.sub("SELECT uid, ", query, count=1)
+        + " and uid IN UNNEST(@uids)",
+        [])
+
+  conditions = get_conditions(rule)
+  sql = TYPED_ENTITY_SQL if typed else JSON_ENTITY_SQL
+  checks, parameters = [], []
+  for i, condition in enumerate(conditions):
+    check, condition_parameters = get_condition_sql(condition, i, sql)
+    checks.append(check)
+    parameters.extend(condition_parameters)
+  where = " AND ".join(checks)
+  keys = list(dict.fromkeys(condition["key"] for condition in conditions))
+  return CompiledRule(
+      rule_id, keys,
+      f"SELECT uid FROM `{table}` WHERE {where} "
+      "AND case_id = @case_id AND uid = @uid",
+      f"SELECT DISTINCT uid FROM `{table}` WHERE {where} "
+      "AND uid IN UNNEST(@uids)",
+      parameters, get_predicate(conditions))
+
+
+def compile_rules(rules: Dict[str, Dict[str, Union[str, dict]]], table: str,
+                  typed: bool = False) -> Dict[str, List[CompiledRule]]:
+  """
+  Compiles all rules of a rules file, per document type.
+  Invalid rules are logged and skipped.
+  """
+  compiled = {}
+  for document_type, document_rules in rules.items():
+    compiled[document_type] = []
+    for rule_id, rule in document_rules.items():
+      try:
+        compiled[document_type].append(
+            compile_rule(rule_id, rule, table, typed))
+      except (KeyError, TypeError, ValueError, re.error) as e:
+        logger.error(f"compile_rules - skipping {document_type} {rule_id}: "
+                     f"{e}")
+  return compiled
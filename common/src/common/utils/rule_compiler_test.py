@@ -0,0 +1,106 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+  Tests for the validation rule compiler
+"""
+import os
+import datetime
+import json
+from .format_data_for_bq import format_data_for_bq
+from .rule_compiler import add_months, compile_rule, compile_rules
+
+# disabling pylint rules that conflict with pytest fixtures
+# pylint: disable=unused-argument,redefined-outer-name,unused-import
+
+os.environ["FIRESTORE_EMULATOR_HOST"] = "localhost:8080"
+os.environ["GOOGLE_CLOUD_PROJECT"] = "fake-project"
+
+
+def test_add_months():
+  assert add_months(datetime.date(2024, 1, 31), 1) == datetime.date(2024, 2, 29)
+  assert add_months(datetime.date(2024, 3, 15), -3) == \
+         datetime.date(2023, 12, 15)
+  assert add_months(datetime.date(2024, 12, 1), 1) == datetime.date(2025, 1, 1)
+
+
+def test_compile_structured_rule():
+  rule = compile_rule("Rule_1", {"template": "Template2",
+                                 "key": ["hours", "rate"],
+                                 "operator": ["<", "=="],
+                                 "value": ["150", "abc"]},
+                      "p.validation.validation_table")
+  assert rule.keys == ["hours", "rate"]
+  # Values and document filters are parameters, not part of the query text
+  assert "150" not in rule.query and "abc" not in rule.query
+  assert "@case_id" in rule.query and "@uid" in rule.query
+  assert "UNNEST(@uids)" in rule.batch_query
+  assert rule.predicate({"hours": "1,20", "rate": "abc"})
+  assert not rule.predicate({"hours": "160", "rate": "abc"})
+  assert not rule.predicate({"hours": "100"})
+
+
+def test_compile_date_and_regex_rules():
+  today = datetime.date.today()
+  rule = compile_rule("Rule_1", {"template": "Template3", "key": "dob",
+                                 "operator": "<", "value": "0"},
+                      "table", typed=True)
+  assert "e.date_value" in rule.query
+  assert rule.predicate({"dob": "1990-01-31"})
+  assert not rule.predicate({"dob": (today + datetime.timedelta(days=40))
+                            .isoformat()})
+  assert not rule.predicate({"dob": "not a date"})
+  rule = compile_rule("Rule_2", {"template": "Template5", "key": "dl_no",
+                                 "value": "[A-Z]{1}-[0-9]{8}"}, "table")
+  assert rule.predicate({"dl_no": "A-60544059"})
+  assert not rule.predicate({"dl_no": "60544059"})
+
+
+def test_date_rule_on_non_iso_value():
+  rule = compile_rule("Rule_1", {"template": "Template1", "key": "dob",
+                                 "value_before": "-1200",
+                                 "value_after": "-12"}, "table")
+  # BigQuery evaluates the ISO date_value written by format_data_for_bq
+  entity = json.loads(format_data_for_bq(
+      [{"entity": "dob", "value": "03/15/1990"}]))[0]
+  assert entity["date_value"] == "1990-03-15"
+  assert "$.date_value" in rule.query and "$.date_value" in rule.batch_query
+  assert rule.predicate({"dob": "03/15/1990"})
+  assert rule.predicate({"dob": entity["date_value"]})
+  entity = json.loads(format_data_for_bq(
+      [{"entity": "dob", "value": "03/15/1990",
+        "corrected_value": "Mar 16, 2090"}]))[0]
+  assert entity["date_value"] == "2090-03-16"
+  assert not rule.predicate({"dob": "Mar 16, 2090"})
+  assert not rule.predicate({"dob": entity["date_value"]})
+
+
+def test_compile_rules_legacy_and_invalid():
+  rules = compile_rules({"driver_license": {
+      "Rule_1": "Select JSON_QUERY(entities,'$.dob') as dob from "
+                "`project_table` where DATE(JSON_VALUE(entities,'$.dob')) "
+                "< current_date",
+      "Rule_2": {"template": "Template4", "key": "dob; drop",
+                 "operator": "<", "value": "1"},
+      "Rule_3": {"template": "Template4", "key": "dob",
+                 "operator": "or 1=1 --", "value": "1"}}}, "t")
+  assert len(rules["driver_license"]) == 1
+  rule = rules["driver_license"][0]
+  assert rule.predicate is None
+  assert rule.keys == ["dob"]
+  assert "`t`" in rule.query
+  assert rule.query.endswith("and case_id = @case_id and uid = @uid")
+  assert rule.batch_query.startswith("SELECT uid, JSON_QUERY")
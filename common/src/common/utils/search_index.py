@@ -0,0 +1,202 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+In-memory trigram index over the searchable keys (DB_KEYS) and entity
+values (ENTITY_KEYS) of active documents, used by the HITL search.
+"""
+
+import datetime
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional
+from common.config import DB_KEYS, ENTITY_KEYS, DATABASE_PREFIX
+from common.utils.logging_handler import Logger
+
+logger = Logger.get_logger(__name__)
+
+# Same collection as common.models.Document
+DOCUMENT_COLLECTION = DATABASE_PREFIX + "document"
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def get_trigrams(text: str) -> set:
+  return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def get_searchable_values(doc: Dict) -> List:
+  """
+  Returns the values the search term is compared against: DB_KEYS of the
+  document and the corrected (else extracted) value of ENTITY_KEYS entities
+  """
+  values = [doc.get(key) for key in DB_KEYS]
+  for entity in doc.get("entities") or []:
+    if entity.get("entity") in ENTITY_KEYS:
+      value = entity.get("corrected_value")
+      values.append(entity.get("value") if value is None else value)
+  return [value for value in values if value is not None]
+
+
+def get_timestamp(doc: Dict) -> datetime.datetime:
+  timestamp = doc.get("upload_timestamp")
+  if not isinstance(timestamp, datetime.datetime):
+    return EPOCH
+  if timestamp.tzinfo is None:
+    timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+  return timestamp
+
+
+class SearchEntry:
+  """Searchable data of a single document"""
+
+  def __init__(self, doc: Dict):
+    values = get_searchable_values(doc)
+    self.texts = [value.lower() for value in values if isinstance(value, str)]
+    self.others = [value for value in values if not isinstance(value, str)]
+    self.keys = {key: doc.get(key) for key in DB_KEYS}
+    self.timestamp = get_timestamp(doc)
+    self.trigrams = set().union(*(get_trigrams(t) for t in self.texts))
+
+  def get_score(self, term) -> int:
+    """
+    0 if the term does not match, otherwise 3 for an exact value,
+    2 for a word prefix and 1 for any other substring match
+    """
+    if not isinstance(term, str):
+      return 3 if term in self.others else 0
+    score = 0
+    for text in self.texts:
+      if term == text:
+        return 3
+      if text.startswith(term) or f" {term}" in text:
+        score = 2
+      elif score == 0 and term in text:
+        score = 1
+    return score
+
+
+class SearchIndex:
+  """
+  Trigram inverted index of uid -> SearchEntry. Terms of three or more
+  characters only verify the documents containing all their trigrams,
+  shorter terms and non-string terms check every indexed entry in memory.
+  """
+
+  def __init__(self):
+    self.entries = {}
+    self.postings = defaultdict(set)
+    self.lock = threading.Lock()
+    self._ready = False
+    self.watch = None
+
+  @property
+  def ready(self) -> bool:
+    """
+    True while the index is current, False before the first snapshot and
+    once the Firestore watch stopped (it is not restarted on errors)
+    """
+    if self._ready and self.watch is not None and not self.watch.is_active:
+      logger.error("SearchIndex - Firestore watch stopped, search falls back "
+                   "to Firestore queries")
+      self._ready = False
+    return self._ready
+
+  def add(self, doc: Dict):
+    uid = doc.get("uid")
+    if not uid:
+      return
+    entry = SearchEntry(doc)
+    with self.lock:
+      self._remove(uid)
+      self.entries[uid] = entry
+      for trigram in entry.trigrams:
+        self.postings[trigram].add(uid)
+
+  def remove(self, uid: str):
+    with self.lock:
+      self._remove(uid)
+
+  def _remove(self, uid: str):
+    entry = self.entries.pop(uid, None)
+    if entry is None:
+      return
+    for trigram in entry.trigrams:
+      uids = self.postings.get(trigram)
+      if uids is not None:
+        uids.discard(uid)
+        if not uids:
+          del self.postings[trigram]
+
+  def search(self, term, filter_key: Optional[str] = None,
+             filter_value=None) -> List[str]:
+    """
+    Returns the uids of documents matching the term, best matches first and
+    then most recently uploaded first. The filter only applies when both
+    filter_key and filter_value are given.
+    """
+    if isinstance(term, str):
+      term = term.lower()
+    with self.lock:
+      if isinstance(term, str) and len(term) >= 3:
+        postings = sorted((self.postings.get(trigram, set())
+                           for trigram in get_trigrams(term)), key=len)
+        candidates = set.intersection(*postings) if postings else set()
+      else:
+        candidates = set(self.entries)
+      results = []
+      for uid in candidates:
+        entry = self.entries[uid]
+        if filter_key is not None and filter_value is not None and \
+            entry.keys.get(filter_key) != filter_value:
+          continue
+        score = entry.get_score(term)
+        if score:
+          results.append((score, entry.timestamp, uid))
+    results.sort(reverse=True)
+    return [uid for _, _, uid in results]
+
+  def on_snapshot(self, doc_snapshots, changes, read_time):
+    # pylint: disable=unused-argument
+    try:
+      for change in changes:
+        if change.type.name == "REMOVED":
+          self.remove(change.document.get("uid"))
+        else:
+          self.add(change.document.to_dict())
+    except Exception:
+      # the watch is closed when the callback raises
+      self._ready = False
+      raise
+    if not self._ready:
+      self._ready = True
+      logger.info(f"SearchIndex ready with {len(self.entries)} documents")
+
+  def start(self, client):
+    """
+    Indexes the active documents and keeps the index current with every
+    write to the document collection, from any service, through a
+    Firestore listener. Until the first snapshot is received ready is False
+    and callers fall back to scanning the collection.
+    """
+    query = client.collection(DOCUMENT_COLLECTION).where(
+        "active", "==", "active")
+    self.watch = query.on_snapshot(self.on_snapshot)
+
+  def stop(self):
+    if self.watch is not None:
+      self.watch.unsubscribe()
+      self.watch = None
+    self._ready = False
@@ -0,0 +1,76 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+  Tests for the HITL search index
+"""
+import os
+import datetime
+from unittest import mock
+from .search_index import SearchIndex
+
+# disabling pylint rules that conflict with pytest fixtures
+# pylint: disable=unused-argument,redefined-outer-name,unused-import
+
+os.environ["FIRESTORE_EMULATOR_HOST"] = "localhost:8080"
+os.environ["GOOGLE_CLOUD_PROJECT"] = "fake-project"
+
+
+def get_doc(uid, name, day, case_id="case1"):
+  return {"uid": uid, "case_id": case_id, "active": "active",
+          "upload_timestamp": datetime.datetime(2024, 1, day),
+          "entities": [{"entity": "name", "value": name,
+                        "corrected_value": None},
+                       {"entity": "not_searchable", "value": "Smith",
+                        "corrected_value": None}]}
+
+
+def test_search_index():
+  index = SearchIndex()
+  index.add(get_doc("u1", "John Smith", 1))
+  index.add(get_doc("u2", "Smith", 2))
+  index.add(get_doc("u3", "Anna Smithson", 3, case_id="case2"))
+  index.add(get_doc("u4", "Max Doe", 4))
+  # Exact value first, then word prefix by upload time, no substring-free doc
+  assert index.search("smith") == ["u2", "u3", "u1"]
+  assert index.search("mith", "case_id", "case1") == ["u2", "u1"]
+  assert index.search("Do") == ["u4"]
+  assert index.search("xyz") == []
+
+  index.add(get_doc("u2", "Jane Roe", 2))
+  index.remove("u3")
+  assert index.search("smith") == ["u1"]
+  assert "smi" in index.postings
+  index.remove("u1")
+  assert "smi" not in index.postings
+
+
+def test_search_index_filter_value_none():
+  index = SearchIndex()
+  index.add(get_doc("u1", "John Smith", 1))
+  index.add(get_doc("u2", "Jane Smith", 2, case_id="case2"))
+  assert index.search("smith", "case_id", None) == ["u2", "u1"]
+  assert index.search("smith", "case_id", "case2") == ["u2"]
+
+
+def test_search_index_not_ready_after_watch_stopped():
+  index = SearchIndex()
+  index.watch = mock.Mock(is_active=True)
+  assert not index.ready
+  index.on_snapshot([], [], None)
+  assert index.ready
+  index.watch.is_active = False
+  assert not index.ready
@@ -18,7 +18,9 @@ limitations under the License.
 import copy
 import json
 from .logging_handler import Logger
-from common.config import PROJECT_ID, DATABASE_PREFIX, BIGQUERY_DB
+from common.config import PROJECT_ID, DATABASE_PREFIX, BIGQUERY_DB, \
+  BIGQUERY_TYPED_DB, BQ_ENTITIES_SINK
+from common.utils.format_data_for_bq import format_data_for_bq_typed
 import datetime
 
 logger = Logger.get_logger(__name__)
@@ -79,28 +81,43 @@ def stream_document_to_bigquery(client, case_id, uid,
               f"document_class={document_class}, document_type={document_type}, "
               f"table_id={table_id}, gcs_doc_path={gcs_doc_path}, "
               f"ocr_text={ocr_text}, classification_score={classification_score},"
-              f"is_hitl_classified={is_hitl_classified}")
+              f"is_hitl_classified={is_hitl_classified}, "
+              f"sink={BQ_ENTITIES_SINK}")
 
   now = datetime.datetime.now(datetime.timezone.utc)
-  rows_to_insert = [
-      {"case_id": case_id,
-       "uid": uid,
-       "document_class": document_class,
-       "document_type": document_type,
-       "entities": entities,
-       "timestamp": now.strftime('%Y-%m-%d %H:%M:%S.%f'),
-       "gcs_doc_path": gcs_doc_path,
-       "ocr_text": ocr_text,
-       "classification_score": classification_score,
-       "is_hitl_classified": is_hitl_classified
-       }
-  ]
-  errors = client.insert_rows_json(table_id, rows_to_insert)
+  row = {"case_id": case_id,
+         "uid": uid,
+         "document_class": document_class,
+         "document_type": document_type,
+         "timestamp": now.strftime('%Y-%m-%d %H:%M:%S.%f'),
+         "gcs_doc_path": gcs_doc_path,
+         "ocr_text": ocr_text,
+         "classification_score": classification_score,
+         "is_hitl_classified": is_hitl_classified
+         }
+  errors = []
+  if BQ_ENTITIES_SINK in ("json", "both"):
+    errors += insert_document_row(client, table_id,
+                                  dict(row, entities=entities))
+  if BQ_ENTITIES_SINK in ("typed", "both"):
+    typed_table_id = f"{PROJECT_ID}.{DATABASE_PREFIX}{BIGQUERY_TYPED_DB}"
+    entity_values = format_data_for_bq_typed(entities) or []
+    errors += insert_document_row(client, typed_table_id,
+                                  dict(row, entity_values=entity_values))
+  return errors
+
+
+def insert_document_row(client, table_id, row):
+  """
+    Inserts a single document row into table_id, returns the insert errors
+  """
+  case_id, uid = row.get("case_id"), row.get("uid")
+  errors = client.insert_rows_json(table_id, [row])
   if not errors:
-    logger.info(f"New rows have been added for "
+    logger.info(f"New rows have been added to {table_id} for "
                 f"case_id {case_id} and {uid}")
   elif isinstance(errors, list):
     error = errors[0].get("errors")
-    logger.error(f"Encountered errors while inserting rows "
+    logger.error(f"Encountered errors while inserting rows into {table_id} "
                  f"for case_id {case_id} and uid {uid}: {error}")
   return errors
@@ -0,0 +1,371 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+In-process fakes of the Google Cloud clients used by the pipeline, so that the
+services can be benchmarked end-to-end on a single machine.
+
+Firestore is not faked - use the Firestore emulator (FIRESTORE_EMULATOR_HOST).
+"""
+
+import base64
+import datetime
+import hashlib
+import mimetypes
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+# ------------------------------- Storage -------------------------------------
+
+
+class FakeBlob:
+  """Blob backed by a file under the bucket directory."""
+
+  def __init__(self, bucket, name: str):
+    self.bucket = bucket
+    self.name = name
+    self.crc32c = None
+
+  @property
+  def path(self):
+    return os.path.join(self.bucket.root, self.name)
+
+  @property
+  def content_type(self):
+    return self.bucket.content_types.get(self.name) or \
+           mimetypes.guess_type(self.name)[0]
+
+  @content_type.setter
+  def content_type(self, value):
+    self.bucket.content_types[self.name] = value
+
+  @property
+  def size(self):
+    return os.path.getsize(self.path) if self.exists() else None
+
+  @property
+  def md5_hash(self):
+    if not self.exists():
+      return None
+    with open(self.path, "rb") as f:
+      return base64.b64encode(hashlib.md5(f.read()).digest()).decode("utf-8")
+
+  @property
+  def generation(self):
+    return os.stat(self.path).st_mtime_ns if self.exists() else None
+
+  @property
+  def updated(self):
+    if not self.exists():
+      return None
+    return datetime.datetime.fromtimestamp(os.stat(self.path).st_mtime,
+                                           tz=datetime.timezone.utc)
+
+  def exists(self, *args, **kwargs):
+    return os.path.isfile(self.path)
+
+  def reload(self, *args, **kwargs):
+    pass
+
+  def upload_from_string(self, data, content_type=None, **kwargs):
+    if isinstance(data, str):
+      data = data.encode("utf-8")
+    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+    with open(self.path, "wb") as f:
+      f.write(data)
+    if content_type:
+      self.content_type = content_type
+
+  def upload_from_filename(self, filename, content_type=None, **kwargs):
+    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+    shutil.copyfile(filename, self.path)
+    if content_type:
+      self.content_type = content_type
+
+  def upload_from_file(self, file_obj, rewind=False, content_type=None,
+      **kwargs):
+    if rewind:
+      file_obj.seek(0)
+    self.upload_from_string(file_obj.read(), content_type=content_type)
+
+  def download_as_bytes(self, start=None, end=None, **kwargs):
+    with open(self.path, "rb") as f:
+      if start:
+        f.seek(start)
+      if end is not None:
+        return f.read(end - (start or 0) + 1)
+      return f.read()
+
+  download_as_string = download_as_bytes
+
+  def download_as_text(self, encoding="utf-8", **kwargs):
+    return self.download_as_bytes().decode(encoding)
+
+  def download_to_filename(self, filename, **kwargs):
+    shutil.copyfile(self.path, filename)
+
+  def open(self, mode="rb", **kwargs):
+    if "w" in mode:
+      os.makedirs(os.path.dirname(self.path), exist_ok=True)
+    return open(self.path, mode)
+
+  def delete(self, *args, **kwargs):
+    os.remove(self.path)
+
+
+class FakeBucket:
+  """Bucket backed by a directory under FakeStorageClient.root."""
+
+  def __init__(self, client, name: str):
+    self.client = client
+    self.name = name
+    self.root = os.path.join(FakeStorageClient.root, name)
+    self.content_types = FakeStorageClient.content_types.setdefault(name, {})
+
+  def exists(self, *args, **kwargs):
+    return True
+
+  def blob(self, blob_name, *args, **kwargs):
+    return FakeBlob(self, blob_name)
+
+  def get_blob(self, blob_name, *args, **kwargs):
+    blob = FakeBlob(self, blob_name)
+    return blob if blob.exists() else None
+
+  def list_blobs(self, prefix=None, **kwargs):
+    return self.client.list_blobs(self.name, prefix=prefix)
+
+  def copy_blob(self, blob, destination_bucket, new_name=None, **kwargs):
+    new_blob = destination_bucket.blob(new_name or blob.name)
+    new_blob.upload_from_filename(blob.path, content_type=blob.content_type)
+    return new_blob
+
+  def delete_blob(self, blob_name, *args, **kwargs):
+    self.blob(blob_name).delete()
+
+
+class FakeStorageClient:
+  """Drop-in for google.cloud.storage.Client, files live under `root`."""
+  root = None
+  content_types: Dict[str, Dict[str, str]] = {}
+
+  def __init__(self, *args, **kwargs):
+    self.project = kwargs.get("project")
+
+  def bucket(self, bucket_name, *args, **kwargs):
+    return FakeBucket(self, bucket_name)
+
+  get_bucket = bucket
+  lookup_bucket = bucket
+  create_bucket = bucket
+
+  def list_blobs(self, bucket_or_name, prefix=None, **kwargs):
+    bucket = bucket_or_name if isinstance(bucket_or_name, FakeBucket) \
+      else self.bucket(bucket_or_name)
+    blobs = []
+    for dir_path, _, filenames in os.walk(bucket.root):
+      for filename in filenames:
+        name = os.path.relpath(os.path.join(dir_path, filename), bucket.root)
+        name = name.replace(os.sep, "/")
+        if prefix is None or name.startswith(prefix):
+          blobs.append(FakeBlob(bucket, name))
+    return sorted(blobs, key=lambda b: b.name)
+
+
+# ------------------------------- BigQuery ------------------------------------
+
+
+class FakeQueryJob:
+
+  def result(self, *args, **kwargs):
+    return []
+
+  def to_dataframe(self, *args, **kwargs):
+    import pandas
+    return pandas.DataFrame()
+
+
+class FakeBigQueryClient:
+  """Streaming inserts are kept in memory, queries return no rows."""
+  rows: Dict[str, List[dict]] = {}
+  lock = threading.Lock()
+
+  def __init__(self, *args, **kwargs):
+    self.project = kwargs.get("project") or os.getenv("PROJECT_ID")
+
+  def insert_rows_json(self, table, json_rows, *args, **kwargs):
+    with self.lock:
+      self.rows.setdefault(str(table), []).extend(json_rows)
+    return []
+
+  def get_table(self, table, *args, **kwargs):
+    return table
+
+  def query(self, *args, **kwargs):
+    return FakeQueryJob()
+
+
+# ---------------------------- Pub/Sub, Secrets ------------------------------
+
+
+class FakePublisherClient:
+  """
+  Pub/Sub publisher which hands every message to `subscriber` on a worker
+  thread - the same decoupling a push subscription gives the pipeline.
+  """
+  subscriber: Optional[Callable[[bytes], None]] = None
+  executor = ThreadPoolExecutor(max_workers=4)
+
+  def __init__(self, *args, **kwargs):
+    pass
+
+  def topic_path(self, project, topic):
+    return f"projects/{project}/topics/{topic}"
+
+  def publish(self, topic, data, **attrs):
+    if self.subscriber is not None:
+      self.executor.submit(self.subscriber, data)
+    future = Future()
+    future.set_result(uuid.uuid4().hex)
+    return future
+
+
+class FakeSecretManagerClient:
+  """No secrets: IAP requests fall back to plain HTTP."""
+
+  def __init__(self, *args, **kwargs):
+    pass
+
+  def secret_version_path(self, project, secret, version):
+    return f"projects/{project}/secrets/{secret}/versions/{version}"
+
+  def access_secret_version(self, *args, **kwargs):
+    raise KeyError("Secret Manager is not available in benchmark mode")
+
+
+class FakeLoggingClient:
+
+  def __init__(self, *args, **kwargs):
+    pass
+
+  def setup_logging(self, *args, **kwargs):
+    pass
+
+
+# -------------------------------- DocAI -------------------------------------
+
+
+class FakeOperation:
+  """Long running operation which completes after `latency` seconds."""
+
+  def __init__(self, name, metadata, latency: float):
+    self.operation = type("Operation", (), {"name": name})()
+    self.metadata = metadata
+    self.latency = latency
+
+  def add_done_callback(self, fn):
+    timer = threading.Timer(self.latency, fn, args=(self,))
+    timer.daemon = True
+    timer.start()
+
+  def result(self, *args, **kwargs):
+    time.sleep(self.latency)
+    return None
+
+
+class FakeDocumentProcessorServiceClient:
+  """
+  Returns canned DocAI Documents per processor.
+  `processors` maps processor name -> (processor type, Document JSON file).
+  """
+  processors: Dict[str, tuple] = {}
+  online_latency = 0.5
+  batch_latency = 5.0
+
+  def __init__(self, *args, **kwargs):
+    pass
+
+  def get_processor(self, name=None, request=None, **kwargs):
+    from google.cloud import documentai_v1 as documentai
+    name = name or request["name"]
+    processor_type, _ = self.processors[name]
+    return documentai.Processor(
+        name=name, type_=processor_type, display_name=name.split("/")[-1],
+        default_processor_version=f"{name}/processorVersions/benchmark")
+
+  def canned_document(self, processor_name: str):
+    from google.cloud import documentai_v1 as documentai
+    _, json_path = self.processors[processor_name]
+    with open(json_path, "r", encoding="utf-8") as f:
+      return documentai.Document.from_json(f.read(),
+                                           ignore_unknown_fields=True)
+
+  def process_document(self, request=None, **kwargs):
+    from google.cloud import documentai_v1 as documentai
+    time.sleep(self.online_latency)
+    return documentai.ProcessResponse(
+        document=self.canned_document(request.name))
+
+  def batch_process_documents(self, request=None, **kwargs):
+    from google.cloud import documentai_v1 as documentai
+    operation_id = str(uuid.uuid4().int)[:19]
+    output_uri = request.document_output_config.gcs_output_config.gcs_uri
+    parsed = urlparse(output_uri)
+    bucket = FakeStorageClient().bucket(parsed.netloc)
+    prefix = parsed.path.strip("/")
+    document_json = documentai.Document.to_json(
+        self.canned_document(request.name))
+
+    statuses = []
+    for i, gcs_document in enumerate(
+        request.input_documents.gcs_documents.documents):
+      destination = "/".join(p for p in [prefix, operation_id, str(i)] if p)
+      bucket.blob(f"{destination}/document-0.json").upload_from_string(
+          document_json, content_type="application/json")
+      statuses.append(documentai.BatchProcessMetadata.IndividualProcessStatus(
+          input_gcs_source=gcs_document.gcs_uri,
+          output_gcs_destination=f"gs://{parsed.netloc}/{destination}"))
+
+    location = request.name.split("/")[3]
+    project = request.name.split("/")[1]
+    metadata = documentai.BatchProcessMetadata(
+        state=documentai.BatchProcessMetadata.State.SUCCEEDED,
+        individual_process_statuses=statuses)
+    name = f"projects/{project}/locations/{location}/operations/{operation_id}"
+    return FakeOperation(name, metadata, self.batch_latency)
+
+
+def install(root: str):
+  """Patches the Google Cloud client classes. Call before importing services."""
+  # pylint: disable=import-outside-toplevel
+  from google.cloud import bigquery, documentai_v1, pubsub_v1, secretmanager, \
+    storage
+  import google.cloud.logging
+
+  FakeStorageClient.root = root
+  storage.Client = FakeStorageClient
+  bigquery.Client = FakeBigQueryClient
+  pubsub_v1.PublisherClient = FakePublisherClient
+  secretmanager.SecretManagerServiceClient = FakeSecretManagerClient
+  documentai_v1.DocumentProcessorServiceClient = \
+    FakeDocumentProcessorServiceClient
+  google.cloud.logging.Client = FakeLoggingClient
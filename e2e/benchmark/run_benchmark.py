@@ -0,0 +1,351 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+End-to-end pipeline benchmark.
+
+Runs start-pipeline -> upload -> classification -> extraction ->
+validation/matching/auto-approval -> HITL in a single process, with Cloud
+Storage, BigQuery, Pub/Sub and Document AI replaced by the fakes in fakes.py
+and Firestore served by the emulator.
+
+Usage:
+  gcloud emulators firestore start --host-port=localhost:8080 &
+  python e2e/benchmark/run_benchmark.py --corpus-size 50
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.abspath(os.path.join(BENCHMARK_DIR, "..", ".."))
+
+PROJECT_ID = "cda-benchmark"
+CONFIG_BUCKET = f"{PROJECT_ID}-config"
+INPUT_BUCKET = f"{PROJECT_ID}-pa-forms"
+CLASSIFIER = f"projects/{PROJECT_ID}/locations/us/processors/classifier"
+EXTRACTOR = f"projects/{PROJECT_ID}/locations/us/processors/extractor"
+
+# (path marker in request URLs, service source dir)
+SERVICES = [
+    ("/document_status_service/v1", "microservices/document_status_service/src"),
+    ("/upload_service/v1", "microservices/upload_service/src"),
+    ("/classification_service/v1", "microservices/classification_service/src"),
+    ("/extraction_service/v1", "microservices/extraction_service/src"),
+    ("/hitl_service/v1", "microservices/hitl_service/src"),
+    ("/start-pipeline", "cloudrun/startpipeline/src"),
+]
+# Top level modules every service defines for itself.
+SERVICE_MODULES = ("main", "config", "routes", "utils", "models", "schemas")
+
+TERMINAL_STAGE = "auto_approval"
+
+
+def parse_args():
+  parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+  parser.add_argument("--corpus-size", type=int, default=20,
+                      help="Number of documents to push through the pipeline")
+  parser.add_argument("--sample-dir",
+                      default=os.path.join(ROOT_DIR, "sample_data",
+                                           "bsc_forms"),
+                      help="Folder with PDFs, cycled to build the corpus")
+  parser.add_argument("--docai-online-latency", type=float, default=0.5,
+                      help="Seconds per synchronous DocAI request")
+  parser.add_argument("--docai-batch-latency", type=float, default=5.0,
+                      help="Seconds until a DocAI batch operation completes")
+  parser.add_argument("--online-max-pages", type=int, default=10,
+                      help="online_processing_max_pages setting, "
+                           "0 sends everything through batch processing")
+  parser.add_argument("--hitl-requests", type=int, default=20,
+                      help="Number of HITL get_document/fetch_file calls")
+  parser.add_argument("--timeout", type=int, default=900,
+                      help="Seconds to wait for the corpus to finish")
+  parser.add_argument("--firestore-emulator-host", default=os.getenv(
+      "FIRESTORE_EMULATOR_HOST", "localhost:8080"))
+  parser.add_argument("--output", help="Optional path for a JSON report")
+  return parser.parse_args()
+
+
+def setup_environment(args, work_dir: str):
+  os.environ["PROJECT_ID"] = PROJECT_ID
+  os.environ["GOOGLE_CLOUD_PROJECT"] = PROJECT_ID
+  os.environ["FIRESTORE_EMULATOR_HOST"] = args.firestore_emulator_host
+  os.environ["CONFIG_BUCKET"] = CONFIG_BUCKET
+  os.environ["DATABASE_PREFIX"] = f"bench_{uuid.uuid4().hex[:8]}_"
+  os.environ["API_DOMAIN"] = "benchmark"
+  os.environ["PROTOCOL"] = "http"
+  os.environ.setdefault("SERVICE_NAME", "benchmark")
+  sys.path.insert(0, os.path.join(ROOT_DIR, "common", "src"))
+  sys.path.insert(0, BENCHMARK_DIR)
+
+  import fakes  # pylint: disable=import-outside-toplevel
+  fakes.install(os.path.join(work_dir, "gcs"))
+  output_dir = os.path.join(ROOT_DIR, "sample_data", "docai_output")
+  fakes.FakeDocumentProcessorServiceClient.processors = {
+      CLASSIFIER: ("CUSTOM_CLASSIFICATION_PROCESSOR",
+                   os.path.join(output_dir, "classifier_output.json")),
+      EXTRACTOR: ("CUSTOM_EXTRACTION_PROCESSOR",
+                  os.path.join(output_dir, "extractor_output.json")),
+  }
+  fakes.FakeDocumentProcessorServiceClient.online_latency = \
+    args.docai_online_latency
+  fakes.FakeDocumentProcessorServiceClient.batch_latency = \
+    args.docai_batch_latency
+  return fakes
+
+
+def seed_buckets(fakes, args) -> str:
+  client = fakes.FakeStorageClient()
+  config = {
+      "parser_config": {
+          "classifier": {"processor_id": CLASSIFIER},
+          "bench_extractor": {"processor_id": EXTRACTOR},
+      },
+      "settings_config": {
+          "classification_confidence_threshold": 0.5,
+          "classification_default_class": "pa_form_cda",
+          "online_processing_max_pages": args.online_max_pages,
+      },
+      "document_types_config": {
+          "pa_form_cda": {
+              "display_name": "Prior Auth Form",
+              "classifier_label": "pa_form_cda",
+              "parser": "bench_extractor",
+          },
+      },
+  }
+  client.bucket(CONFIG_BUCKET).blob("config.json").upload_from_string(
+      json.dumps(config), content_type="application/json")
+
+  samples = sorted(f for f in os.listdir(args.sample_dir)
+                   if f.lower().endswith(".pdf"))
+  assert samples, f"No PDF files found in {args.sample_dir}"
+  folder = f"benchmark-{datetime.datetime.utcnow().strftime('%H%M%S')}"
+  bucket = client.bucket(INPUT_BUCKET)
+  for i in range(args.corpus_size):
+    sample = samples[i % len(samples)]
+    bucket.blob(f"{folder}/{i:05d}_{sample}").upload_from_filename(
+        os.path.join(args.sample_dir, sample), content_type="application/pdf")
+  return folder
+
+
+def load_service(src_dir: str):
+  """Imports main.app of a service, isolated from the other services."""
+  from fastapi.testclient import TestClient  # pylint: disable=import-outside-toplevel
+  for name in list(sys.modules):
+    if name.split(".")[0] in SERVICE_MODULES:
+      del sys.modules[name]
+  path = os.path.join(ROOT_DIR, src_dir)
+  sys.path.insert(0, path)
+  try:
+    main = importlib.import_module("main")
+  finally:
+    sys.path.remove(path)
+  return TestClient(main.app)
+
+
+class ScoreResponse:
+  """Stands in for the validation and matching services."""
+  status_code = 200
+  text = '{"score": 1.0}'
+
+  def json(self):
+    return {"score": 1.0}
+
+
+def install_router(clients: Dict[str, object]):
+  """Routes `requests` calls between services to their in-process apps."""
+  import requests  # pylint: disable=import-outside-toplevel
+  original_request = requests.request
+
+  def request(method, url, **kwargs):
+    if "/validation_service/v1" in url or "/matching_service/v1" in url:
+      return ScoreResponse()
+    for marker, client in clients.items():
+      if marker in url:
+        for key in ("timeout", "verify", "allow_redirects"):
+          kwargs.pop(key, None)
+        return client.request(method.upper(), url[url.index(marker):],
+                              **kwargs)
+    return original_request(method, url, **kwargs)
+
+  requests.request = request
+  requests.get = lambda url, **kwargs: request("GET", url, **kwargs)
+  requests.post = lambda url, **kwargs: request("POST", url, **kwargs)
+  requests.put = lambda url, **kwargs: request("PUT", url, **kwargs)
+  requests.delete = lambda url, **kwargs: request("DELETE", url, **kwargs)
+
+
+def install_queue(fakes, upload_client):
+  """Emulates the queue service: Pub/Sub message -> upload process_task."""
+
+  def dispatch(data: bytes):
+    from common.utils import metrics  # pylint: disable=import-outside-toplevel
+    from common.utils.publisher import load_message_list  # pylint: disable=import-outside-toplevel
+    message = json.loads(data.decode("utf-8"))
+    start_time = time.time()
+    upload_client.post("/upload_service/v1/process_task",
+                       json={"configs": load_message_list(message)})
+    metrics.observe(metrics.STAGE_DISPATCH, time.time() - start_time)
+
+  fakes.FakePublisherClient.subscriber = staticmethod(dispatch)
+
+
+def wait_for_documents(uids: List[str], timeout: int) -> Dict[str, dict]:
+  """Polls Firestore until every document reached a terminal state."""
+  from common.config import STATUS_ERROR  # pylint: disable=import-outside-toplevel
+  from common.models import Document  # pylint: disable=import-outside-toplevel
+  finished = {}
+  deadline = time.time() + timeout
+  while len(finished) < len(uids) and time.time() < deadline:
+    for uid in uids:
+      if uid in finished:
+        continue
+      document = Document.find_by_uid(uid)
+      system_status = (document.system_status or []) if document else []
+      if any(s.get("stage") == TERMINAL_STAGE or
+             s.get("status") == STATUS_ERROR for s in system_status):
+        finished[uid] = document.to_dict()
+    time.sleep(0.5)
+  return finished
+
+
+def to_seconds(value) -> float:
+  if isinstance(value, datetime.datetime):
+    return value.timestamp()
+  return float(value)
+
+
+def percentile(values: List[float], pct: float) -> float:
+  values = sorted(values)
+  if not values:
+    return 0.0
+  index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+  return values[index]
+
+
+def summarize(durations: Dict[str, List[float]]) -> Dict[str, dict]:
+  return {
+      stage: {
+          "count": len(values),
+          "p50_ms": round(percentile(values, 50) * 1000, 1),
+          "p99_ms": round(percentile(values, 99) * 1000, 1),
+          "mean_ms": round(statistics.mean(values) * 1000, 1),
+      } for stage, values in sorted(durations.items()) if values
+  }
+
+
+def run_hitl(hitl_client, uids: List[str], count: int,
+    durations: Dict[str, List[float]]):
+  start_time = time.time()
+  response = hitl_client.get("/hitl_service/v1/report_data")
+  durations["hitl_report_data"].append(time.time() - start_time)
+  assert response.status_code == 200, response.text
+
+  for i in range(min(count, len(uids))):
+    uid = uids[i]
+    start_time = time.time()
+    document = hitl_client.post(f"/hitl_service/v1/get_document?uid={uid}")
+    durations["hitl_get_document"].append(time.time() - start_time)
+    case_id = document.json().get("data", {}).get("case_id")
+    start_time = time.time()
+    hitl_client.get(
+        f"/hitl_service/v1/fetch_file?case_id={case_id}&uid={uid}")
+    durations["hitl_fetch_file"].append(time.time() - start_time)
+
+
+def main():
+  args = parse_args()
+  work_dir = tempfile.mkdtemp(prefix="cda-benchmark-")
+  try:
+    fakes = setup_environment(args, work_dir)
+    folder = seed_buckets(fakes, args)
+
+    from common.utils import metrics  # pylint: disable=import-outside-toplevel
+    durations: Dict[str, List[float]] = {}
+    lock = threading.Lock()
+
+    def record(stage: str, seconds: float):
+      with lock:
+        durations.setdefault(stage, []).append(seconds)
+
+    metrics.add_listener(record)
+
+    clients = {marker: load_service(src_dir) for marker, src_dir in SERVICES}
+    install_router(clients)
+    install_queue(fakes, clients["/upload_service/v1"])
+
+    print(f"Running benchmark with {args.corpus_size} documents, "
+          f"DATABASE_PREFIX={os.environ['DATABASE_PREFIX']}")
+    start_time = time.time()
+    response = clients["/start-pipeline"].post(
+        "/start-pipeline/run",
+        json={"bucket": INPUT_BUCKET, "name": f"{folder}/START_PIPELINE"})
+    assert response.status_code == 200, response.text
+    uids = response.json()["uid_list"]
+
+    finished = wait_for_documents(uids, args.timeout)
+    elapsed = time.time() - start_time
+
+    for document in finished.values():
+      timestamps = [to_seconds(s["timestamp"])
+                    for s in document.get("system_status") or []
+                    if s.get("timestamp")]
+      if timestamps and document.get("upload_timestamp"):
+        record("end_to_end",
+               max(timestamps) - to_seconds(document["upload_timestamp"]))
+
+    durations.setdefault("hitl_report_data", [])
+    durations.setdefault("hitl_get_document", [])
+    durations.setdefault("hitl_fetch_file", [])
+    run_hitl(clients["/hitl_service/v1"], uids, args.hitl_requests,
+             durations)
+
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    report = {
+        "corpus_size": args.corpus_size,
+        "finished": len(finished),
+        "elapsed_seconds": round(elapsed, 2),
+        "docs_per_second": round(len(finished) / elapsed, 3),
+        "peak_rss_mb": round(peak_rss_kb / 1024, 1),
+        "stages": summarize(durations),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+      with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    if len(finished) < len(uids):
+      print(f"{len(uids) - len(finished)} documents did not finish "
+            f"within {args.timeout} seconds")
+      sys.exit(1)
+  finally:
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+  main()
@@ -23,6 +23,7 @@ from models.process_task import ProcessTask
 from utils.classification.split_and_classify import batch_classification
 from utils.classification.split_and_classify import update_classification_status
 from common.utils.api_calls import extract_documents
+from common.utils import pipeline_orchestrator
 
 from common.config import CLASSIFIER
 from common.config import STATUS_ERROR
@@ -68,30 +69,7 @@ async def classification(payload: ProcessTask, background_task: BackgroundTasks)
 
     # When classifier/splitter is not setup
     if not processor:
-      # update status for all documents
-      default_class = get_classification_default_class()
-      logger.warning(
-        f"classification_api - No classification parser defined, exiting classification, "
-        f"using {default_class}")
-      f_uids = []
-      for uri in input_uris:
-        case_id, uid = get_id_from_file_path(uri)
-        if uid is None:
-          logger.error(f"classification_api - Cannot find document with url = {uri}")
-          continue
-
-        #To refactor (one service waiting another one sync)
-        update_classification_status(case_id,
-                                     uid,
-                                     STATUS_SUCCESS,
-                                     document_class=default_class,
-                                     classification_score=-1)
-        f_uids.append(uid)
-        # Prepare for extraction
-        extraction_dic = {}
-        parser_name = get_parser_name_by_doc_class(default_class)
-        extract_documents(f_uids, parser_name)
-
+      classify_with_default_class(input_uris)
       return SUCCESS_RESPONSE
 
     background_task.add_task(batch_classification,
@@ -106,4 +84,45 @@ async def classification(payload: ProcessTask, background_task: BackgroundTasks)
     logger.error(err)
     # DocumentStatus api call
     # update_classification_status(case_id, uid, STATUS_ERROR)
-    raise HTTPException(status_code=500, detail=FAILED_RESPONSE) from e
\ No newline at end of file
+    raise HTTPException(status_code=500, detail=FAILED_RESPONSE) from e
+
+
+def classify_with_default_class(input_uris):
+  """Assigns the default class when no classifier is set up and starts
+  the extraction"""
+  # update status for all documents
+  default_class = get_classification_default_class()
+  logger.warning(
+    f"classification_api - No classification parser defined, exiting classification, "
+    f"using {default_class}")
+  f_uids = []
+  for uri in input_uris:
+    case_id, uid = get_id_from_file_path(uri)
+    if uid is None:
+      logger.error(f"classification_api - Cannot find document with url = {uri}")
+      continue
+
+    #To refactor (one service waiting another one sync)
+    update_classification_status(case_id,
+                                 uid,
+                                 STATUS_SUCCESS,
+                                 document_class=default_class,
+                                 classification_score=-1)
+    f_uids.append(uid)
+  # Prepare for extraction
+  parser_name = get_parser_name_by_doc_class(default_class)
+  extract_documents(f_uids, parser_name)
+
+
+async def classification_stage_handler(payload):
+  """Runs a classification task of the pipeline orchestrator"""
+  configs = payload.get("configs")
+  processor, dai_client, input_uris = get_docai_input(CLASSIFIER, configs)
+  if not processor:
+    classify_with_default_class(input_uris)
+    return
+  await batch_classification(processor, dai_client, input_uris)
+
+
+pipeline_orchestrator.register_stage_handler(
+    pipeline_orchestrator.STAGE_CLASSIFICATION, classification_stage_handler)
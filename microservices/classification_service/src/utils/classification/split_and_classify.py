@@ -15,13 +15,13 @@ limitations under the License.
 """
 import datetime
 import os.path
-import re
+import time
 import traceback
 from typing import Dict
 from typing import List
 
+from fastapi.concurrency import run_in_threadpool
 from google.cloud import documentai_v1 as documentai
-from google.cloud import storage
 from pikepdf import Pdf
 from .api_calls import upload_document, update_classification_status
 from common.utils.api_calls import extract_documents
@@ -31,10 +31,17 @@ from common.config import DOC_CLASS_SPLIT_DISPLAY_NAME
 from common.config import PDF_MIME_TYPE
 from common.config import STATUS_SPLIT
 from common.config import STATUS_SUCCESS
+from common.config import FIELD_MASK_CLASSIFIER
+from common.config import get_field_mask
 from common.config import get_document_class_by_classifier_label
 from common.docai_config import DOCAI_OUTPUT_BUCKET_NAME
 
+from common.utils import docai_cache
+from common.utils import docai_helper
+from common.utils import docai_submitter
 from common.utils import helper
+from common.utils import lro_tracker
+from common.utils import metrics
 from common.utils.helper import get_id_from_file_path
 
 from common.utils.logging_handler import Logger
@@ -43,14 +50,32 @@ from .download_pdf_gcs import download_pdf_gcs
 logger = Logger.get_logger(__name__)
 PDF_EXTENSION = ".pdf"
 
-storage_client = storage.Client()
-
 
 async def batch_classification(processor: documentai.types.processor.Processor,
     dai_client, input_uris: List[str]):
   logger.info(f"batch_classification - input_uris = {input_uris}")
+
+  # Identical files already classified by this processor version
+  cached_documents, input_uris = await run_in_threadpool(
+      docai_cache.lookup, processor, input_uris,
+      get_field_mask(FIELD_MASK_CLASSIFIER))
+  if cached_documents:
+    await run_in_threadpool(classify_documents, cached_documents)
+
+  # Small documents are classified with the synchronous endpoint, skipping
+  # the LRO polling and the GCS output round trip
+  online_docs, batch_uris = await run_in_threadpool(
+      docai_helper.split_online_batch, input_uris)
+  if online_docs:
+    failed_uris = await run_in_threadpool(online_classification, processor,
+                                          dai_client, online_docs)
+    batch_uris.extend(failed_uris)
+
+  if not batch_uris:
+    return
+
   input_docs = [documentai.GcsDocument(gcs_uri=doc_uri, mime_type=PDF_MIME_TYPE)
-                for doc_uri in list(input_uris)]
+                for doc_uri in list(batch_uris)]
   gcs_documents = documentai.GcsDocuments(documents=input_docs)
   input_config = documentai.BatchDocumentsInputConfig(gcs_documents=gcs_documents)
 
@@ -67,13 +92,16 @@ async def batch_classification(processor: documentai.types.processor.Processor,
   # del_gcs_folder(gcs_output_uri.split("//")[1], gcs_output_uri_prefix)
 
   # Temp op folder location
+  # only entities and page numbers are needed to split and classify
+  gcs_output_config = documentai.DocumentOutputConfig.GcsOutputConfig(
+      gcs_uri=destination_uri, field_mask=get_field_mask(FIELD_MASK_CLASSIFIER))
   output_config = documentai.DocumentOutputConfig(
-      gcs_output_config={"gcs_uri": destination_uri})
+      gcs_output_config=gcs_output_config)
 
   logger.info(f"batch_classification - input_config = {input_config}")
   logger.info(f"batch_classification - output_config = {output_config}")
   logger.info(
-      f"batch_classification - Calling DocAI API for {len(input_uris)} document(s) "
+      f"batch_classification - Calling DocAI API for {len(batch_uris)} document(s) "
       f" using {processor.display_name} processor "
       f"type={processor.type_}, path={processor.name}")
 
@@ -83,135 +111,150 @@ async def batch_classification(processor: documentai.types.processor.Processor,
       input_documents=input_config,
       document_output_config=output_config,
   )
-  operation = dai_client.batch_process_documents(request)
+  # waits for processor quota and a free LRO slot, retrying quota errors
+  operation = await run_in_threadpool(docai_submitter.submit_batch,
+                                      dai_client, request)
   # Continually polls the operation until it is complete.
   # This could take some time for larger files
   # Format: projects/PROJECT_NUMBER/locations/LOCATION/operations/OPERATION_ID
 
   # operation.result()
   # metadata = documentai.BatchProcessMetadata(operation.metadata)
+  lro_tracker.register_operation(operation.operation.name,
+                                 lro_tracker.STAGE_CLASSIFICATION, processor,
+                                 batch_uris,
+                                 get_field_mask(FIELD_MASK_CLASSIFIER))
   operation.add_done_callback(
-      get_callback_fn())
+      get_callback_fn(len(batch_uris)))
   logger.info(
       f"batch_classification - DocAI extraction operation started in the background as LRO")
 
 
-def get_callback_fn():
+def online_classification(processor: documentai.types.processor.Processor,
+    dai_client, online_docs: Dict[str, bytes]) -> List[str]:
+  """
+  Classifies documents using the synchronous endpoint.
+  Returns uris which failed and need to go through batch processing.
+  """
+  start_time = time.time()
+  documents, failed_uris = docai_helper.process_documents_online(
+      processor, dai_client, online_docs,
+      field_mask=get_field_mask(FIELD_MASK_CLASSIFIER))
+  logger.info(
+      f"online_classification - route=online, documents={len(documents)}, "
+      f"failed={len(failed_uris)}, "
+      f"latency={round((time.time() - start_time) * 1000)} ms")
+  metrics.observe(metrics.STAGE_CLASSIFY_ONLINE, time.time() - start_time)
+  if documents:
+    classify_documents(documents)
+    docai_cache.store_documents(processor, documents,
+                                get_field_mask(FIELD_MASK_CLASSIFIER))
+  return failed_uris
+
+
+def get_callback_fn(document_count: int = 0):
+  start_time = time.time()
+
   def post_process_classify(future):
     print(f"post_process_classify - Classification Complete!")
     print(f"post_process_classify - operation.metadata={future.metadata}")
 
     metadata = documentai.BatchProcessMetadata(future.metadata)
-    documents = {}
-
-    if metadata.state != documentai.BatchProcessMetadata.State.SUCCEEDED:
-      raise ValueError(f"Batch Process Failed: {metadata.state_message}")
-
-    # One process per Input Document
-    for process in metadata.individual_process_statuses:
-      try:
-        # output_gcs_destination format: gs://BUCKET/PREFIX/OPERATION_NUMBER/INPUT_FILE_NUMBER/
-        # The Cloud Storage API requires the bucket name and URI prefix separately
-        matches = re.match(r"gs://(.*?)/(.*)", process.output_gcs_destination)
-        if not matches:
-          logger.warning(
-              f"post_process_classify - "
-              f"Could not parse output GCS destination:[{process.output_gcs_destination}]")
-          logger.warning(f"post_process_classify - {process.status}")
-          continue
-
-        output_bucket, output_prefix = matches.groups()
-        output_gcs_destination = process.output_gcs_destination
-        input_gcs_source = process.input_gcs_source
-        logger.info(
-            f"post_process_classify - output_bucket = {output_bucket}, "
-            f"output_prefix={output_prefix}, "
-            f"input_gcs_source = {input_gcs_source}, "
-            f"output_gcs_destination = {output_gcs_destination}")
-
-        # Get List of Document Objects from the Output Bucket
-        output_blobs = storage_client.list_blobs(output_bucket,
-                                                 prefix=output_prefix + "/")
-
-        # Document AI may output multiple JSON files per source file
-        # Todo handle sharding
-
-        for blob in output_blobs:
-          # Document AI should only output JSON files to GCS
-          if ".json" not in blob.name:
-            logger.info(
-                f"post_process_classify - Skipping non-supported file: {blob.name} - Mimetype: {blob.content_type}"
-            )
-            continue
-
-          # Download JSON File as bytes object and convert to Document Object
-          logger.info(f"Fetching gs://{output_bucket}/{blob.name}")
-          document = documentai.Document.from_json(
-              blob.download_as_bytes(), ignore_unknown_fields=True
-          )
-          dirs, file_name = helper.split_uri_2_path_filename(input_gcs_source)
-          logger.info(
-              f"post_process_classify - dirs = {dirs}, file_name = {file_name}")
 
-          entities = document.entities
+    logger.info(
+        f"post_process_classify - route=batch, documents={document_count}, "
+        f"latency={round((time.time() - start_time) * 1000)} ms")
+    metrics.observe(metrics.STAGE_CLASSIFY_LRO_WAIT, time.time() - start_time)
+    lro_tracker.handle_operation_result(future.operation.name,
+                                        lro_tracker.STAGE_CLASSIFICATION,
+                                        metadata)
 
-          # For possible sharding across blobs
-          if input_gcs_source in documents.keys():
-            labels = documents[input_gcs_source].get('labels')
-            scores = documents[input_gcs_source].get('scores')
-            pages = documents[input_gcs_source].get('pages')
-          else:
-            labels = []
-            scores = []
-            pages = []
-
-          for index, entity in enumerate(entities):
-            # If Splitter, multiple pages present
-            if len(entity.page_anchor.page_refs) > 0:
-              start = int(entity.page_anchor.page_refs[0].page)
-              end = int(entity.page_anchor.page_refs[-1].page)
-            # If Classifier, then pages are not returned
-            else:
-              start = 0
-              end = document.pages[-1].page_number
+    print("post_process_classify - Done!")
 
-            score = float('%.2f' % entity.confidence)
-            label = entity.type_.replace("/", "_")
+  return post_process_classify
 
-            scores.append(score)
-            labels.append(label)
-            pages.append((start, end))
 
-            logger.info(
-                f"post_process_classify - Classification result for {input_gcs_source}: "
-                f"document_class={label}, confidence={score}, "
-                f"start={start}, end={end}")
+def handle_classification_operation(
+    metadata: documentai.BatchProcessMetadata, processor_type: str):
+  documents = docai_helper.load_batch_process_documents(metadata)
+  classify_documents(documents)
 
-          documents[input_gcs_source] = {'scores': scores,
-                                         'labels': labels,
-                                         'pages': pages}
 
-      except Exception as ex:
-        logger.error(ex)
-        err = traceback.format_exc().replace("\n", " ")
-        logger.error(err)
+# Results of operations submitted by any replica are handled the same way
+lro_tracker.register_stage_handler(lro_tracker.STAGE_CLASSIFICATION,
+                                   handle_classification_operation)
 
-    # Classification
-    classification_dic = {}
-    # Contains per processed document - a list of identified pages with scores and document_class
-    handle_classification_results(documents, classification_dic)
 
-    # Prepare for extraction
-    extraction_dic = {}
-    # dictionary per processor name - list of uris to extract
-    get_documents_for_extraction(classification_dic, extraction_dic)
+def classify_documents(processed_documents: Dict[str, List[documentai.Document]]):
+  """
+  Handles classifier output (from either online or batch processing),
+  splits documents when needed and sends them for extraction.
+  """
+  documents = {}
+  for input_gcs_source in processed_documents:
+    try:
+      for document in processed_documents[input_gcs_source]:
+        metrics.count(metrics.STAGE_CLASSIFY, pages=len(document.pages))
+        dirs, file_name = helper.split_uri_2_path_filename(input_gcs_source)
+        logger.info(
+            f"classify_documents - dirs = {dirs}, file_name = {file_name}")
+
+        entities = document.entities
+
+        # For possible sharding across blobs
+        if input_gcs_source in documents.keys():
+          labels = documents[input_gcs_source].get('labels')
+          scores = documents[input_gcs_source].get('scores')
+          pages = documents[input_gcs_source].get('pages')
+        else:
+          labels = []
+          scores = []
+          pages = []
+
+        for index, entity in enumerate(entities):
+          # If Splitter, multiple pages present
+          if len(entity.page_anchor.page_refs) > 0:
+            start = int(entity.page_anchor.page_refs[0].page)
+            end = int(entity.page_anchor.page_refs[-1].page)
+          # If Classifier, then pages are not returned
+          else:
+            start = 0
+            end = document.pages[-1].page_number
 
-    for parser in extraction_dic:
-      extract_documents(extraction_dic[parser], parser)
+          score = float('%.2f' % entity.confidence)
+          label = entity.type_.replace("/", "_")
 
-    print("post_process_classify - Done!")
+          scores.append(score)
+          labels.append(label)
+          pages.append((start, end))
 
-  return post_process_classify
+          logger.info(
+              f"classify_documents - Classification result for {input_gcs_source}: "
+              f"document_class={label}, confidence={score}, "
+              f"start={start}, end={end}")
+
+        documents[input_gcs_source] = {'scores': scores,
+                                       'labels': labels,
+                                       'pages': pages}
+      metrics.count(metrics.STAGE_CLASSIFY)
+
+    except Exception as ex:
+      logger.error(ex)
+      err = traceback.format_exc().replace("\n", " ")
+      logger.error(err)
+
+  # Classification
+  classification_dic = {}
+  # Contains per processed document - a list of identified pages with scores and document_class
+  handle_classification_results(documents, classification_dic)
+
+  # Prepare for extraction
+  extraction_dic = {}
+  # dictionary per processor name - list of uris to extract
+  get_documents_for_extraction(classification_dic, extraction_dic)
+
+  for parser in extraction_dic:
+    extract_documents(extraction_dic[parser], parser)
 
 
 def get_documents_for_extraction(classification_dic, extraction_dic):
@@ -21,6 +21,7 @@ import uvicorn
 import asyncio
 import time
 import config
+from common.utils import metrics
 from common.utils.logging_handler import Logger
 from concurrent.futures import ThreadPoolExecutor
 from fastapi.middleware.cors import CORSMiddleware
@@ -52,8 +53,9 @@ async def add_process_time_header(request: Request, call_next):
   method = request.method
   path = request.scope.get("path")
   start_time = time.time()
+  metrics.set_trace_id(request.headers.get(metrics.TRACE_HEADER))
   response = await call_next(request)
-  if path != "/ping":
+  if path not in ["/ping", "/metrics"]:
     process_time = time.time() - start_time
     time_elapsed = round(process_time * 1000)
     logger.info(f"{method} {path} Time elapsed: {str(time_elapsed)} ms")
@@ -65,6 +67,11 @@ def health_check():
   return True
 
 
+@app.get("/metrics")
+def get_metrics():
+  return metrics.metrics_response()
+
+
 api = FastAPI(title="Config Service API", version="latest")
 
 api.include_router(get_config.router)
@@ -31,7 +31,9 @@ from common.config import STATUS_SPLIT
 from common.config import STATUS_SUCCESS
 from common.config import get_display_name_by_doc_class
 from common.models import Document
+from common.utils import metrics
 from common.utils.logging_handler import Logger
+from models.create_document import CreateDocument
 
 
 logger = Logger.get_logger(__name__)
@@ -41,8 +43,65 @@ logger = Logger.get_logger(__name__)
 router = APIRouter()
 
 
+@fireo.transactional
+def create_if_absent_transaction(transaction, document: Document):
+  """Saves the document unless a document with its id exists already"""
+  existing_document = Document.collection.get(
+      fireo.utils.utils.generateKeyFromId(Document, document.id),
+      transaction=transaction)
+  if existing_document is not None:
+    return existing_document, False
+  document.save(transaction=transaction)
+  return document, True
+
+
+def new_document(case_id: str, context: str, user=None,
+                 idempotency_key: Optional[str] = None):
+  """Creates the record of an uploaded document with a single write,
+  the uid is generated before saving.
+
+     Args:
+       case_id (str): Case id of the files
+       context: The context for which application is being used
+       user: user uploading the document from the UI, if any
+       idempotency_key: e.g. bucket, object name and generation of the file,
+                        retries with the same key return the existing document
+     Returns:
+       (Document, bool): the document and whether it was created
+  """
+  uid = Document.generate_id(idempotency_key)
+  document = Document()
+  document.id = uid
+  document.uid = uid
+  document.case_id = case_id
+  document.upload_timestamp = datetime.datetime.utcnow()
+  document.context = context
+  document.active = "active"
+  document.trace_id = metrics.get_trace_id() or metrics.new_trace_id()
+  document.system_status = [{
+      "is_hitl": True if user else False,
+      "user": "User" if user else None,
+      "stage": "upload",
+      "status": STATUS_SUCCESS,
+      "timestamp": datetime.datetime.utcnow()
+  }]
+  if not idempotency_key:
+    document.save()
+    return document, True
+
+  # lookup and create in one transaction, so concurrent redeliveries with
+  # the same key can not overwrite each other
+  document, created = create_if_absent_transaction(fireo.transaction(),
+                                                   document)
+  if not created:
+    logger.info(f"new_document - idempotency_key={idempotency_key} "
+                f"already used by uid={uid}")
+  return document, created
+
+
 @router.post("/create_document")
-async def create_document(case_id: str, filename: str, context: str, user=None):
+async def create_document(case_id: str, filename: str, context: str, user=None,
+                          idempotency_key: Optional[str] = None):
   """takes case_id ,filename as input and Save the record in the database
 
      Args:
@@ -50,27 +109,19 @@ async def create_document(case_id: str, filename: str, context: str, user=None):
        filename : get the filename form upload files api
        context: The context for which application is being used
                 Example - Arizona , Callifornia etc
+       idempotency_key: optional key of the uploaded file, e.g.
+                bucket/object#generation, retries return the existing uid
      Returns:
-       200 : PDF files are successfully saved in db
+       200 : PDF files are successfully saved in db, returns uid, the
+             case_id of the document and whether it was created
        500 : If something fails
      """
   try:
-    logger.info(f"create_document with case_id={case_id}, filename={filename}, context={context}")
-    document = Document()
-    document.case_id = case_id
-    document.upload_timestamp = datetime.datetime.utcnow()
-    document.context = context
-    document.uid = document.save().id
-    document.active = "active"
-    document.system_status = [{
-        "is_hitl": True if user else False,
-        "user": "User" if user else None,
-        "stage": "upload",
-        "status": STATUS_SUCCESS,
-        "timestamp": datetime.datetime.utcnow()
-    }]
-    document.save()
-    return {"status": STATUS_SUCCESS, "status_code": 200, "uid": document.uid}
+    logger.info(f"create_document with case_id={case_id}, filename={filename}, "
+                f"context={context}, idempotency_key={idempotency_key}")
+    document, created = new_document(case_id, context, user, idempotency_key)
+    return {"status": STATUS_SUCCESS, "status_code": 200, "uid": document.uid,
+            "case_id": document.case_id, "created": created}
 
   except Exception as e:
     logger.error(f"Error in create document for case_id {case_id} "
@@ -83,6 +134,38 @@ async def create_document(case_id: str, filename: str, context: str, user=None):
         detail=f"Error in creating documents for case_id {case_id}") from e
 
 
+@router.post("/create_documents")
+async def create_documents(documents: List[CreateDocument]):
+  """Bulk variant of create_document, creates the records of many uploaded
+  documents in one request
+
+     Args:
+       documents: case_id, filename, context, user and idempotency_key
+                  per document
+     Returns:
+       200 : list of uid, case_id and created per document, in input order
+       500 : If something fails
+     """
+  try:
+    logger.info(f"create_documents with {len(documents)} documents")
+    results = []
+    for request in documents:
+      document, created = new_document(request.case_id, request.context,
+                                       request.user, request.idempotency_key)
+      results.append({"uid": document.uid, "case_id": document.case_id,
+                      "filename": request.filename, "created": created})
+    return {"status": STATUS_SUCCESS, "status_code": 200,
+            "documents": results}
+
+  except Exception as e:
+    logger.error(f"Error in create documents for {len(documents)} documents")
+    logger.error(e)
+    err = traceback.format_exc().replace("\n", " ")
+    logger.error(err)
+    raise HTTPException(
+        status_code=500, detail="Error in creating documents") from e
+
+
 @router.post("/update_classification_status")
 async def update_classification_status(
     case_id: str,
@@ -373,7 +456,7 @@ async def create_documet_json_input(case_id: str, document_class: str, entity: L
     document.active = "active"
     document.document_class = document_class
     document.context = context
-    document.uid = document.save().id
+    document.id = document.uid = Document.generate_id()
     gcs_base_url = f"gs://{BUCKET_NAME}"
     document.url = f"{gcs_base_url}/{case_id}/{document.uid}" \
                 f"/input_data_{case_id}_{document.uid}.json"
@@ -57,6 +57,35 @@ def test_create_document_negative(client_with_emulator):
   assert response.status_code == 422
 
 
+def test_create_document_idempotency_key(client_with_emulator):
+  url = f"{api_url}create_document?case_id=345&filename=arkansaa.pdf" \
+        f"&context=arizona"
+  params = {"idempotency_key": "bucket/folder/arkansaa.pdf#1"}
+  first = client_with_emulator.post(url, params=params).json()
+  retry = client_with_emulator.post(url.replace("345", "678"),
+                                    params=params).json()
+  assert first["created"] is True
+  assert retry["created"] is False
+  assert retry["uid"] == first["uid"]
+  assert retry["case_id"] == "345"
+  document = Document.find_by_uid(first["uid"])
+  assert document.id == first["uid"]
+
+
+def test_create_documents_bulk(client_with_emulator):
+  documents = [{"case_id": "345", "filename": "a.pdf", "context": "arizona",
+                "idempotency_key": "bucket/a.pdf#1"},
+               {"case_id": "345", "filename": "b.pdf", "context": "arizona"},
+               {"case_id": "345", "filename": "a.pdf", "context": "arizona",
+                "idempotency_key": "bucket/a.pdf#1"}]
+  response = client_with_emulator.post(f"{api_url}create_documents",
+                                       json=documents)
+  assert response.status_code == 200
+  results = response.json()["documents"]
+  assert [result["created"] for result in results] == [True, True, False]
+  assert results[0]["uid"] == results[2]["uid"] != results[1]["uid"]
+
+
 def test_extracion_status_update(client_with_emulator):
   uid = create_document(client_with_emulator, "test-01")
   response = client_with_emulator.post(
@@ -21,6 +21,11 @@ import uvicorn
 import asyncio
 import time
 import config
+from common.config import PIPELINE_ORCHESTRATOR_ENABLED
+from common.utils import lro_tracker
+from common.utils import pipeline_orchestrator
+from common.utils import metrics
+from common.utils import priority_scheduler
 from common.utils.logging_handler import Logger
 from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, Request
@@ -35,13 +40,40 @@ def set_default_executor():
   loop.set_default_executor(ThreadPoolExecutor(max_workers=1000))
 
 
+@app.on_event("startup")
+async def start_operation_poller():
+  # Picks up DocAI operations whose submitting replica went away
+  asyncio.create_task(lro_tracker.poll_operations(lro_tracker.STAGE_EXTRACTION))
+
+
+@app.on_event("startup")
+def start_pipeline_workers():
+  if PIPELINE_ORCHESTRATOR_ENABLED:
+    pipeline_orchestrator.start_workers()
+
+
+@app.on_event("startup")
+async def start_pipeline_sweeper():
+  if PIPELINE_ORCHESTRATOR_ENABLED:
+    # Re-publishes stage tasks whose Pub/Sub message was lost
+    asyncio.create_task(pipeline_orchestrator.sweep_tasks())
+
+
+@app.on_event("shutdown")
+def stop_pipeline_workers():
+  pipeline_orchestrator.stop_workers()
+
+
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
   method = request.method
   path = request.scope.get("path")
   start_time = time.time()
+  metrics.set_trace_id(request.headers.get(metrics.TRACE_HEADER))
+  priority_scheduler.set_priority(
+      request.headers.get(priority_scheduler.PRIORITY_HEADER))
   response = await call_next(request)
-  if path != "/ping":
+  if path not in ["/ping", "/metrics"]:
     process_time = time.time() - start_time
     time_elapsed = round(process_time * 1000)
     logger.info(f"{method} {path} Time elapsed: {str(time_elapsed)} ms")
@@ -53,6 +85,11 @@ def health_check():
   return True
 
 
+@app.get("/metrics")
+def get_metrics():
+  return metrics.metrics_response()
+
+
 api = FastAPI(title="Extraction Service API", version="latest")
 
 api.include_router(extraction.router)
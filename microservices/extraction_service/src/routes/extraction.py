@@ -25,7 +25,9 @@ from utils.extract_entities import extract_entities
 
 from common.config import STATUS_ERROR
 from common.config import STATUS_SUCCESS
+from common.utils import pipeline_orchestrator
 from common.utils.docai_helper import get_docai_input
+from common.utils.process_extraction_result_helper import validate_match_approve
 from common.utils.logging_handler import Logger
 
 
@@ -79,3 +81,24 @@ async def extraction(payload: ProcessTask, background_task: BackgroundTasks):
     logger.error(e)
     logger.error(err)
     raise HTTPException(status_code=500)
+
+
+async def extraction_stage_handler(payload):
+  """Runs an extraction task of the pipeline orchestrator"""
+  parser_name = payload.get("parser_name")
+  configs = [{"uid": uid} for uid in payload.get("uids")]
+  processor, dai_client, input_uris = get_docai_input(parser_name, configs)
+  if not processor or not dai_client:
+    raise ValueError(f"Failed to get processor {parser_name} using config")
+  await extract_entities(processor, dai_client, input_uris)
+
+
+def validation_stage_handler(payload):
+  """Runs validation, matching and auto-approval of an extracted document"""
+  validate_match_approve(**payload)
+
+
+pipeline_orchestrator.register_stage_handler(
+    pipeline_orchestrator.STAGE_EXTRACTION, extraction_stage_handler)
+pipeline_orchestrator.register_stage_handler(
+    pipeline_orchestrator.STAGE_VALIDATION, validation_stage_handler)
@@ -17,6 +17,7 @@ import datetime
 import json
 import os.path
 import re
+import time
 import traceback
 import warnings
 from typing import Any
@@ -24,20 +25,29 @@ from typing import Dict
 from typing import List
 
 import proto
+from fastapi.concurrency import run_in_threadpool
 from google.api_core.operation import Operation
 from google.cloud import documentai_v1 as documentai
-from google.cloud import storage
 
 from common import models
 from common.config import PDF_MIME_TYPE
+from common.config import PIPELINE_ORCHESTRATOR_ENABLED
 from common.config import STATUS_ERROR
 from common.config import STATUS_SUCCESS
 from common.config import get_doc_type_by_doc_class
 from common.config import get_docai_entity_mapping, get_docai_warehouse
+from common.config import get_field_mask
 from common.db_client import bq_client
 from common.docai_config import DOCAI_ATTRIBUTES_TO_IGNORE
 from common.docai_config import DOCAI_OUTPUT_BUCKET_NAME
 from common.docai_config import ExtractionOutput
+from common.utils import docai_cache
+from common.utils import docai_helper
+from common.utils import docai_submitter
+from common.utils import lro_tracker
+from common.utils import metrics
+from common.utils import pipeline_orchestrator
+from common.utils import priority_scheduler
 from common.utils import process_extraction_result_helper
 from common.utils.docai_warehouse_helper import process_document
 from common.utils.document_ai_utils import get_key_values_dic
@@ -57,7 +67,6 @@ warnings.simplefilter(action="ignore")
 logger = Logger.get_logger(__name__)
 SERVICE_ACCOUNT_EMAIL_GKE = os.getenv("SERVICE_ACCOUNT_EMAIL_GKE")
 
-storage_client = storage.Client()
 bq = bq_client()
 
 
@@ -150,12 +159,14 @@ def handle_extraction_results(extraction_output: List[ExtractionOutput]):
         f"case_id={case_id}, uid={uid}, "
         f"doc_class={doc_class}")
     # stream_document_to_bigquery updates data to bigquery
-    bq_update_status = stream_document_to_bigquery(bq, case_id, uid,
-                                                   doc_class, document_type,
-                                                   entities_for_bq, gcs_url,
-                                                   document.ocr_text,
-                                                   document.classification_score,
-                                                   document.is_hitl_classified)
+    with metrics.timed(metrics.STAGE_BQ_STREAM, document.trace_id, uid):
+      bq_update_status = stream_document_to_bigquery(bq, case_id, uid,
+                                                     doc_class, document_type,
+                                                     entities_for_bq, gcs_url,
+                                                     document.ocr_text,
+                                                     document.classification_score,
+                                                     document.is_hitl_classified)
+    metrics.count(metrics.STAGE_EXTRACT)
     if not bq_update_status:
       logger.info(f"extraction_api - Successfully streamed {count} data to BQ ")
     else:
@@ -172,11 +183,24 @@ def handle_extraction_results(extraction_output: List[ExtractionOutput]):
     if extraction_item.extraction_score is not None:
       logger.info(
           f"extraction score is {extraction_item.extraction_score} for {uid}")
-      process_extraction_result_helper.validate_match_approve(case_id, uid,
-                                                              extraction_item.extraction_score,
-                                                              extraction_item.extraction_field_min_score,
-                                                              extraction_item.extracted_entities,
-                                                              doc_class)
+      if PIPELINE_ORCHESTRATOR_ENABLED:
+        pipeline_orchestrator.enqueue(pipeline_orchestrator.STAGE_VALIDATION, {
+            "case_id": case_id,
+            "uid": uid,
+            "extraction_score": extraction_item.extraction_score,
+            "min_extraction_score_per_field":
+                extraction_item.extraction_field_min_score,
+            "extraction_entities": extraction_item.extracted_entities,
+            "document_class": doc_class,
+            "trace_id": document.trace_id
+        }, document.trace_id)
+      else:
+        process_extraction_result_helper.validate_match_approve(case_id, uid,
+                                                                extraction_item.extraction_score,
+                                                                extraction_item.extraction_field_min_score,
+                                                                extraction_item.extracted_entities,
+                                                                doc_class,
+                                                                document.trace_id)
 
 
 def specialized_parser_extraction_from_json(data, db_document: models.Document):
@@ -279,11 +303,14 @@ def specialized_parser_extraction(
 
     for processed_doc in processed_documents[input_gcs_source]:
       try:
+        metrics.count(metrics.STAGE_EXTRACT, pages=len(processed_doc.pages))
         # TODO handle sharding
         json_string = proto.Message.to_json(processed_doc)
         data = json.loads(json_string)
-        specialized_parser_entities_list = specialized_parser_extraction_from_json(
-            data, db_document)
+        with metrics.timed(metrics.STAGE_MAPPING, db_document.trace_id,
+                           db_document.uid):
+          specialized_parser_entities_list = specialized_parser_extraction_from_json(
+              data, db_document)
         entities.append(post_processing(db_document.uid,
                                         specialized_parser_entities_list, data.get("text"), True))
       except Exception as e:
@@ -292,85 +319,24 @@ def specialized_parser_extraction(
         logger.error(err)
 
 
-def get_callback_fn(operation: Operation, processor_type: str):
+def get_callback_fn(operation: Operation, processor_type: str,
+    document_count: int = 0):
+  start_time = time.time()
+
   def post_process_extract(future):
     # Once the operation is complete,
     # get output document information from operation metadata
     try:
       metadata = documentai.BatchProcessMetadata(operation.metadata)
-      if metadata.state != documentai.BatchProcessMetadata.State.SUCCEEDED:
-        raise ValueError(
-            f"post_process_extract - Batch Process Failed: {metadata.state_message}")
-
-      logger.info(f"post_process_extract - processor_type={processor_type}")
-
-      documents = {}  # Contains per processed document, keys are path to original document
-
-      # One process per Input Document
-      blob_count = 0
-      for process in metadata.individual_process_statuses:
-        # output_gcs_destination format: gs://BUCKET/PREFIX/OPERATION_NUMBER/INPUT_FILE_NUMBER/
-        # The Cloud Storage API requires the bucket name and URI prefix separately
-        matches = re.match(r"gs://(.*?)/(.*)", process.output_gcs_destination)
-        if not matches:
-          logger.warning(
-              f"post_process_extract - Could not parse output GCS destination:[{process.output_gcs_destination}]")
-          logger.warning(f"post_process_extract - {process.status}")
-          continue
-
-        output_bucket, output_prefix = matches.groups()
-        output_gcs_destination = process.output_gcs_destination
-        input_gcs_source = process.input_gcs_source
-        logger.info(
-            f"post_process_extract - Handling DocAI results for {input_gcs_source} using "
-            f"process output {output_gcs_destination}")
-        # Get List of Document Objects from the Output Bucket
-        output_blobs = storage_client.list_blobs(output_bucket,
-                                                 prefix=output_prefix + "/")
-
-        # Document AI may output multiple JSON files per source file
-        # Sharding happens when the output JSON File gets over a size threshold
-        # (> 10MB, around 40 or 50 pages).
-        for blob in output_blobs:
-          # Document AI should only output JSON files to GCS
-          if ".json" not in blob.name:
-            logger.warning(
-                f"post_process_extract - Skipping non-supported file: {blob.name} - Mimetype: {blob.content_type}"
-            )
-            continue
-          blob_count = blob_count + 1
-          # Download JSON File as bytes object and convert to Document Object
-
-          document = documentai.Document.from_json(
-              blob.download_as_bytes(), ignore_unknown_fields=True
-          )
-          if input_gcs_source not in documents.keys():
-            documents[input_gcs_source] = []
-          documents[input_gcs_source].append(document)
-
-          # TODO add streaming to Vertex
-          # stream_data_to_documentai_warehouse(document, input_gcs_source)
-
-      logger.info(
-          f"post_process_extract - Loaded {sum([len(documents[x]) for x in documents if isinstance(documents[x], list)])} DocAI document objects retrieved from json. ")
 
-      desired_entities_list = []
-      if processor_type == "CUSTOM_EXTRACTION_PROCESSOR":
-        logger.info(
-            f"post_process_extract - Specialized parser results handling"
-            f" for {len(documents)} document(s).")
-
-        specialized_parser_extraction(documents,
-                                      desired_entities_list)
-      elif processor_type == "FORM_PARSER_PROCESSOR":
-        logger.info(f"post_process_extract - Form parser results handling for"
-                    f" {len(documents)} document(s).")
-        form_parser_extraction(documents,
-                               desired_entities_list)
-      else:
-          logger.warning(f"processor_type={processor_type} is not supported yet.")
+      logger.info(f"post_process_extract - processor_type={processor_type}, "
+                  f"route=batch, documents={document_count}, "
+                  f"latency={round((time.time() - start_time) * 1000)} ms")
+      metrics.observe(metrics.STAGE_EXTRACT_LRO_WAIT, time.time() - start_time)
 
-      handle_extraction_results(desired_entities_list)
+      lro_tracker.handle_operation_result(operation.operation.name,
+                                          lro_tracker.STAGE_EXTRACTION,
+                                          metadata, processor_type)
 
     except Exception as ex:
       logger.error(ex)
@@ -380,6 +346,73 @@ def get_callback_fn(operation: Operation, processor_type: str):
   return post_process_extract
 
 
+def handle_extraction_operation(metadata: documentai.BatchProcessMetadata,
+    processor_type: str):
+  # Contains per processed document, keys are path to original document
+  documents = docai_helper.load_batch_process_documents(metadata)
+
+  logger.info(
+      f"handle_extraction_operation - Loaded {sum([len(documents[x]) for x in documents if isinstance(documents[x], list)])} DocAI document objects retrieved from json. ")
+
+  extract_from_documents(documents, processor_type)
+
+
+# Results of operations submitted by any replica are handled the same way
+lro_tracker.register_stage_handler(lro_tracker.STAGE_EXTRACTION,
+                                   handle_extraction_operation)
+
+
+def extract_from_documents(documents: Dict[str, List[documentai.Document]],
+    processor_type: str):
+  """
+  Handles parser output (from either online or batch processing) and
+  updates extraction results for the corresponding documents.
+  """
+  # parsing and storing results of interactive documents go first
+  postprocess_scheduler = priority_scheduler.get_scheduler(
+      priority_scheduler.SCHEDULER_POSTPROCESS)
+  with postprocess_scheduler.slot():
+    desired_entities_list = []
+    if processor_type == "CUSTOM_EXTRACTION_PROCESSOR":
+      logger.info(
+          f"extract_from_documents - Specialized parser results handling"
+          f" for {len(documents)} document(s).")
+
+      specialized_parser_extraction(documents,
+                                    desired_entities_list)
+    elif processor_type == "FORM_PARSER_PROCESSOR":
+      logger.info(f"extract_from_documents - Form parser results handling for"
+                  f" {len(documents)} document(s).")
+      form_parser_extraction(documents,
+                             desired_entities_list)
+    else:
+        logger.warning(f"processor_type={processor_type} is not supported yet.")
+
+    handle_extraction_results(desired_entities_list)
+
+
+def online_extraction(processor: documentai.types.processor.Processor,
+    dai_client, online_docs: Dict[str, bytes]) -> List[str]:
+  """
+  Extracts entities using the synchronous endpoint.
+  Returns uris which failed and need to go through batch processing.
+  """
+  start_time = time.time()
+  documents, failed_uris = docai_helper.process_documents_online(
+      processor, dai_client, online_docs,
+      field_mask=get_field_mask(processor_type=processor.type_))
+  logger.info(
+      f"online_extraction - processor_type={processor.type_}, route=online, "
+      f"documents={len(documents)}, failed={len(failed_uris)}, "
+      f"latency={round((time.time() - start_time) * 1000)} ms")
+  metrics.observe(metrics.STAGE_EXTRACT_ONLINE, time.time() - start_time)
+  if documents:
+    extract_from_documents(documents, processor.type_)
+    docai_cache.store_documents(
+        processor, documents, get_field_mask(processor_type=processor.type_))
+  return failed_uris
+
+
 def stream_data_to_documentai_warehouse(document_ai_output,
                                         uri: str):
   logger.info(f"stream_data_to_documentai_warehouse - {uri}")
@@ -406,9 +439,30 @@ async def batch_extraction(processor: documentai.types.processor.Processor,
   try:
     logger.info(f"batch_extraction - input_uris = {input_uris}, "
                 f"processor={processor.name}, {processor.type_}")
+
+    # Identical files already extracted by this processor version
+    cached_documents, input_uris = await run_in_threadpool(
+        docai_cache.lookup, processor, input_uris,
+        get_field_mask(processor_type=processor.type_))
+    if cached_documents:
+      await run_in_threadpool(extract_from_documents, cached_documents,
+                              processor.type_)
+
+    # Small documents are sent to the synchronous endpoint, skipping
+    # the LRO polling and the GCS output round trip
+    online_docs, batch_uris = await run_in_threadpool(
+        docai_helper.split_online_batch, input_uris)
+    if online_docs:
+      failed_uris = await run_in_threadpool(online_extraction, processor,
+                                            dai_client, online_docs)
+      batch_uris.extend(failed_uris)
+
+    if not batch_uris:
+      return
+
     input_docs = [documentai.GcsDocument(gcs_uri=doc_uri,
                                          mime_type=PDF_MIME_TYPE)
-                  for doc_uri in list(input_uris)]
+                  for doc_uri in list(batch_uris)]
     gcs_documents = documentai.GcsDocuments(documents=input_docs)
     input_config = documentai.BatchDocumentsInputConfig \
       (gcs_documents=gcs_documents)
@@ -433,13 +487,17 @@ async def batch_extraction(processor: documentai.types.processor.Processor,
     # del_gcs_folder(gcs_output_uri.split("//")[1], gcs_output_uri_prefix)
 
     # Temp op folder location
+    # field mask depends on the parser (CDE entities vs form parser fields)
+    gcs_output_config = documentai.DocumentOutputConfig.GcsOutputConfig(
+        gcs_uri=destination_uri,
+        field_mask=get_field_mask(processor_type=processor.type_))
     output_config = documentai.DocumentOutputConfig(
-        gcs_output_config={"gcs_uri": destination_uri})
+        gcs_output_config=gcs_output_config)
 
     logger.info(f"batch_extraction - input_config = {input_config}")
     logger.info(f"batch_extraction - output_config = {output_config}")
     logger.info(
-        f"batch_extraction - Calling DocAI API for {len(input_uris)} document(s) "
+        f"batch_extraction - Calling DocAI API for {len(batch_uris)} document(s) "
         f" using {processor.display_name} processor "
         f"type={processor.type_}, path={processor.name}")
 
@@ -449,12 +507,18 @@ async def batch_extraction(processor: documentai.types.processor.Processor,
         input_documents=input_config,
         document_output_config=output_config,
     )
-    operation = dai_client.batch_process_documents(request)
+    # waits for processor quota and a free LRO slot, retrying quota errors
+    operation = await run_in_threadpool(docai_submitter.submit_batch,
+                                        dai_client, request)
     # Continually polls the operation until it is complete.
     # This could take some time for larger files
     # Format: projects/PROJECT_NUMBER/locations/LOCATION/operations/OPERATION_ID
+    lro_tracker.register_operation(
+        operation.operation.name, lro_tracker.STAGE_EXTRACTION, processor,
+        batch_uris, get_field_mask(processor_type=processor.type_))
     operation.add_done_callback(
-        get_callback_fn(operation=operation, processor_type=processor.type_))
+        get_callback_fn(operation=operation, processor_type=processor.type_,
+                        document_count=len(batch_uris)))
     logger.info(
         f"batch_extraction - DocAI extraction operation started in the background as LRO")
   except Exception as e:
@@ -526,6 +590,7 @@ def form_parser_extraction(
       logger.info(f"form_parser_extraction - Handling results for "
                   f"{input_gcs_source} uid={db_document.uid}")
       for ai_document in processed_documents[input_gcs_source]:
+        metrics.count(metrics.STAGE_EXTRACT, pages=len(ai_document.pages))
         form_parser_text += ai_document.text
         dirs, file_name = split_uri_2_path_filename(input_gcs_source)
         logger.info(
@@ -602,8 +667,10 @@ def form_parser_extraction(
           f"doc_type={db_document.document_class}, "
           f"mapping_dict={mapping_dict}")
       # Extract desired entities from form parser
-      form_parser_entities_list, flag = form_parser_entities_mapping(
-          extracted_entity_list, mapping_dict, form_parser_text)
+      with metrics.timed(metrics.STAGE_MAPPING, db_document.trace_id,
+                         db_document.uid):
+        form_parser_entities_list, flag = form_parser_entities_mapping(
+            extracted_entity_list, mapping_dict, form_parser_text)
       logger.info(f"form_parser_extraction - {input_gcs_source} "
                   f"form_parser_entities_list={form_parser_entities_list}, "
                   f"flag={flag}")
@@ -21,11 +21,15 @@ import uvicorn
 import asyncio
 import time
 import config
+from common.utils import metrics
+from common.utils import priority_scheduler
 from common.utils.logging_handler import Logger
 from concurrent.futures import ThreadPoolExecutor
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import FastAPI, Request
+from google.cloud import firestore
 from routes import hitl ,reassign
+from common.config import SEARCH_INDEX_ENABLED
 
 
 logger = Logger.get_logger(__name__)
@@ -49,13 +53,30 @@ def set_default_executor():
   loop.set_default_executor(ThreadPoolExecutor(max_workers=1000))
 
 
+@app.on_event("startup")
+def start_search_index():
+  if SEARCH_INDEX_ENABLED:
+    try:
+      hitl.search_index.start(firestore.Client())
+    except Exception as e:  # pylint: disable=broad-except
+      logger.error(f"start_search_index - search falls back to scanning: {e}")
+
+
+@app.on_event("shutdown")
+def stop_search_index():
+  hitl.search_index.stop()
+
+
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
   method = request.method
   path = request.scope.get("path")
   start_time = time.time()
+  metrics.set_trace_id(request.headers.get(metrics.TRACE_HEADER))
+  # requests of reviewers are interactive work
+  priority_scheduler.set_priority(priority_scheduler.PRIORITY_INTERACTIVE)
   response = await call_next(request)
-  if path != "/ping":
+  if path not in ["/ping", "/metrics"]:
     process_time = time.time() - start_time
     time_elapsed = round(process_time * 1000)
     logger.info(f"{method} {path} Time elapsed: {str(time_elapsed)} ms")
@@ -67,6 +88,11 @@ def health_check():
   return True
 
 
+@app.get("/metrics")
+def get_metrics():
+  return metrics.metrics_response()
+
+
 api = FastAPI(title="HITL Service API", version="latest")
 
 api.include_router(hitl.router)
@@ -16,6 +16,7 @@ limitations under the License.
 
 """ Arguments Classess """
 # pylint:disable=E0401,R0903,E0611
+from typing import List, Optional
 from pydantic import BaseModel
 
 class Reassign(BaseModel):
@@ -27,3 +28,16 @@ class Reassign(BaseModel):
   new_case_id: str
   user : str
   comment : str
+  # Only update case_id metadata, keep the blob and skip re-processing
+  light: Optional[bool] = False
+
+
+class ReassignBatch(BaseModel):
+
+  """ Argument class for the batch reassign API
+  """
+  uids: List[str]
+  new_case_id: str
+  user : str
+  comment : str
+  light: Optional[bool] = True
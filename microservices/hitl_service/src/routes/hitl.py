@@ -15,10 +15,12 @@ limitations under the License.
 """
 
 """ hitl endpoints """
-from fastapi import APIRouter, HTTPException, Response
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from typing import Optional
 from common.models import Document
 from common.config import CLASSIFICATION_UNDETECTABLE, DOCUMENT_TYPE_UNKNOWN
+from common.utils import metrics
 from common.utils.logging_handler import Logger
 from common.config import BUCKET_NAME, DB_KEYS, ENTITY_KEYS
 from common.config import STATUS_APPROVED, STATUS_REVIEW, STATUS_REJECTED, \
@@ -26,6 +28,8 @@ from common.config import STATUS_APPROVED, STATUS_REVIEW, STATUS_REJECTED, \
 from common.config import STATUS_IN_PROGRESS, STATUS_SUCCESS, \
   STATUS_SPLIT, STATUS_ERROR, STATUS_TIMEOUT, STATUS_PROCESSED
 from common.config import PROCESS_TIMEOUT_SECONDS
+from common.config import FETCH_FILE_CACHE_BYTES, \
+  FETCH_FILE_CACHE_MAX_ITEM_BYTES, FETCH_FILE_CHUNK_SIZE
 from common.config import get_document_types_config, \
   get_display_name_by_doc_class
 from google.cloud import storage
@@ -35,6 +39,8 @@ import fireo
 import traceback
 import time
 from models.search_payload import SearchPayload
+from utils.file_cache import FileCache
+from common.utils.search_index import SearchIndex
 from common.utils.stream_to_bq import stream_document_to_bigquery
 from common.db_client import bq_client
 # disabling for linting to pass
@@ -43,6 +49,11 @@ from common.utils.format_data_for_bq import format_data_for_bq
 
 logger = Logger.get_logger(__name__)
 bq = bq_client()
+storage_client = None
+# Recently viewed documents, keyed by blob name and generation
+file_cache = FileCache(FETCH_FILE_CACHE_BYTES, FETCH_FILE_CACHE_MAX_ITEM_BYTES)
+# Started in main.py, search falls back to scanning until it is ready
+search_index = SearchIndex()
 
 router = APIRouter()
 SUCCESS_RESPONSE = {"status": STATUS_SUCCESS}
@@ -209,6 +220,8 @@ def get_doc_list_data(docs_list: list):
 
   logger.debug(
       f"get_doc_list_data - Total Time elapsed: {str(round((time.time() - start_time) * 1000))} ms")
+  metrics.observe(metrics.STAGE_HITL_DOC_LIST, time.time() - start_time)
+  metrics.count(metrics.STAGE_HITL_DOC_LIST, documents=len(docs_list))
   return docs_list
 
 
@@ -431,26 +444,99 @@ async def update_hitl_status(uid: str,
         status_code=500, detail="STATUS_ERROR to update hitl status") from e
 
 
-def get_file_from_bucket(case_id: str,
-    uid: str,
-    download: Optional[bool] = False):
-  storage_client = storage.Client()
+def get_storage_client():
+  global storage_client
+  if storage_client is None:
+    storage_client = storage.Client()
+  return storage_client
+
+
+def get_document_blob(case_id: str, uid: str):
+  """
+  Returns the blob of the document, looked up directly from Document.url.
+  Documents reassigned in light mode keep their blob under the original
+  case_id. Falls back to listing the blobs under case_id/uid.
+  """
+  client = get_storage_client()
+  document = Document.find_by_uid(uid)
+  prefix_name = f"gs://{BUCKET_NAME}/"
+  if document is not None and document.url and \
+      document.url.startswith(prefix_name) and not document.url.endswith("/"):
+    blob = client.bucket(BUCKET_NAME).get_blob(document.url[len(prefix_name):])
+    if blob is not None:
+      return blob
+
   # listing out all blobs with case_id and uid
-  blobs = storage_client.list_blobs(
+  blobs = client.list_blobs(
       BUCKET_NAME, prefix=case_id + "/" + uid + "/", delimiter="/")
 
   target_blob = None
   # Selecting the last blob which would be the pdf file
   for blob in blobs:
     target_blob = blob
+  return target_blob
+
+
+def parse_range(range_header: Optional[str], size: int):
+  """
+  Returns the inclusive (start, end) of a single "bytes=" Range header,
+  None to serve the whole file. Multiple or malformed ranges are ignored.
+  Raises 416 for ranges outside of the file.
+  """
+  if not range_header:
+    return None
+  unit, _, spec = range_header.partition("=")
+  if unit.strip().lower() != "bytes" or "," in spec:
+    return None
+  start, _, end = spec.strip().partition("-")
+  try:
+    if start == "":
+      length = int(end)
+      start, end = max(size - length, 0), size - 1
+      if length == 0:
+        start = size
+    else:
+      start = int(start)
+      end = min(int(end), size - 1) if end else size - 1
+  except ValueError:
+    return None
+  if start >= size or start > end:
+    raise HTTPException(status_code=416,
+                        detail="Requested range not satisfiable",
+                        headers={"Content-Range": f"bytes */{size}"})
+  return start, end
+
+
+def iter_blob(blob, start: int, end: int):
+  """Reads the inclusive byte range of the blob in FETCH_FILE_CHUNK_SIZE chunks"""
+  position = start
+  while position <= end:
+    chunk_end = min(position + FETCH_FILE_CHUNK_SIZE - 1, end)
+    yield blob.download_as_bytes(start=position, end=chunk_end,
+                                 if_generation_match=blob.generation)
+    position = chunk_end + 1
+
+
+def get_file_from_bucket(case_id: str,
+    uid: str,
+    download: Optional[bool] = False,
+    range_header: Optional[str] = None):
+  """
+  Returns the requested bytes of the document and the response headers.
+  Documents up to FETCH_FILE_CACHE_MAX_ITEM_BYTES are served from the LRU
+  cache, larger ones are streamed from GCS in chunks (returned as iterator).
+  A Content-Range header is set for partial content.
+  """
+  target_blob = get_document_blob(case_id, uid)
 
   # If file is not found raise 404
   if target_blob is None:
     return None, None
 
   filename = target_blob.name.split("/")[-1]
-  # Downloading the pdf file into a byte string
-  return_data = target_blob.download_as_bytes()
+  size = target_blob.size or 0
+  byte_range = parse_range(range_header, size)
+  start, end = byte_range or (0, size - 1)
 
   # Checking for download flag and setting headers
   headers = None
@@ -458,24 +544,50 @@ def get_file_from_bucket(case_id: str,
     headers = {"Content-Disposition": "attachment;filename=" + filename}
   else:
     headers = {"Content-Disposition": "inline;filename=" + filename}
-  return (return_data, headers)
+  headers["Accept-Ranges"] = "bytes"
+  headers["ETag"] = f"\"{target_blob.generation}\""
+  headers["Content-Length"] = str(end - start + 1)
+  if byte_range:
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+  cache_key = (target_blob.name, target_blob.generation)
+  return_data = file_cache.get(cache_key)
+  if return_data is None and size <= file_cache.max_item_bytes:
+    return_data = target_blob.download_as_bytes(
+        if_generation_match=target_blob.generation)
+    file_cache.put(cache_key, return_data)
+  if return_data is not None:
+    return return_data[start:end + 1], headers
+  return iter_blob(target_blob, start, end), headers
 
 
 @router.get("/fetch_file")
-async def fetch_file(case_id: str, uid: str, download: Optional[bool] = False):
+async def fetch_file(request: Request, case_id: str, uid: str,
+                     download: Optional[bool] = False):
   """
-  Fetches and returns the file from GCS bucket
+  Fetches and returns the file from GCS bucket, supports single byte
+  Range requests
   Args : case_id : str, uid : str
   Returns 200: returns the file and displays it
+  Returns 206: returns the requested range of the file
   Returns 404: Document not found
+  Returns 416: Requested range not satisfiable
   Returns 500: If something fails
   """
   try:
-    return_data, headers = get_file_from_bucket(case_id, uid, download)
+    return_data, headers = get_file_from_bucket(case_id, uid, download,
+                                                request.headers.get("range"))
     if return_data is None and headers is None:
       raise FileNotFoundError
-    return Response(
-        content=return_data, headers=headers, media_type="application/pdf")
+    status_code = 206 if "Content-Range" in headers else 200
+    if isinstance(return_data, (bytes, str)):
+      return Response(content=return_data, status_code=status_code,
+                      headers=headers, media_type="application/pdf")
+    return StreamingResponse(return_data, status_code=status_code,
+                             headers=headers, media_type="application/pdf")
+
+  except HTTPException:
+    raise
 
   except FileNotFoundError as e:
     print(e)
@@ -706,6 +818,23 @@ def compare_value(entity, term, entity_key):
     return False
 
 
+def matches_term(doc, term):
+  """Scan fallback of the search, checks DB_KEYS and ENTITY_KEYS of doc"""
+  for db_key in DB_KEYS:
+    if doc.get(db_key) is not None:
+      if isinstance(term, str) and isinstance(doc[db_key], str):
+        if term.lower() in doc[db_key].lower():
+          return True
+      elif term == doc[db_key]:
+        return True
+
+  entities = doc.get("entities", None)
+  if entities is None:
+    return False
+  return any(compare_value(entity, term, entity_key)
+             for entity_key in ENTITY_KEYS for entity in entities)
+
+
 @router.post("/search")
 async def search(search_term: SearchPayload):
   """
@@ -734,13 +863,14 @@ async def search(search_term: SearchPayload):
             detail="Invalid Parameter type.\
               Filter key should be of type string")
       if filter_key in DB_KEYS:
-        docs_list = list(
-            map(
-                lambda x: x.to_dict(),
-                Document.collection.filter(active="active").filter(
-                    filter_key, "==", filter_value).fetch()))
-        docs_list = sorted(
-            docs_list, key=lambda i: i["upload_timestamp"], reverse=True)
+        if term is None or not search_index.ready:
+          docs_list = list(
+              map(
+                  lambda x: x.to_dict(),
+                  Document.collection.filter(active="active").filter(
+                      filter_key, "==", filter_value).fetch()))
+          docs_list = sorted(
+              docs_list, key=lambda i: i["upload_timestamp"], reverse=True)
         if term is None:
           if limit_start is not None and limit_end is not None:
             if not isinstance(limit_start, int) or not isinstance(
@@ -763,40 +893,26 @@ async def search(search_term: SearchPayload):
     elif term is None:
       raise HTTPException(status_code=400, detail="Search term not found")
 
-    else:
+    if search_index.ready:
+      uids = search_index.search(term, filter_key, filter_value)
+      if limit_start is not None and limit_end is not None:
+        uids = uids[limit_start:limit_end]
+      # Only the requested page is read from Firestore
+      documents = [Document.find_by_uid(uid) for uid in uids]
+      resultset = [document.to_dict() for document in documents
+                   if document is not None]
+      resultset = get_doc_list_data(resultset)
+      return {"status": STATUS_SUCCESS, "len": len(resultset),
+              "data": resultset}
+
+    if filter_key is None or filter_value is None:
       docs_list = list(
           map(lambda x: x.to_dict(),
               Document.collection.filter(active="active").fetch()))
       docs_list = sorted(
           docs_list, key=lambda i: i["upload_timestamp"], reverse=True)
-    resultset = []
-
-    for doc in docs_list:
-      for db_key in DB_KEYS:
-        if doc in resultset:
-          break
-        if doc[db_key] is not None:
-          if isinstance(term, str) and isinstance(doc[db_key], str):
-            if term.lower() in doc[db_key].lower():
-              resultset.append(doc)
-              break
-          else:
-            if term == doc[db_key]:
-              resultset.append(doc)
-              break
-
-      entities = doc.get("entities", None)
-      if doc in resultset or entities is None:
-        continue
-      for entity_key in ENTITY_KEYS:
-        temp = [
-            doc for entity in entities
-            if compare_value(entity, term, entity_key)
-        ]
-        if len(temp) > 0:
-          resultset.extend(temp)
-          temp.clear()
-          break
+
+    resultset = [doc for doc in docs_list if matches_term(doc, term)]
 
     if limit_start is not None and limit_end is not None:
       resultset = resultset[limit_start:limit_end]
@@ -245,6 +245,35 @@ def test_fetch_api_invalid_uid(client_with_emulator):
       assert response.status_code == 404
 
 
+def test_fetch_api_range(client_with_emulator):
+  """Test case to check Range requests of the fetch_file hitl endpoint"""
+  data = b"0123456789"
+  blob = Mock()
+  blob.name = "case/uid/test.pdf"
+  blob.size = len(data)
+  blob.generation = 1
+  blob.download_as_bytes.return_value = data
+  with patch("routes.hitl.get_document_blob", return_value=blob):
+    with patch("routes.hitl.Logger"):
+      response = client_with_emulator.get(
+          f"{api_url}fetch_file?case_id=case&uid=uid",
+          headers={"Range": "bytes=2-5"})
+      assert response.status_code == 206
+      assert response.content == b"2345"
+      assert response.headers["Content-Range"] == "bytes 2-5/10"
+      response = client_with_emulator.get(
+          f"{api_url}fetch_file?case_id=case&uid=uid",
+          headers={"Range": "bytes=-3"})
+      assert response.status_code == 206
+      assert response.content == b"789"
+      response = client_with_emulator.get(
+          f"{api_url}fetch_file?case_id=case&uid=uid",
+          headers={"Range": "bytes=20-"})
+      assert response.status_code == 416
+  # The document is downloaded once and then served from the cache
+  assert blob.download_as_bytes.call_count == 1
+
+
 def test_get_unclassified_api(client_with_emulator):
   """Test case to check the get_unclassified hitl endpoint"""
   d = Document()
@@ -21,6 +21,7 @@ from common.models import Document
 from common.db_client import bq_client
 from common.utils.format_data_for_bq import format_data_for_bq
 from common.utils.stream_to_bq import stream_document_to_bigquery
+from common.utils.process_extraction_result_helper import get_matching_score
 # from common.utils.copy_gcs_documents import copy_blob
 from common.utils.logging_handler import Logger
 from common.config import BUCKET_NAME
@@ -32,7 +33,7 @@ from google.cloud import storage
 import re
 import datetime
 import requests
-from models.reassign import Reassign
+from models.reassign import Reassign, ReassignBatch
 import fireo
 import traceback
 
@@ -50,6 +51,7 @@ async def reassign_case_id(reassign: Reassign, response: Response):
     new_case_id :existing application form case_id
     user : username of person who is reassigning the document
     comment : comment put by user
+    light : only update the case_id metadata, see reassign_document
     Returns:
       200 : Successfully reassigned the document
       404 :document to be reassign is not found
@@ -105,83 +107,171 @@ async def reassign_case_id(reassign: Reassign, response: Response):
       return {"message": response.body}
 
     client = bq_client()
-    gcs_source_url = document.url
-    document_class = document.document_class
-    document_type = document.document_type
-    entities = document.entities
-    context = document.context
-    extraction_score = document.extraction_score
-
-    #remove the prefix of bucket name from gcs_url to get blob name
-    prefix_name = f"gs://{BUCKET_NAME}/"
+    reassign_status, message = reassign_document(client, document,
+                                                 old_case_id, new_case_id,
+                                                 user, comment,
+                                                 reassign_dict.get("light"))
+    if reassign_status == STATUS_SUCCESS:
+      logger.info(
+          f"ressign case_id from {old_case_id} to {new_case_id} is successfull")
+      return {"status": STATUS_SUCCESS, "url": message}
+    response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+    response.body = message
+    return {"message": response.body}
+
+  except Exception as e:
+    err = traceback.format_exc().replace("\n", " ")
+    logger.error(err)
+    raise HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)) from e
+
+
+@router.post("/reassign_case_id_batch")
+async def reassign_case_id_batch(reassign: ReassignBatch, response: Response):
+  """
+  Reassigns many documents to an existing case_id in one call
+    Args:
+    uids (list) : unique Ids of the documents to reassign
+    new_case_id : existing application form case_id
+    user : username of person who is reassigning the documents
+    comment : comment put by user
+    light : only update the case_id metadata (default), see reassign_document
+    Returns:
+      200 : status and url or error per uid
+      404 : new_case_id application not found
+      500 :  Some unexpected error occurred
+    """
+  try:
+    new_case_id = reassign.new_case_id
+    new_case_id_document = Document.collection.filter(
+        case_id=new_case_id).get()
+    if not new_case_id_document:
+      logger.error(
+          f"Document with case_id {new_case_id} not found for reassign")
+      response.status_code = status.HTTP_404_NOT_FOUND
+      response.body = f"Application with case_id {new_case_id}" \
+                      f" does not exist in database"
+      return {"message": response.body}
+
+    client = bq_client()
+    results = {}
+    for uid in reassign.uids:
+      document = Document.find_by_uid(uid)
+      if document is None:
+        results[uid] = {"status": STATUS_ERROR,
+                        "message": "document does not exist in database"}
+        continue
+      reassign_status, message = reassign_document(client, document,
+                                                   document.case_id,
+                                                   new_case_id, reassign.user,
+                                                   reassign.comment,
+                                                   reassign.light)
+      key = "url" if reassign_status == STATUS_SUCCESS else "message"
+      results[uid] = {"status": reassign_status, key: message}
+
+    failed = [uid for uid, result in results.items()
+              if result["status"] != STATUS_SUCCESS]
+    logger.info(f"reassign_case_id_batch to {new_case_id}: "
+                f"{len(results) - len(failed)} reassigned, failed={failed}")
+    return {"status": STATUS_ERROR if failed else STATUS_SUCCESS,
+            "results": results}
+
+  except Exception as e:
+    err = traceback.format_exc().replace("\n", " ")
+    logger.error(err)
+    raise HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)) from e
+
+
+def reassign_document(client, document: Document, old_case_id: str,
+                      new_case_id: str, user: str, comment: str,
+                      light: bool = False):
+  """
+  Moves the document to new_case_id in Firestore and BigQuery.
+  The full mode moves the blob under the new case_id folder and triggers
+  process task again. The light mode keeps the blob where it is
+  (Document.url keeps pointing to it), streams the BigQuery row without
+  ocr_text and only re-runs the case dependent matching step.
+  Returns (status, url of the document or error message)
+  """
+  uid = document.uid
+  gcs_source_url = document.url
+  document_class = document.document_class
+  document_type = document.document_type
+  entities = document.entities
+  context = document.context
+  extraction_score = document.extraction_score
+
+  #remove the prefix of bucket name from gcs_url to get blob name
+  prefix_name = f"gs://{BUCKET_NAME}/"
+  updated_url = gcs_source_url
+  if not light:
     source_blob_name = re.sub(prefix_name, "", gcs_source_url, 1)
     print(f"source_blob_name: {source_blob_name}")
 
     #remove the prefix of old_case_id and give new case_id for
     # destination folder in gcs
-    destination_blob_name = re.sub(old_case_id, new_case_id, source_blob_name,
-                                   1)
+    destination_blob_name = re.sub(old_case_id, new_case_id,
+                                   source_blob_name, 1)
     print(f"destination_blob_name: {destination_blob_name}")
 
     if source_blob_name == destination_blob_name:
-      return {"status": STATUS_SUCCESS, "url": document.url}
+      return STATUS_SUCCESS, document.url
 
     status_copy_blob = copy_blob(BUCKET_NAME, source_blob_name,
                                  destination_blob_name)
 
     # check if moving file in gcs is sucess
     if status_copy_blob != STATUS_SUCCESS:
-      response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-      response.body = f"Error in copying files in " \
-     f"gcs bucket from source folder {old_case_id},destination" \
-          f" {new_case_id} "
-      return {"message": response.body}
-
-    print("----------Updating firestore-----------")
-    #Update Firestore databse
-    document.case_id = new_case_id
+      return STATUS_ERROR, f"Error in copying files in " \
+                           f"gcs bucket from source folder {old_case_id}," \
+                           f"destination {new_case_id} "
     updated_url = prefix_name + destination_blob_name
-    document.url = updated_url
-    # Update HITL audit trail for reassigned action
-    hitl_audit_trail = {
-        "status": "reassigned",
-        "timestamp": datetime.datetime.utcnow(),
-        "user": user,
-        "comment": comment,
-        "old_case_id": old_case_id,
-        "new_case_id": new_case_id,
-        "action": f"reassigned from {old_case_id} to {new_case_id}"
-    }
-    document.hitl_status = fireo.ListUnion([hitl_audit_trail])
-    document.update()
-    #Update Bigquery database
-    entities_for_bq = format_data_for_bq(entities)
-    update_bq = stream_document_to_bigquery(client, new_case_id, uid,
-                                            document_class, document_type,
-                                            entities_for_bq, updated_url,
-                                            document.ocr_text,
-                                            document.classification_score)
-    print("--------firestore db ----------------")
-    # status_process_task =
-    response_process_task = call_process_task(new_case_id, uid, document_class,
-                                              updated_url,
-                                              context, extraction_score,
-                                              entities)
-    if update_bq == [] and response_process_task.status_code == 202:
+  elif document.case_id == new_case_id:
+    return STATUS_SUCCESS, document.url
 
-      logger.info(
-          f"ressign case_id from {old_case_id} to {new_case_id} is successfull")
-      return {"status": STATUS_SUCCESS, "url": document.url}
-    else:
-      print("inside else")
-      response.status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
-      response.body = "Error in updating bigquery database"
+  print("----------Updating firestore-----------")
+  #Update Firestore databse
+  document.case_id = new_case_id
+  document.url = updated_url
+  # Update HITL audit trail for reassigned action
+  hitl_audit_trail = {
+      "status": "reassigned",
+      "timestamp": datetime.datetime.utcnow(),
+      "user": user,
+      "comment": comment,
+      "old_case_id": old_case_id,
+      "new_case_id": new_case_id,
+      "action": f"reassigned from {old_case_id} to {new_case_id}"
+  }
+  document.hitl_status = fireo.ListUnion([hitl_audit_trail])
+  document.update()
+  #Update Bigquery database, the light mode does not send ocr_text again,
+  # latest_documents keeps the previously streamed text
+  entities_for_bq = format_data_for_bq(entities)
+  update_bq = stream_document_to_bigquery(client, new_case_id, uid,
+                                          document_class, document_type,
+                                          entities_for_bq, updated_url,
+                                          None if light else document.ocr_text,
+                                          document.classification_score)
+  if update_bq != []:
+    return STATUS_ERROR, "Error in updating bigquery database"
 
-  except Exception as e:
-    err = traceback.format_exc().replace("\n", " ")
-    logger.error(err)
-    raise HTTPException(
-        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e)) from e
+  if light:
+    # Class and entities are unchanged, only matching depends on the case
+    matching_response = get_matching_score(new_case_id, uid)
+    if matching_response.status_code != 200:
+      return STATUS_ERROR, f"Error in matching document {uid} " \
+                           f"with case_id {new_case_id}"
+    return STATUS_SUCCESS, updated_url
+
+  response_process_task = call_process_task(new_case_id, uid, document_class,
+                                            updated_url,
+                                            context, extraction_score,
+                                            entities)
+  if response_process_task.status_code != 202:
+    return STATUS_ERROR, "Error in triggering process task"
+  return STATUS_SUCCESS, updated_url
 
 
 # disabling for linting to pass for blob_copy variable
@@ -151,3 +151,37 @@ def test_same_old_and_new_case_id(client_with_emulator):
               f"{api_url}reassign_case_id", json=data)
     print(response)
   assert response.status_code == 400
+
+
+def test_document_reassign_batch_light(client_with_emulator):
+  create_document(supporting_document_data)
+  create_document(application_document_data)
+  data = {
+      "uids": ["7CBdJrVpbKolmbm2MYLxx", "not_existing_uid"],
+      "new_case_id": "123A",
+      "user": "Max",
+      "comment": "reassign during cleanup"
+  }
+  mockresponse = Mock()
+  mockresponse.status_code = 200
+  with mock.patch("routes.reassign.Logger"):
+    with mock.patch("routes.reassign.copy_blob") as copy_blob:
+      with mock.patch("routes.reassign.format_data_for_bq"):
+        with mock.patch(
+            "routes.reassign.stream_document_to_bigquery", return_value=[]):
+          with mock.patch("routes.reassign.call_process_task") as process_task:
+            with mock.patch("routes.reassign.get_matching_score",
+                            return_value=mockresponse):
+              response = client_with_emulator.post(
+                  f"{api_url}reassign_case_id_batch", json=data)
+  assert response.status_code == 200
+  results = response.json()["results"]
+  assert results["7CBdJrVpbKolmbm2MYLxx"]["status"] == STATUS_SUCCESS
+  # The blob is not moved and the pipeline is not triggered again
+  assert results["7CBdJrVpbKolmbm2MYLxx"]["url"] == \
+         supporting_document_data["url"]
+  assert results["not_existing_uid"]["status"] == STATUS_ERROR
+  copy_blob.assert_not_called()
+  process_task.assert_not_called()
+  document = Document.find_by_uid("7CBdJrVpbKolmbm2MYLxx")
+  assert document.case_id == "123A"
@@ -0,0 +1,55 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+""" Bytes bounded LRU cache of documents served by fetch_file """
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+
+class FileCache:
+  """
+  LRU cache of file contents bounded by their total size in bytes.
+  Items larger than max_item_bytes are never cached.
+  """
+
+  def __init__(self, max_bytes: int, max_item_bytes: int):
+    self.max_bytes = max_bytes
+    self.max_item_bytes = min(max_item_bytes, max_bytes)
+    self.size = 0
+    self.items = OrderedDict()
+    self.lock = threading.Lock()
+
+  def get(self, key: Hashable) -> Optional[bytes]:
+    with self.lock:
+      data = self.items.get(key)
+      if data is not None:
+        self.items.move_to_end(key)
+      return data
+
+  def put(self, key: Hashable, data: bytes) -> bool:
+    """Caches data, returns False when it is too large to be cached"""
+    if len(data) > self.max_item_bytes:
+      return False
+    with self.lock:
+      if key in self.items:
+        self.size -= len(self.items.pop(key))
+      self.items[key] = data
+      self.size += len(data)
+      while self.size > self.max_bytes:
+        _, evicted = self.items.popitem(last=False)
+        self.size -= len(evicted)
+    return True
@@ -21,6 +21,8 @@ import uvicorn
 import asyncio
 import time
 import config
+from common.utils import metrics
+from common.utils import priority_scheduler
 from common.utils.logging_handler import Logger
 from concurrent.futures import ThreadPoolExecutor
 from fastapi import FastAPI, Request
@@ -41,8 +43,11 @@ async def add_process_time_header(request: Request, call_next):
   method = request.method
   path = request.scope.get("path")
   start_time = time.time()
+  metrics.set_trace_id(request.headers.get(metrics.TRACE_HEADER))
+  priority_scheduler.set_priority(
+      request.headers.get(priority_scheduler.PRIORITY_HEADER))
   response = await call_next(request)
-  if path != "/ping":
+  if path not in ["/ping", "/metrics"]:
     process_time = time.time() - start_time
     time_elapsed = round(process_time * 1000)
     logger.info(f"{method} {path} Time elapsed: {str(time_elapsed)} ms")
@@ -54,6 +59,11 @@ def health_check():
   return True
 
 
+@app.get("/metrics")
+def get_metrics():
+  return metrics.metrics_response()
+
+
 api = FastAPI(title="Matching Service API", version="latest")
 
 api.include_router(matching.router)
@@ -25,6 +25,7 @@ from utils.process_task_helpers import run_pipeline
 from common.config import STATUS_ERROR
 from common.config import STATUS_SUCCESS
 # pylint: disable = ungrouped-imports
+from common.utils import priority_scheduler
 from common.utils.logging_handler import Logger
 
 router = APIRouter()
@@ -53,6 +54,13 @@ async def process_task(payload: ProcessTask,
   payload = payload.dict()
   logger.info(f"Processing the documents: {payload}")
 
+  # HITL and reassign flows are interactive, others keep the lane they
+  # were published with
+  if is_hitl or is_reassign:
+    priority_scheduler.set_priority(priority_scheduler.PRIORITY_INTERACTIVE)
+  elif payload.get("configs"):
+    priority_scheduler.set_priority(payload["configs"][0].get("priority"))
+
   # Run the pipeline in the background
   background_task.add_task(run_pipeline, payload, is_hitl, is_reassign)
   return {"message": "Processing your document"}
@@ -16,25 +16,33 @@ limitations under the License.
 
 """ Upload and process task api endpoints """
 
+import asyncio
 import uuid
+import fireo
 import requests
 import traceback
 import datetime
+import time
 from fastapi import APIRouter, UploadFile, File, HTTPException
 from fastapi.concurrency import run_in_threadpool
 from typing import Optional, List
 from schemas.input_data import InputData
 import utils.upload_file_gcs_bucket as ug
+from common.utils import metrics
 from common.utils.logging_handler import Logger
 from common.models import Document
 from common.utils.publisher import publish_document
-from common.config import BUCKET_NAME
+from common.config import BUCKET_NAME, UPLOAD_CONCURRENCY
 from common.config import STATUS_IN_PROGRESS, STATUS_SUCCESS, STATUS_ERROR
 
 # pylint: disable = broad-except ,literal-comparison
 router = APIRouter()
 logger = Logger.get_logger(__name__)
 
+# Firestore limits: values of an "in" filter and writes of a batch
+IN_QUERY_SIZE = 10
+WRITE_BATCH_SIZE = 500
+
 @router.post("/upload_files")
 async def upload_file(
     context: str,
@@ -67,56 +75,36 @@ async def upload_file(
   uid_list = []
   message_list = []
   try:
-    for file in files:
-      #create a record in database for uploaded document
-      output = create_document(case_id, file.filename, context, user=user)
-      uid = output
-      uid_list.append(uid)
-      #Upload document in GCS bucket
-      status = await run_in_threadpool(ug.upload_file, case_id, uid, file)
-      #check the uploaded document status
-      if status != STATUS_SUCCESS:
-
-        #Update the document upload in GCS as failed
-        document = Document.find_by_uid(uid)
-        system_status = {
-            "stage": "upload",
-            "status": STATUS_ERROR,
-            "timestamp": datetime.datetime.utcnow(),
-            "comment": comment
-        }
-        document.system_status = [system_status]
-        document.update()
-
-        raise HTTPException(
-            status_code=500,
-            detail="Error "
-            "in uploading document in gcs bucket")
-      logger.info(f"File with case_id {case_id} and uid {uid}"
-                  f" uploaded successfully in GCS bucket")
-      #Update the document upload as success in DB
-      document = Document.find_by_uid(uid)
-
-      gcs_base_url = f"gs://{BUCKET_NAME}"
-      document.url = f"{gcs_base_url}/{case_id}/{uid}/{file.filename}"
-      system_status = {
-          "stage": "uploaded",
-          "status": STATUS_SUCCESS,
-          "timestamp": datetime.datetime.utcnow(),
-          "comment": comment
-      }
-      document.system_status = [system_status]
-      document.update()
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+    results = await asyncio.gather(*[
+        upload_one_file(semaphore, case_id, file, context, user)
+        for file in files
+    ])
+    uid_list = [result["uid"] for result in results]
+    update_upload_status(results, comment)
+    #check the uploaded document status
+    if any(result["status"] != STATUS_SUCCESS for result in results):
+      raise HTTPException(
+          status_code=500,
+          detail="Error "
+          "in uploading document in gcs bucket")
+    logger.info(f"Files with case_id {case_id} and uids {uid_list}"
+                f" uploaded successfully in GCS bucket")
+    for result in results:
       message_list.append({
           "case_id": case_id,
-          "uid": uid,
-          "gcs_url": document.url,
-          "context": context
+          "uid": result["uid"],
+          "gcs_url": result["url"],
+          "context": context,
+          "trace_id": result["trace_id"]
       })
     # Pushing Message To Pubsub
     pubsub_msg = f"batch for {case_id} moved to bucket"
     message_dict = {"message": pubsub_msg, "message_list": message_list}
-    publish_document(message_dict)
+    with metrics.timed(metrics.STAGE_PUBLISH):
+      # chunks are published concurrently, wait before responding
+      for future in publish_document(message_dict):
+        future.result()
     logger.info(f"Files with case id {case_id} uploaded"
                 f" successfully")
     return {
@@ -175,6 +163,87 @@ async def upload_data_json(input_data: InputData):
         "in uploading document") from e
 
 
+async def upload_one_file(semaphore, case_id, file, context, user):
+  """Creates the document record and uploads one file to GCS
+
+  Args:
+    semaphore: bounds the number of files created and uploaded at the
+      same time
+  Returns:
+    dict with uid, trace_id, url and upload status of the file
+  """
+  trace_id = metrics.new_trace_id()
+  async with semaphore:
+    #create a record in database for uploaded document
+    uid = await run_in_threadpool(create_document, case_id, file.filename,
+                                  context, user=user, trace_id=trace_id)
+    #Upload document in GCS bucket
+    upload_start_time = time.time()
+    try:
+      status = await run_in_threadpool(ug.upload_file, case_id, uid, file)
+    except Exception:
+      err = traceback.format_exc().replace("\n", " ")
+      logger.error(f"upload_one_file: upload of {file.filename} for uid {uid}"
+                   f" failed: {err}")
+      status = STATUS_ERROR
+    metrics.observe(metrics.STAGE_UPLOAD, time.time() - upload_start_time,
+                    trace_id, uid)
+    metrics.count(metrics.STAGE_UPLOAD)
+  return {
+      "uid": uid,
+      "trace_id": trace_id,
+      "status": status,
+      "url": f"gs://{BUCKET_NAME}/{case_id}/{uid}/{file.filename}"
+  }
+
+
+def get_documents_by_uid(uids):
+  """Reads the documents with "in" queries, returns a dict uid -> Document"""
+  uids = list(dict.fromkeys(uids))
+  documents = {}
+  for i in range(0, len(uids), IN_QUERY_SIZE):
+    for document in Document.collection.filter(
+        "uid", "in", uids[i:i + IN_QUERY_SIZE]).fetch():
+      documents[document.uid] = document
+  return documents
+
+
+def update_upload_status(results, comment):
+  """
+  Writes the upload status of all documents of a request in batches of
+  up to WRITE_BATCH_SIZE writes
+  """
+  documents = get_documents_by_uid([result["uid"] for result in results])
+  timestamp = datetime.datetime.utcnow()
+  for i in range(0, len(results), WRITE_BATCH_SIZE):
+    batch = fireo.batch()
+    for result in results[i:i + WRITE_BATCH_SIZE]:
+      update_document_status(documents[result["uid"]], result, comment,
+                             timestamp, batch)
+    batch.commit()
+
+
+def update_document_status(document, result, comment, timestamp, batch):
+  """Adds the upload status update of one document to the batch"""
+  if result["status"] == STATUS_SUCCESS:
+    document.url = result["url"]
+    system_status = {
+        "stage": "uploaded",
+        "status": STATUS_SUCCESS,
+        "timestamp": timestamp,
+        "comment": comment
+    }
+  else:
+    system_status = {
+        "stage": "upload",
+        "status": STATUS_ERROR,
+        "timestamp": timestamp,
+        "comment": comment
+    }
+  document.system_status = [system_status]
+  document.update(batch=batch)
+
+
 def create_document_from_data(case_id, document_class, context,
                               entity):
   base_url = "http://document-status-service/document_status_service/v1/"
@@ -188,11 +257,12 @@ def create_document_from_data(case_id, document_class, context,
   return uid
 
 
-def create_document(case_id, filename, context, user=None):
+def create_document(case_id, filename, context, user=None, trace_id=None):
   base_url = "http://document-status-service/document_status_service/v1/"
   req_url = f"{base_url}create_document"
   response = requests.post(
-      f"{req_url}?case_id={case_id}&filename={filename}&context={context}&user={user}"
+      f"{req_url}?case_id={case_id}&filename={filename}&context={context}&user={user}",
+      headers=metrics.trace_headers(trace_id)
   )
   response = response.json()
   uid = response["uid"]
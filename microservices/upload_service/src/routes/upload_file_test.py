@@ -236,3 +236,47 @@ def test_upload_multiple_pdf_negative(client_with_emulator):
               data=payload)
           print(response.text)
   assert response.status_code == 500
+
+
+def test_upload_multiple_pdf_upload_exception(client_with_emulator):
+  payload = {}
+  mock_uid = creat_mock_data()
+  files = [("files", ("Arkansa-claim-2.pdf", open(TESTDATA_FILENAME2,
+                                                  "rb"), "application/pdf")),
+           ("files", ("Arkansas-form-1.pdf", open(TESTDATA_FILENAME3,
+                                                  "rb"), "application/pdf"))]
+
+  with mock.patch("routes.upload_file.Logger"):
+    with mock.patch(
+        "routes.upload_file.create_document", return_value=mock_uid):
+      with mock.patch(
+          "routes.upload_file.publish_document") as mock_publish:
+        with mock.patch(
+            "routes.upload_file.ug.upload_file",
+            side_effect=[STATUS_SUCCESS, Exception("checksum mismatch")]):
+          response = client_with_emulator.post(
+              f"{api_url}upload_files"
+              f"?context=arkansas&case_id=test123",
+              files=files,
+              data=payload)
+  assert response.status_code == 500
+  mock_publish.assert_not_called()
+
+
+def test_update_upload_status_in_batches(client_with_emulator):
+  from routes.upload_file import update_upload_status
+  results = [{"uid": f"uid-{i}", "status": STATUS_SUCCESS,
+              "url": f"gs://bucket/case/uid-{i}/file.pdf"}
+             for i in range(1001)]
+  documents = {result["uid"]: mock.Mock() for result in results}
+  with mock.patch("routes.upload_file.get_documents_by_uid",
+                  return_value=documents) as get_documents:
+    with mock.patch("routes.upload_file.fireo.batch") as batch:
+      update_upload_status(results, "comment")
+  # one read of all uids, writes committed in batches of up to 500
+  get_documents.assert_called_once()
+  assert batch.call_count == 3
+  assert batch.return_value.commit.call_count == 3
+  assert documents["uid-1000"].url == "gs://bucket/case/uid-1000/file.pdf"
+  documents["uid-0"].update.assert_called_once_with(
+      batch=batch.return_value)
@@ -21,6 +21,9 @@ from typing import List
 import requests
 
 from common.config import get_parser_name_by_doc_class
+from common.config import PIPELINE_ORCHESTRATOR_ENABLED
+from common.utils import metrics
+from common.utils import pipeline_orchestrator
 from common.utils.api_calls import extract_documents
 from common.utils.logging_handler import Logger
 
@@ -87,7 +90,8 @@ def send_classification_request(configs: List[Dict]):
     payload = {"configs": configs}
     logger.info(
       f"get_classification sending to {base_url} with payload={payload}")
-    response = requests.post(base_url, json=payload)
+    response = requests.post(base_url, json=payload,
+                             headers=metrics.trace_headers())
     logger.info(f"get_classification response {response}")
     return response
   except requests.exceptions.RequestException as err:
@@ -97,6 +101,11 @@ def send_classification_request(configs: List[Dict]):
 def classify_documents(configs: List[Dict]):
   logger.info(f"classify_documents with configs = {configs}")
 
+  if PIPELINE_ORCHESTRATOR_ENABLED:
+    pipeline_orchestrator.enqueue(pipeline_orchestrator.STAGE_CLASSIFICATION,
+                                  {"configs": configs})
+    return
+
   cl_result = send_classification_request(configs)
 
   if cl_result and cl_result.status_code == 200:
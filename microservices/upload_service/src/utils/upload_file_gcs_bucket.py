@@ -16,25 +16,58 @@ limitations under the License.
 
 """ Upload file to gcs bucket function """
 
-from common.config import BUCKET_NAME
-from google.cloud.storage import Blob
+import os
+import threading
+from common.config import BUCKET_NAME, UPLOAD_CHUNK_SIZE
 from google.cloud import storage
 from common.config import STATUS_IN_PROGRESS, STATUS_SUCCESS, STATUS_ERROR
 
+_storage_client = None
+_storage_client_lock = threading.Lock()
+
+
+def get_storage_client():
+  """Returns a storage client shared by all uploads of this process"""
+  global _storage_client
+  if _storage_client is None:
+    with _storage_client_lock:
+      if _storage_client is None:
+        _storage_client = storage.Client()
+  return _storage_client
+
+
+def get_file_size(file_obj):
+  """Returns the size of a seekable file object without reading it"""
+  position = file_obj.tell()
+  file_obj.seek(0, os.SEEK_END)
+  size = file_obj.tell()
+  file_obj.seek(position)
+  return size
+
 
 def upload_file(case_id, uid, file):
-  client = storage.Client()
-  bucket = client.get_bucket(BUCKET_NAME)
+  """Streams an UploadFile to GCS verifying the CRC32C checksum.
+
+  The spooled file is handed to the client as is, files larger than
+  UPLOAD_CHUNK_SIZE are sent with a chunked resumable upload.
+  """
+  bucket = get_storage_client().bucket(BUCKET_NAME)
   blob_name = f"{case_id}/{uid}/{file.filename}"
-  blob = Blob(blob_name, bucket)
-  blob.upload_from_file(file.file)
+  size = get_file_size(file.file)
+  chunk_size = UPLOAD_CHUNK_SIZE if size > UPLOAD_CHUNK_SIZE else None
+  blob = bucket.blob(blob_name, chunk_size=chunk_size)
+  blob.upload_from_file(
+      file.file,
+      rewind=True,
+      size=size,
+      content_type="application/pdf",
+      checksum="crc32c")
   return STATUS_SUCCESS
 
 
 def upload_json_file(case_id, uid, input_data, content_type='application/pdf'):
   destination_blob_name = f"{case_id}/{uid}/input_data_{case_id}_{uid}.json"
-  storage_client = storage.Client()
-  bucket = storage_client.bucket(BUCKET_NAME)
+  bucket = get_storage_client().bucket(BUCKET_NAME)
   blob = bucket.blob(destination_blob_name)
   blob.upload_from_string(input_data, content_type)
   print(case_id + uid + input_data)
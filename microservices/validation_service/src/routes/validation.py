@@ -19,7 +19,7 @@ import traceback
 import requests
 from fastapi import APIRouter, HTTPException, status, Response
 from typing import List, Dict
-from utils.validation import get_values
+from utils.validation import get_values, get_batch_scores
 from common.utils.logging_handler import Logger
 from common.config import STATUS_IN_PROGRESS, STATUS_SUCCESS, STATUS_ERROR
 
@@ -82,6 +82,30 @@ async def validation(case_id: str, uid: str, doc_class: str,
         status_code=500, detail="Failed to update validation score") from error
 
 
+@router.post("/validation_batch_api")
+async def validation_batch(doc_class: str, uids: List[str]):
+  """ Computes validation scores of documents already stored in BigQuery,
+    running each compiled rule once for all uids
+    Args:
+     doc_class (str): class of the documents
+     uids (list): unique ids of the documents
+    Returns:
+    200 : validation score per uid
+    500  : HTTPException: 500 Internal Server Error if something fails
+    """
+  try:
+    logger.info(f"Batch validation called for doc_class={doc_class}, "
+                f"{len(uids)} documents")
+    scores = get_batch_scores(doc_class, uids)
+    return {"status": STATUS_SUCCESS, "scores": scores}
+  except Exception as error:
+    err = traceback.format_exc().replace("\n", " ")
+    logger.error(err)
+    raise HTTPException(
+        status_code=500, detail="Failed to compute validation scores") \
+      from error
+
+
 def update_validation_status(case_id: str, uid: str, validation_score: float,
                              validation_status: str,
                              validation_entities: List[Dict]):
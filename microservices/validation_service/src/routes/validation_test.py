@@ -103,3 +103,13 @@ def test_validation_api_invalid_doc_class(client_with_emulator):
     with mock.patch("routes.validation.Logger"):
       response = client_with_emulator.post(url, json=entities)
   assert response.status_code == 500, "Status 500"
+
+
+def test_validation_batch_api(client_with_emulator):
+  """Test case to check the batch validation endpoint"""
+  url = f"{API_URL}validation_batch_api?doc_class=driving_license"
+  with mock.patch("routes.validation.get_batch_scores",
+                  return_value={"uid1": 1.0, "uid2": 0.5}):
+    response = client_with_emulator.post(url, json=["uid1", "uid2"])
+  assert response.status_code == 200, "Status 200"
+  assert response.json()["scores"] == {"uid1": 1.0, "uid2": 0.5}
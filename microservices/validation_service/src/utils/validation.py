@@ -19,16 +19,32 @@ This Script is Used to Calculate the Validation Score
 '''
 
 import json
+import threading
+from typing import Dict, List
 import pandas as pd
 from google.cloud import storage
-from common.config import PATH, VALIDATION_TABLE
+from common.config import PATH, VALIDATION_TABLE, VALIDATION_TABLE_TYPED, \
+  BQ_ENTITIES_SINK
 from common.utils.logging_handler import Logger
+from common.utils.rule_compiler import CompiledRule, compile_rules
 from common.db_client import bq_client
 import traceback
 
 logger = Logger.get_logger(__name__)
 bigquery_client = bq_client()
 
+# Rules run on the typed entity_values columns once only the typed sink is written
+RULES_PATH = PATH
+if BQ_ENTITIES_SINK == "typed":
+  RULES_TABLE = VALIDATION_TABLE_TYPED
+else:
+  RULES_TABLE = VALIDATION_TABLE
+
+# Rules compiled for the current generation of the rules file
+compiled_rules = {}
+compiled_rules_generation = None
+compiled_rules_lock = threading.Lock()
+
 
 def get_final_scores(data_list, entity):
   keys = []
@@ -51,23 +67,36 @@ def get_final_scores(data_list, entity):
   return entity
 
 
-def read_json(path):
-  """Function to read a json file directly from gcs
-  Input :
-  path:gcs file path
-  Output:
-  data_dict:json dictionary
-
+def get_compiled_rules(path: str = None) -> Dict[str, List[CompiledRule]]:
+  """Returns the compiled rules of the rules file, which are only downloaded
+  and compiled again when the file generation in GCS changes
   """
-
+  global compiled_rules, compiled_rules_generation
+  path = path or RULES_PATH
   bucket_name = path.split("/", 3)[2]
   file_path = path.split("/", 3)[3]
   client = storage.Client()
-  bucket = client.get_bucket(bucket_name)
-  blob = bucket.blob(file_path)
-  data = blob.download_as_string(client=None)
-  data_dict = json.loads(data)
-  return data_dict
+  blob = client.bucket(bucket_name).get_blob(file_path)
+  if blob is None:
+    raise FileNotFoundError(f"Rules file {path} not found")
+  with compiled_rules_lock:
+    if blob.generation != compiled_rules_generation:
+      rules = json.loads(blob.download_as_string(client=None))
+      compiled_rules = compile_rules(rules, RULES_TABLE,
+                                     typed=BQ_ENTITIES_SINK == "typed")
+      compiled_rules_generation = blob.generation
+      logger.info(f"get_compiled_rules - compiled {path} "
+                  f"generation {blob.generation}")
+    return compiled_rules
+
+
+def get_entity_values(entity: List[Dict]) -> Dict[str, str]:
+  """Returns {entity name: corrected value or extracted value}"""
+  values = {}
+  for e in entity or []:
+    value = e.get("corrected_value")
+    values[e.get("entity")] = e.get("value") if value in (None, "") else value
+  return values
 
 
 def get_values(documentlabel, cid, uid, entity):
@@ -81,15 +110,10 @@ def get_values(documentlabel, cid, uid, entity):
   Validation Score
 
   '''
-  # path=PATH
   try:
-    # VALIDATION_TABLE = "autodocprocessing-demo.data_extraction.entities"
-    # path = "gs://async_form_parser/Jsons/trial44.json"
-    path = PATH
-    data = read_json(path)
-    merge_query = f"and case_id ='{cid}' and uid='{uid}'"
+    rules = get_compiled_rules()
     validation_score,final_dict = \
-    get_scoring(data,merge_query,documentlabel,entity)
+    get_scoring(rules, cid, uid, documentlabel, entity)
     logger.info(f"Validation completed for document with case id {cid}"
                 f"and uid {uid}")
   except Exception as e:  # pylint: disable=broad-except
@@ -105,50 +129,74 @@ def get_values(documentlabel, cid, uid, entity):
   return validation_score, final_dict
 
 
-def get_individual_dict(query):
-  dict1 = {}
-  counter = query.count("$")
-  for i in range(1, counter + 1):
-    key = query.split_documents("$.")[i].split("'")[0]
-    dict1[key] = None
-  return dict1
+def run_rule_query(query, job_config):
+  try:
+    query_results = bigquery_client.query(query, job_config=job_config)
+    return query_results.to_dataframe()
+  except Exception as e:  # pylint: disable=broad-except
+    logger.error(e)
+    return pd.DataFrame()
 
 
-def get_scoring(data, merge_query, documentlabel, entity):
+def get_scoring(rules, case_id, uid, documentlabel, entity):
   '''
-  Fire the Rules on BQ table and calculate the Validation Scores
+  Evaluate the compiled Rules and calculate the Validation Scores.
+  Rules with a local predicate are evaluated on the entities, the other
+  rules are fired on the BQ table with case_id and uid as query parameters.
   input:
-  data : Rules dict
-  merge_query : the addtional query part with case id and uid appended
+  rules : compiled rules per document type
+  case_id : Case id of the document
+  uid : Uid of the document
   documentlabel: Document type
+  entity : entities of the document
   output:
   validation score
   '''
   l2 = []
   validation_score = 0
-  validation_rule = data.get(documentlabel)
-  if not validation_rule:
+  validation_rules = rules.get(documentlabel)
+  if not validation_rules:
     logger.warning(f"Unable to find validation rule for document type: {documentlabel}")
     validation_score = 0 # Nothing To Validate
     return validation_score, entity
 
-  assert validation_rule, f"Unable to find validation rule for document type: {documentlabel}"
-
-  for i in data[documentlabel]:
-    query = data[documentlabel][i] + merge_query
-    query = query.replace("project_table", VALIDATION_TABLE)
-    dict1 = get_individual_dict(query)
-    try:
-      query_results = bigquery_client.query((query))
-      df = query_results.to_dataframe()
-    except Exception as e:  # pylint: disable=broad-except
-      logger.error(e)
-      df = pd.DataFrame()
-    df = df.drop_duplicates()
-    validation_score = validation_score + len(df)
-    for key in dict1.copy():
-      dict1[key] = len(df)
-    l2.append(dict1)
-  validation_score = validation_score / len(data[documentlabel])
+  values = get_entity_values(entity)
+  for rule in validation_rules:
+    if rule.predicate is not None:
+      matches = int(rule.predicate(values))
+    else:
+      df = run_rule_query(rule.query,
+                          rule.document_job_config(case_id, uid))
+      matches = len(df.drop_duplicates())
+    validation_score = validation_score + matches
+    l2.append(dict.fromkeys(rule.keys, matches))
+  validation_score = validation_score / len(validation_rules)
   final_dict = get_final_scores(l2, entity)
   return validation_score, final_dict
+
+
+def get_batch_scores(documentlabel: str, uids: List[str]) -> Dict[str, float]:
+  '''
+  Validation scores of many documents already streamed to BigQuery,
+  with one query per rule for all uids
+  input:
+  documentlabel: Document type
+  uids : Uids of the documents
+  output:
+  validation score per uid
+  '''
+  validation_rules = get_compiled_rules().get(documentlabel)
+  if not validation_rules:
+    logger.warning(f"Unable to find validation rule for document type: {documentlabel}")
+    return {uid: 0 for uid in uids}
+
+  matches = dict.fromkeys(uids, 0)
+  for rule in validation_rules:
+    df = run_rule_query(rule.batch_query, rule.batch_job_config(uids))
+    if df.empty:
+      continue
+    for uid in set(df["uid"]):
+      if uid in matches:
+        matches[uid] += 1
+  return {uid: count / len(validation_rules)
+          for uid, count in matches.items()}
@@ -8,4 +8,26 @@ bq mk \
   --dataset_id=$DATASET_ID \
   --description="Used by CDA to keep track of documents processed" \
   --schema="$DIR/validation_table_schema.json" \
-  "$DATASET_ID.validation_table"
\ No newline at end of file
+  "$DATASET_ID.validation_table"
+
+bq mk \
+  --table \
+  --project_id=$PROJECT_ID \
+  --dataset_id=$DATASET_ID \
+  --description="Latest state per uid of validation_table, used by the analytics views" \
+  --time_partitioning_field=timestamp \
+  --time_partitioning_type=DAY \
+  --clustering_fields=document_class,uid \
+  --schema="$DIR/latest_documents_schema.json" \
+  "$DATASET_ID.latest_documents"
+
+bq mk \
+  --table \
+  --project_id=$PROJECT_ID \
+  --dataset_id=$DATASET_ID \
+  --description="Documents processed by CDA with typed entity values" \
+  --time_partitioning_field=timestamp \
+  --time_partitioning_type=DAY \
+  --clustering_fields=document_class,uid \
+  --schema="$DIR/validation_table_typed_schema.json" \
+  "$DATASET_ID.validation_table_typed"
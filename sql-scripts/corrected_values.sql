@@ -19,21 +19,12 @@
  */
 
 
-WITH latest AS (
-    SELECT *
-    FROM `validation.validation_table` t
-    WHERE timestamp = (SELECT MAX(timestamp) FROM `validation.validation_table` WHERE uid = t.uid ) /*and  timestamp > cast('2023-05-02T19:00:00' as datetime)*/
-    ),
-    flattened_1 AS (
-SELECT * except (ocr_text, classification_score),
-    JSON_VALUE(parent, "$.corrected_value") as corrected_value,
-    JSON_VALUE(parent, "$.value") as value,
-    CAST(JSON_VALUE(parent, "$.confidence") AS DECIMAL) as confidence,
-    JSON_VALUE(parent, "$.name") as name,
-
-FROM latest l
-    CROSS JOIN UNNEST(JSON_QUERY_ARRAY(entities, "$")) parent
-    )
-SELECT * except (entities, parent, document_type) FROM flattened_1
-WHERE corrected_value != ""
-ORDER BY flattened_1.confidence ASC
+SELECT l.* except (entities, entity_values, document_type, ocr_text, classification_score),
+    e.corrected_value,
+    e.value,
+    e.confidence,
+    e.name,
+FROM `validation.latest_documents` l
+    CROSS JOIN UNNEST(l.entity_values) e
+WHERE e.corrected_value != ""
+ORDER BY e.confidence ASC
@@ -16,6 +16,26 @@
 
 DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
 source "$DIR/../SET"
+
+# Latest state per uid, partitioned by date and clustered by document_class and uid.
+# Views read from this table instead of scanning the full validation_table history.
+bq show --project_id $PROJECT_ID $BIGQUERY_DATASET.latest_documents > /dev/null 2>&1 || \
+bq mk --table --project_id $PROJECT_ID \
+--time_partitioning_field timestamp --time_partitioning_type DAY \
+--clustering_fields document_class,uid \
+--schema "$DIR/../setup/latest_documents_schema.json" \
+$BIGQUERY_DATASET.latest_documents
+
+# Scheduled query keeping latest_documents up to date, created only once
+# (location of the dataset, see terraform/modules/bigquery)
+BQ_LOCATION=${BQ_LOCATION:-us}
+MERGE_DISPLAY_NAME="Merge latest documents"
+query=`cat $DIR/merge_latest_documents.sql`
+bq query --use_legacy_sql=false --project_id $PROJECT_ID "$query"
+bq ls --transfer_config --transfer_location=$BQ_LOCATION --project_id $PROJECT_ID \
+| grep -q "$MERGE_DISPLAY_NAME" || \
+bq query --use_legacy_sql=false --project_id $PROJECT_ID \
+--display_name "$MERGE_DISPLAY_NAME" --schedule "every 15 minutes" "$query"
 query=`cat $DIR/corrected_values.sql`
 bq mk --use_legacy_sql=false --view "$query" \
 --project_id $PROJECT_ID --dataset_id $BIGQUERY_DATASET $BIGQUERY_DATASET.corrected_values
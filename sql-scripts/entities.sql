@@ -19,19 +19,11 @@
  */
 
 
-WITH latest AS (
-    SELECT *
-    FROM `validation.validation_table` t
-    WHERE timestamp = (SELECT MAX(timestamp) FROM `validation.validation_table` WHERE uid = t.uid )
-    ),
-    flattened_1 AS (
-SELECT * except (ocr_text),
-    JSON_VALUE(parent, "$.corrected_value") as corrected_value,
-    CAST(JSON_VALUE(parent, "$.confidence") AS DECIMAL) as confidence,
-    JSON_VALUE(parent, "$.name") as name,
-    JSON_VALUE(parent, "$.value") as value,
-FROM latest l
-    CROSS JOIN UNNEST(JSON_QUERY_ARRAY(entities, "$")) parent
-    )
-SELECT * except (entities, parent) FROM flattened_1
+SELECT l.* except (entities, entity_values, ocr_text),
+    e.corrected_value,
+    e.confidence,
+    e.name,
+    e.value,
+FROM `validation.latest_documents` l
+    CROSS JOIN UNNEST(l.entity_values) e
 
@@ -0,0 +1,37 @@
+/* Copyright 2024 Google LLC
+*
+*  Licensed under the Apache License, Version 2.0 (the "License");
+*  you may not use this file except in compliance with the License.
+*  You may obtain a copy of the License at
+*
+*      http://www.apache.org/licenses/LICENSE-2.0
+*
+*  Unless required by applicable law or agreed to in writing, software
+*  distributed under the License is distributed on an "AS IS" BASIS,
+*  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+*  See the License for the specific language governing permissions and
+*  limitations under the License.
+*/
+
+/*
+ * Use Cases:
+ *   - Display all extracted entities with typed values from validation_table_typed
+ *     (if there are multiple entries for the same uid, shows the latest entry)
+ */
+
+
+SELECT t.* except (entity_values, ocr_text, row_num),
+    e.name,
+    e.value,
+    e.corrected_value,
+    e.numeric_value,
+    e.date_value,
+    e.confidence,
+    e.page_no
+FROM (
+    SELECT *,
+        ROW_NUMBER() OVER (PARTITION BY uid ORDER BY timestamp DESC) AS row_num
+    FROM `validation.validation_table_typed`
+) t
+    CROSS JOIN UNNEST(t.entity_values) e
+WHERE t.row_num = 1
@@ -0,0 +1,68 @@
+/* Copyright 2024 Google LLC
+*
+*  Licensed under the Apache License, Version 2.0 (the "License");
+*  you may not use this file except in compliance with the License.
+*  You may obtain a copy of the License at
+*
+*      http://www.apache.org/licenses/LICENSE-2.0
+*
+*  Unless required by applicable law or agreed to in writing, software
+*  distributed under the License is distributed on an "AS IS" BASIS,
+*  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+*  See the License for the specific language governing permissions and
+*  limitations under the License.
+*/
+
+/*
+ * Maintains validation.latest_documents: the latest validation_table row per
+ * uid, with entities flattened into the entity_values column.
+ * Only rows newer than the last merged timestamp are read, so each run only
+ * scans recent rows. Run on a schedule (scheduled by create_views.sh).
+ */
+
+MERGE `validation.latest_documents` T
+USING (
+    SELECT * EXCEPT (row_num),
+        ARRAY(
+            SELECT AS STRUCT
+                JSON_VALUE(parent, "$.name") AS name,
+                JSON_VALUE(parent, "$.value") AS value,
+                JSON_VALUE(parent, "$.corrected_value") AS corrected_value,
+                SAFE_CAST(JSON_VALUE(parent, "$.confidence") AS NUMERIC) AS confidence,
+                SAFE_CAST(JSON_VALUE(parent, "$.page_no") AS INT64) AS page_no
+            FROM UNNEST(JSON_QUERY_ARRAY(entities, "$")) parent
+        ) AS entity_values
+    FROM (
+        SELECT *,
+            ROW_NUMBER() OVER (PARTITION BY uid ORDER BY timestamp DESC) AS row_num
+        FROM `validation.validation_table`
+        -- One hour look-back for rows which were still in the streaming
+        -- buffer during the previous run
+        WHERE timestamp > (
+            SELECT DATETIME_SUB(IFNULL(MAX(timestamp), DATETIME "1970-01-01"),
+                                INTERVAL 1 HOUR)
+            FROM `validation.latest_documents`)
+    )
+    WHERE row_num = 1
+) S
+ON T.uid = S.uid
+WHEN MATCHED AND S.timestamp > T.timestamp THEN
+    UPDATE SET
+        case_id = S.case_id,
+        document_class = S.document_class,
+        document_type = S.document_type,
+        -- Rows without ocr_text (e.g. re-assigned documents) keep the known text
+        ocr_text = IFNULL(S.ocr_text, T.ocr_text),
+        classification_score = S.classification_score,
+        is_hitl_classified = S.is_hitl_classified,
+        entities = S.entities,
+        entity_values = S.entity_values,
+        timestamp = S.timestamp,
+        gcs_doc_path = S.gcs_doc_path
+WHEN NOT MATCHED THEN
+    INSERT (uid, case_id, document_class, document_type, ocr_text,
+            classification_score, is_hitl_classified, entities, entity_values,
+            timestamp, gcs_doc_path)
+    VALUES (S.uid, S.case_id, S.document_class, S.document_type, S.ocr_text,
+            S.classification_score, S.is_hitl_classified, S.entities,
+            S.entity_values, S.timestamp, S.gcs_doc_path)
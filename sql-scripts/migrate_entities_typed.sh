@@ -0,0 +1,39 @@
+#!/usr/bin/env bash
+# Copyright 2024 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Creates validation_table_typed if missing and backfills it from the entities
+# JSON column of validation_table. Safe to re-run.
+DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
+source "$DIR/../SET"
+
+bq show --project_id $PROJECT_ID $BIGQUERY_DATASET.validation_table_typed > /dev/null 2>&1 || \
+bq mk --table --project_id $PROJECT_ID \
+--time_partitioning_field timestamp --time_partitioning_type DAY \
+--clustering_fields document_class,uid \
+--schema "$DIR/../setup/validation_table_typed_schema.json" \
+$BIGQUERY_DATASET.validation_table_typed
+
+query=`cat $DIR/migrate_entities_typed.sql`
+bq query --use_legacy_sql=false --project_id $PROJECT_ID "$query"
+
+# The view is updated when it exists (re-run after a partial failure)
+query=`cat $DIR/entities_typed.sql`
+if bq show --project_id $PROJECT_ID $BIGQUERY_DATASET.entities_typed > /dev/null 2>&1; then
+  bq update --use_legacy_sql=false --view "$query" \
+  --project_id $PROJECT_ID $BIGQUERY_DATASET.entities_typed
+else
+  bq mk --use_legacy_sql=false --view "$query" \
+  --project_id $PROJECT_ID --dataset_id $BIGQUERY_DATASET $BIGQUERY_DATASET.entities_typed
+fi
@@ -0,0 +1,62 @@
+/* Copyright 2024 Google LLC
+*
+*  Licensed under the Apache License, Version 2.0 (the "License");
+*  you may not use this file except in compliance with the License.
+*  You may obtain a copy of the License at
+*
+*      http://www.apache.org/licenses/LICENSE-2.0
+*
+*  Unless required by applicable law or agreed to in writing, software
+*  distributed under the License is distributed on an "AS IS" BASIS,
+*  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+*  See the License for the specific language governing permissions and
+*  limitations under the License.
+*/
+
+/*
+ * Backfills validation.validation_table_typed from the entities JSON column of
+ * validation.validation_table. Rows already present in the typed table
+ * (same uid and timestamp) are skipped, so the script can be re-run while
+ * BQ_ENTITIES_SINK=both is rolled out.
+ * Typing mirrors common.utils.format_data_for_bq.format_data_for_bq_typed:
+ * the effective value is the corrected value if present, else the extracted value.
+ */
+
+INSERT INTO `validation.validation_table_typed`
+    (uid, case_id, document_class, document_type, ocr_text, classification_score,
+     is_hitl_classified, timestamp, gcs_doc_path, entity_values)
+SELECT v.uid, v.case_id, v.document_class, v.document_type, v.ocr_text,
+    v.classification_score, v.is_hitl_classified, v.timestamp, v.gcs_doc_path,
+    ARRAY(
+        SELECT AS STRUCT
+            name, value, corrected_value,
+            SAFE_CAST(REGEXP_REPLACE(TRIM(effective_value), r"^\$|,", "") AS FLOAT64)
+                AS numeric_value,
+            COALESCE(
+                SAFE.PARSE_DATE("%Y-%m-%d", SUBSTR(TRIM(effective_value), 1, 10)),
+                SAFE.PARSE_DATE("%Y/%m/%d", SUBSTR(TRIM(effective_value), 1, 10)),
+                SAFE.PARSE_DATE("%m/%d/%Y", TRIM(effective_value)),
+                SAFE.PARSE_DATE("%m-%d-%Y", TRIM(effective_value)),
+                SAFE.PARSE_DATE("%m/%d/%y", TRIM(effective_value)),
+                SAFE.PARSE_DATE("%b %d, %Y", TRIM(effective_value)),
+                SAFE.PARSE_DATE("%B %d, %Y", TRIM(effective_value)),
+                SAFE.PARSE_DATE("%d %b %Y", TRIM(effective_value)),
+                SAFE.PARSE_DATE("%d %B %Y", TRIM(effective_value))
+            ) AS date_value,
+            confidence, page_no
+        FROM (
+            SELECT
+                JSON_VALUE(parent, "$.name") AS name,
+                JSON_VALUE(parent, "$.value") AS value,
+                JSON_VALUE(parent, "$.corrected_value") AS corrected_value,
+                IFNULL(NULLIF(JSON_VALUE(parent, "$.corrected_value"), ""),
+                       JSON_VALUE(parent, "$.value")) AS effective_value,
+                SAFE_CAST(JSON_VALUE(parent, "$.confidence") AS FLOAT64) AS confidence,
+                SAFE_CAST(JSON_VALUE(parent, "$.page_no") AS INT64) AS page_no
+            FROM UNNEST(JSON_QUERY_ARRAY(v.entities, "$")) parent
+        )
+    ) AS entity_values
+FROM `validation.validation_table` v
+WHERE NOT EXISTS (
+    SELECT 1 FROM `validation.validation_table_typed` t
+    WHERE t.uid = v.uid AND t.timestamp = v.timestamp)
@@ -29,6 +29,8 @@ if [ -z "$SCRIPT" ]; then
   echo "     - entities"
   echo "     - confidence"
   echo "     - count"
+  echo "     - merge_latest_documents (refresh latest_documents used by the other queries)"
+  echo "     - entities_typed (entities with typed values from validation_table_typed)"
   exit
 fi
 
@@ -104,3 +104,44 @@ resource "google_bigquery_table" "table_id" {
 EOF
 
 }
+
+# Latest row per uid with flattened entities, maintained by
+# sql-scripts/merge_latest_documents.sql. Analytics views read from it.
+resource "google_bigquery_table" "latest_documents" {
+  depends_on = [
+    google_bigquery_dataset.data_set
+  ]
+
+  deletion_protection = false
+  dataset_id          = "validation"
+  table_id            = "latest_documents"
+
+  time_partitioning {
+    type  = "DAY"
+    field = "timestamp"
+  }
+  clustering = ["document_class", "uid"]
+
+  schema = file("${path.module}/latest_documents_schema.json")
+}
+
+# Document rows with entities as a typed repeated STRUCT, written when
+# BQ_ENTITIES_SINK is "typed" or "both" and backfilled with
+# sql-scripts/migrate_entities_typed.sh
+resource "google_bigquery_table" "validation_table_typed" {
+  depends_on = [
+    google_bigquery_dataset.data_set
+  ]
+
+  deletion_protection = false
+  dataset_id          = "validation"
+  table_id            = "validation_table_typed"
+
+  time_partitioning {
+    type  = "DAY"
+    field = "timestamp"
+  }
+  clustering = ["document_class", "uid"]
+
+  schema = file("${path.module}/validation_table_typed_schema.json")
+}
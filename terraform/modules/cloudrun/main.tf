@@ -144,6 +144,8 @@ resource "google_cloud_run_service" "cloudrun-service" {
         "run.googleapis.com/vpc-access-connector" = var.vpc_connector_name
         # all egress from the service should go through the VPC Connector
         "run.googleapis.com/vpc-access-egress" = "all-traffic"
+        # The streaming pull worker needs CPU outside of requests
+        "run.googleapis.com/cpu-throttling" = var.queue_mode == "pull" ? "false" : "true"
       }
       labels = {
         goog-packaged-solution = "prior-authorization"
@@ -179,6 +181,10 @@ resource "google_cloud_run_service" "cloudrun-service" {
           name  = "IAP_SECRET_NAME"
           value = var.iap_secret_name
         }
+        env {
+          name  = "QUEUE_MODE"
+          value = var.queue_mode
+        }
       }
       service_account_name = module.cloud-run-service-account.email
     }
@@ -53,4 +53,10 @@ variable "vpc_connector_name" {
 variable "iap_secret_name" {
   type        = string
   description = "Secret to store CLinet id and client secret for IAP"
-}
\ No newline at end of file
+}
+
+variable "queue_mode" {
+  type        = string
+  description = "QUEUE_MODE of the queue service, push or pull"
+  default     = "push"
+}
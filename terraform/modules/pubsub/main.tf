@@ -22,7 +22,9 @@ resource "google_pubsub_topic" "queue" {
   name = var.topic
 }
 
+# Push deliveries to the queue service, used when queue_mode is "push"
 resource "google_eventarc_trigger" "queue-topic-trigger" {
+  count           = var.queue_mode == "push" ? 1 : 0
   provider        = google
   name            = "${var.topic}-trigger"
   project         = var.project_id
@@ -48,3 +50,31 @@ resource "google_eventarc_trigger" "queue-topic-trigger" {
     }
   }
 }
+
+# Subscription of the queue service streaming pull worker (queue_mode "pull")
+resource "google_pubsub_subscription" "queue-pull" {
+  count                   = var.queue_mode == "pull" ? 1 : 0
+  name                    = "${var.topic}-pull"
+  project                 = var.project_id
+  topic                   = google_pubsub_topic.queue.name
+  ack_deadline_seconds    = 60
+  enable_message_ordering = true
+  expiration_policy {
+    ttl = ""
+  }
+  retry_policy {
+    minimum_backoff = "10s"
+    maximum_backoff = "600s"
+  }
+  labels = {
+    goog-packaged-solution = "prior-authorization"
+  }
+}
+
+resource "google_pubsub_subscription_iam_member" "queue-pull-subscriber" {
+  count        = var.queue_mode == "pull" ? 1 : 0
+  project      = var.project_id
+  subscription = google_pubsub_subscription.queue-pull[0].name
+  role         = "roles/pubsub.subscriber"
+  member       = "serviceAccount:${var.service_account_email}"
+}
@@ -16,7 +16,9 @@
  */
 //
 output "queue-subscription" {
-  value = google_eventarc_trigger.queue-topic-trigger.transport[0].pubsub[0].subscription
+  value = (var.queue_mode == "push" ?
+    google_eventarc_trigger.queue-topic-trigger[0].transport[0].pubsub[0].subscription :
+  google_pubsub_subscription.queue-pull[0].id)
 }
 
 //output "event-topic" {
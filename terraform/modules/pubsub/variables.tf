@@ -48,3 +48,9 @@ variable "region" {
 variable "service_account_email" {
   type = string
 }
+
+variable "queue_mode" {
+  type        = string
+  description = "push to deliver queue messages via Eventarc, pull for the streaming pull worker"
+  default     = "push"
+}
@@ -212,6 +212,7 @@ module "cloudrun-queue" {
   protocol           = local.cloud_run_protocol
   iap_secret_name    = var.iap_secret_name
   repo_name          = var.repo_name
+  queue_mode         = var.queue_mode
 }
 
 module "cloudrun-start-pipeline" {
@@ -271,6 +272,55 @@ module "cloudrun-queue-pubsub" {
   cloudrun_location     = module.cloudrun-queue.location
   cloudrun_endpoint     = module.cloudrun-queue.endpoint
   service_account_email = module.cloudrun-queue.service_account_email
+  queue_mode            = var.queue_mode
+}
+
+
+# Per-stage queues of the pipeline orchestrator
+# (PIPELINE_ORCHESTRATOR_ENABLED), each stage is pulled by its own workers
+locals {
+  pipeline_stages = ["classification", "extraction", "validation"]
+}
+
+resource "google_pubsub_topic" "pipeline-stage" {
+  depends_on = [time_sleep.wait_for_project_services]
+  for_each   = toset(local.pipeline_stages)
+  name       = "pipeline-${each.value}"
+}
+
+resource "google_pubsub_subscription" "pipeline-stage-worker" {
+  for_each             = toset(local.pipeline_stages)
+  name                 = "pipeline-${each.value}-worker"
+  topic                = google_pubsub_topic.pipeline-stage[each.value].name
+  ack_deadline_seconds = 60
+  expiration_policy {
+    ttl = ""
+  }
+  retry_policy {
+    minimum_backoff = "10s"
+    maximum_backoff = "600s"
+  }
+  labels = {
+    goog-packaged-solution = "prior-authorization"
+  }
+}
+
+# Tasks which failed PIPELINE_MAX_ATTEMPTS times
+resource "google_pubsub_topic" "pipeline-dead-letter" {
+  depends_on = [time_sleep.wait_for_project_services]
+  name       = "pipeline-dead-letter"
+}
+
+resource "google_pubsub_subscription" "pipeline-dead-letter" {
+  name                       = "pipeline-dead-letter-sub"
+  topic                      = google_pubsub_topic.pipeline-dead-letter.name
+  message_retention_duration = "604800s"
+  expiration_policy {
+    ttl = ""
+  }
+  labels = {
+    goog-packaged-solution = "prior-authorization"
+  }
 }
 
 
@@ -460,6 +510,16 @@ resource "google_storage_bucket" "document-upload" {
   storage_class               = "STANDARD"
   uniform_bucket_level_access = true
   force_destroy               = true
+  # Claim check payloads of oversized Pub/Sub messages
+  lifecycle_rule {
+    condition {
+      age            = 7
+      matches_prefix = ["pubsub_payloads/"]
+    }
+    action {
+      type = "Delete"
+    }
+  }
   labels = {
     goog-packaged-solution = "prior-authorization"
   }
@@ -488,6 +548,16 @@ resource "google_storage_bucket" "docai-output" {
   storage_class               = "STANDARD"
   uniform_bucket_level_access = true
   force_destroy               = true
+  # Page range chunks of PDFs over the DocAI processor limits
+  lifecycle_rule {
+    condition {
+      age            = 7
+      matches_prefix = ["chunks/"]
+    }
+    action {
+      type = "Delete"
+    }
+  }
   labels = {
     goog-packaged-solution = "prior-authorization"
   }
@@ -211,4 +211,14 @@ variable "cda_external_ui" {
   type        = bool
   description = "Expose UI to public internet"
   default     = false
-}
\ No newline at end of file
+}
+
+variable "queue_mode" {
+  type        = string
+  description = "push relays Eventarc deliveries to process_task, pull runs the streaming pull worker"
+  default     = "push"
+  validation {
+    condition     = contains(["push", "pull"], var.queue_mode)
+    error_message = "queue_mode must be push or pull."
+  }
+}
@@ -1,16 +1,29 @@
 import argparse
 import os
 import sys
+import threading
 import time
-from google.api_core.exceptions import NotFound
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from google.api_core.exceptions import (
+    DeadlineExceeded,
+    InternalServerError,
+    NotFound,
+    ResourceExhausted,
+    ServiceUnavailable,
+)
 from google.cloud import storage
 import json
-from typing import List
+from typing import Dict, List, Tuple
 from google.cloud import contentwarehouse_v1
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '../../common/src'))
 
-from common.utils.helper import is_date
+from common.utils.helper import FLOAT_PATTERN, INT_PATTERN, is_date
 from config import (
     API_LOCATION,
     PROCESSOR_ID,
@@ -21,12 +34,14 @@ from config import (
     CALLER_USER,
 )
 
+from common.config import FIELD_MASK_WAREHOUSE, get_field_mask
 from common.utils.logging_handler import Logger
 from common.utils.document_warehouse_utils import DocumentWarehouseUtils
 from common.utils.docai_warehouse_helper import (
     get_metadata_properties,
     get_key_value_pairs,
 )
+from common.utils import docai_warehouse_helper
 from common.utils.document_ai_utils import DocumentaiUtils
 from common.utils import storage_utils, helper
 
@@ -46,13 +61,28 @@ docai_utils = DocumentaiUtils(
 
 storage_client = storage.Client()
 document_id_list = []
-created_folders = []
+created_folders = set()
 files_to_parse = {}
 processed_files = []
 processed_dirs = set()
 error_files = []
 created_schemas = set()
 
+# Bulk load mode
+folder_ids: Dict[str, str] = {}  # reference_id -> folder document id
+manifest_lock = threading.Lock()
+RETRYABLE_ERRORS = (
+    DeadlineExceeded,
+    InternalServerError,
+    ResourceExhausted,
+    ServiceUnavailable,
+)
+RETRY_BASE_DELAY_SECONDS = 2
+chunk_size = 100
+workers = 1
+retries = 0
+manifest_path = None
+
 
 def main(folder_name: str, schema_name: str = None):
     logger.info(
@@ -104,7 +134,7 @@ def main(folder_name: str, schema_name: str = None):
                             create_folder(
                                 folder_schema_id, d, reference_id
                             )
-                            created_folders.append(reference_id)
+                            created_folders.add(reference_id)
 
                         parent = dw_utils.get_document(
                             f"referenceId/{reference_id}", CALLER_USER
@@ -130,50 +160,30 @@ def main(folder_name: str, schema_name: str = None):
             logger.error(f"Exception {ex} while handling {filename}")
             error_files.append(filename)
 
-    # Process All Documents in One batch
-    docai_output_list = docai_utils.batch_extraction(
-        PROCESSOR_ID, list(files_to_parse.keys()), GCS_OUTPUT_BUCKET
-    )
     processor = docai_utils.get_processor(PROCESSOR_ID)
     document_schemas = get_document_schemas()
-    document_schema_id = None
 
     if not schema_name:
         schema_name = processor.display_name
 
-    for f_uri in docai_output_list:
-        document_ai_output = docai_output_list[f_uri]
+    # Process Documents in chunks, DocAI works on the next chunk while
+    # results of the current one are uploaded.
+    # Only fields stored in the warehouse are written to the output json
+    for f_uri, document_ai_output in docai_utils.stream_batch_extraction(
+            PROCESSOR_ID, list(files_to_parse.keys()), GCS_OUTPUT_BUCKET,
+            chunk_size=chunk_size,
+            field_mask=get_field_mask(FIELD_MASK_WAREHOUSE)
+    ):
         if f_uri in files_to_parse:
             keys = get_key_value_pairs(document_ai_output)
-            create_new_schema = False
-
-            if schema_id:
-                document_schema_id = schema_id
-            else:
-
-                if schema_name in document_schemas:
-                    document_schema_id = document_schemas[schema_name]
-                    schema = dw_utils.get_document_schema(document_schema_id)
-                    if (
-                            schema
-                            and len(keys) != 0
-                            and len(schema.property_definitions) == 0
-                            and options
-                    ):
-                        create_new_schema = True
-                else:
-                    create_new_schema = True
-
-            if create_new_schema:
-                schema_path = create_mapping_schema(schema_name, keys, options)
-                new_schema_id = create_document_schema(schema_path, True)
-                if document_schema_id != new_schema_id:
-                    created_schemas.add(new_schema_id)
-                    document_schemas[schema_name] = new_schema_id
-                    document_schema_id = new_schema_id
+            document_schema_id = resolve_document_schema(
+                schema_name, keys, document_schemas
+            )
 
             (parent_id, reference_id) = files_to_parse[f_uri]
-            schema = dw_utils.get_document_schema(document_schema_id)
+            schema = docai_warehouse_helper.get_document_schema(
+                dw_utils, document_schema_id
+            )
 
             metadata_properties = get_metadata_properties(keys, schema)
             try:
@@ -206,10 +216,279 @@ def main(folder_name: str, schema_name: str = None):
 
     if len(error_files) != 0:
         logger.info(
-            f"Following files could not be handled (Document page number exceeding limit of 200 pages? {','.join(error_files)}"
+            f"Following files could not be handled: {','.join(error_files)}"
+        )
+
+
+def bulk_load(folder_name: str, schema_name: str = None):
+    """
+    Same as main, but resolves the folder tree once per run, checks existence
+    and creates/links documents concurrently using a pool of `workers`,
+    retries transient API errors and skips files recorded in the manifest.
+    """
+    logger.info(
+        f"Bulk load into DocumentAI WH using \n root_name={folder_name}, "
+        f"dir_uri={dir_uri}, overwrite={overwrite}, options={options}, flatten={flatten}, "
+        f"workers={workers}, retries={retries}, manifest={manifest_path} \n"
+        f"DOCAI_WH_PROJECT_NUMBER={DOCAI_WH_PROJECT_NUMBER}, "
+        f"DOCAI_PROJECT_NUMBER={DOCAI_PROJECT_NUMBER}, "
+        f"PROCESSOR_ID={PROCESSOR_ID}, \n"
+        f"GCS_OUTPUT_BUCKET={GCS_OUTPUT_BUCKET}, "
+        f"CALLER_USER={CALLER_USER}"
+    )
+    initial_start_time = time.time()
+
+    folder_schema_id = create_folder_schema(FOLDER_SCHEMA_PATH)
+
+    bucket_name, prefix = helper.split_uri_2_bucket_prefix(dir_uri)
+    if not prefix.endswith(".pdf") and prefix != "":
+        prefix = prefix + "/"
+
+    blobs = list(storage_client.list_blobs(bucket_name, prefix=prefix))
+
+    if folder_name is None:
+        folder_name = bucket_name
+
+    manifest = load_manifest(manifest_path)
+    skipped_files = 0
+    # file uri -> (folder reference_id, document reference_id)
+    candidates: Dict[str, Tuple[str, str]] = {}
+    folder_chains = []
+    for blob in blobs:
+        filename = blob.name
+        if not filename.endswith(".pdf"):
+            continue
+        file_uri = f"gs://{bucket_name}/{filename}"
+        if file_uri in manifest and not overwrite:
+            skipped_files += 1
+            continue
+
+        if flatten:
+            dirs = [filename.replace("/", "__")]
+        else:
+            dirs = filename.split("/")
+
+        chain = []
+        reference_id = folder_name
+        for d in dirs[:-1]:
+            reference_id = f"{reference_id}__{d}".strip()
+            processed_dirs.add(d)
+            chain.append((reference_id, d))
+        folder_chains.append(chain)
+        candidates[file_uri] = (reference_id,
+                                f"{reference_id}__{dirs[-1]}".strip())
+
+    logger.info(
+        f"bulk_load - {len(candidates)} files to load, {skipped_files} files "
+        f"skipped as already loaded according to the manifest"
+    )
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        build_folder_tree(executor, folder_schema_id, folder_name, folder_chains)
+
+        file_uris = list(candidates.keys())
+        exists = executor.map(
+            lambda uri: with_retries(document_exists, candidates[uri][1]),
+            file_uris
+        )
+        for file_uri, found in zip(file_uris, exists):
+            folder_reference_id, reference_id = candidates[file_uri]
+            if found:
+                if overwrite:
+                    with_retries(delete_document, reference_id)
+                else:
+                    logger.info(f"Skipping {file_uri} since it already exists...")
+                    append_to_manifest(file_uri, reference_id, None)
+                    continue
+            files_to_parse[file_uri] = (folder_ids[folder_reference_id],
+                                        reference_id)
+            processed_files.append(file_uri)
+
+        if len(files_to_parse) == 0:
+            logger.info("bulk_load - Nothing to load")
+            return
+
+        processor = docai_utils.get_processor(PROCESSOR_ID)
+        document_schemas = get_document_schemas()
+
+        if not schema_name:
+            schema_name = processor.display_name
+
+        # Process Documents in chunks, DocAI works on the next chunk while
+        # results of the current one are uploaded. Number of uploads in
+        # flight is bounded, so a Document is released soon after upload.
+        # Only fields stored in the warehouse are written to the output json
+        futures = {}
+        for f_uri, document_ai_output in docai_utils.stream_batch_extraction(
+                PROCESSOR_ID, list(files_to_parse.keys()), GCS_OUTPUT_BUCKET,
+                chunk_size=chunk_size,
+                field_mask=get_field_mask(FIELD_MASK_WAREHOUSE)
+        ):
+            if f_uri not in files_to_parse:
+                continue
+            if len(futures) >= 2 * workers:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    handle_upload_result(future, *futures.pop(future))
+            keys = get_key_value_pairs(document_ai_output)
+            document_schema_id = resolve_document_schema(
+                schema_name, keys, document_schemas
+            )
+            schema = docai_warehouse_helper.get_document_schema(
+                dw_utils, document_schema_id
+            )
+            metadata_properties = get_metadata_properties(keys, schema)
+            (parent_id, reference_id) = files_to_parse[f_uri]
+            future = executor.submit(
+                upload_document_gcs,
+                f_uri,
+                document_schema_id,
+                parent_id,
+                reference_id,
+                document_ai_output,
+                metadata_properties,
+            )
+            futures[future] = (f_uri, reference_id)
+
+        for future in as_completed(futures):
+            handle_upload_result(future, *futures[future])
+
+    process_time = time.time() - initial_start_time
+    docs_per_minute = len(document_id_list) / max(process_time / 60, 1e-6)
+    document_schema_str = ""
+    if len(created_schemas) > 0:
+        document_schema_str = (
+            f"  - created document schema with id {','.join(list(created_schemas))}"
+        )
+    logger.info(
+        f"Job Completed in {str(round(process_time / 60))} minute(s): \n"
+        f"{document_schema_str}  \n"
+        f"  - processed gcs files={len(processed_files)} \n"
+        f"  - skipped gcs files (manifest)={skipped_files} \n"
+        f"  - created dw documents={len(document_id_list)} \n"
+        f"  - processed gcs directories={len(processed_dirs)} \n"
+        f"  - created dw directories={len(created_folders)} \n"
+        f"  - throughput={round(docs_per_minute, 1)} docs/min \n"
+    )
+
+    if len(error_files) != 0:
+        logger.info(
+            f"Following files could not be handled, re-run to retry them: {','.join(error_files)}"
         )
 
 
+def handle_upload_result(future, f_uri: str, reference_id: str):
+    try:
+        document_id = future.result()
+        if document_id is None:
+            # not recorded in the manifest, so a resumed run retries it
+            raise RuntimeError("Document was not created")
+        append_to_manifest(f_uri, reference_id, document_id)
+    except Exception as ex:
+        logger.error(f"Failed to upload {f_uri} - {ex}")
+        error_files.append(f_uri)
+
+
+def build_folder_tree(executor, folder_schema_id: str, root_name: str,
+                      folder_chains: List[List[Tuple[str, str]]]):
+    """
+    Creates (or looks up) every folder once, level by level so that folders
+    of the same depth are resolved concurrently, and caches their ids.
+    """
+    if root_name not in folder_ids:
+        folder_ids[root_name] = with_retries(
+            create_folder, folder_schema_id, root_name, root_name
+        )
+
+    levels: Dict[int, Dict[str, str]] = {}
+    for chain in folder_chains:
+        for depth, (reference_id, display_name) in enumerate(chain):
+            levels.setdefault(depth, {})[reference_id] = display_name
+
+    for depth in sorted(levels.keys()):
+        futures = {
+            executor.submit(with_retries, create_folder, folder_schema_id,
+                            display_name, reference_id): reference_id
+            for reference_id, display_name in levels[depth].items()
+            if reference_id not in folder_ids
+        }
+        for future in as_completed(futures):
+            reference_id = futures[future]
+            folder_ids[reference_id] = future.result()
+            created_folders.add(reference_id)
+    logger.info(f"build_folder_tree - resolved {len(folder_ids)} folders")
+
+
+def with_retries(fn, *args, **kwargs):
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except RETRYABLE_ERRORS as ex:
+            if attempt == retries:
+                raise
+            delay = RETRY_BASE_DELAY_SECONDS * 2 ** attempt
+            logger.warning(
+                f"with_retries - {fn.__name__} failed with {ex}, "
+                f"retrying in {delay} seconds ({attempt + 1}/{retries})"
+            )
+            time.sleep(delay)
+
+
+def load_manifest(path: str) -> Dict[str, dict]:
+    """Manifest is a JSON lines file with one entry per loaded file."""
+    if not path or not os.path.exists(path):
+        return {}
+    manifest = {}
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                manifest[entry["uri"]] = entry
+    logger.info(f"load_manifest - {len(manifest)} files already loaded")
+    return manifest
+
+
+def append_to_manifest(file_uri: str, reference_id: str, document_id: str):
+    if not manifest_path:
+        return
+    entry = {"uri": file_uri, "reference_id": reference_id,
+             "document_id": document_id}
+    with manifest_lock:
+        with open(manifest_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def resolve_document_schema(schema_name: str, keys, document_schemas):
+    if schema_id:
+        return schema_id
+
+    document_schema_id = None
+    create_new_schema = False
+    if schema_name in document_schemas:
+        document_schema_id = document_schemas[schema_name]
+        schema = docai_warehouse_helper.get_document_schema(
+            dw_utils, document_schema_id
+        )
+        if (
+                schema
+                and len(keys) != 0
+                and len(schema.property_definitions) == 0
+                and options
+        ):
+            create_new_schema = True
+    else:
+        create_new_schema = True
+
+    if create_new_schema:
+        schema_path = create_mapping_schema(schema_name, keys, options)
+        new_schema_id = create_document_schema(schema_path, True)
+        if document_schema_id != new_schema_id:
+            created_schemas.add(new_schema_id)
+            document_schemas[schema_name] = new_schema_id
+            document_schema_id = new_schema_id
+    return document_schema_id
+
+
 def get_type(value: str):
     if type(value) == bool or str(value) == "":
         return "text_type_options"  # bool Not Supported
@@ -224,11 +503,7 @@ def get_type(value: str):
 
 
 def is_valid_float(string: str):
-    try:
-        float(string)
-        return True
-    except ValueError:
-        return False
+    return FLOAT_PATTERN.match(str(string)) is not None
 
 
 def is_valid_bool(string: str):
@@ -236,7 +511,7 @@ def is_valid_bool(string: str):
 
 
 def is_valid_int(string: str):
-    return string.isdigit()
+    return INT_PATTERN.match(str(string)) is not None
 
 
 def create_mapping_schema(display_name, names, options=True):
@@ -296,7 +571,8 @@ def upload_document_gcs(
         document_ai_output,
         metadata_properties: List[contentwarehouse_v1.Property],
 ):
-    create_document_response = dw_utils.create_document(
+    create_document_response = with_retries(
+        dw_utils.create_document,
         display_name=os.path.basename(file_uri),
         mime_type="application/pdf",
         document_schema_id=document_schema_id,
@@ -315,7 +591,8 @@ def upload_document_gcs(
         document_id = create_document_response.document.name.split("/")[-1]
         document_id_list.append(document_id)
 
-        dw_utils.link_document_to_folder(
+        with_retries(
+            dw_utils.link_document_to_folder,
             document_id=document_id,
             folder_document_id=folder_id,
             caller_user_id=CALLER_USER,
@@ -456,6 +733,39 @@ def get_args():
         help="Name of the root folder inside DW where "
              "documents will be loaded. When skipped, will use the same name of the folder being loaded from.",
     )
+    args_parser.add_argument(
+        "--chunk-size",
+        dest="chunk_size",
+        type=int,
+        default=100,
+        help="Number of documents per DocAI batch operation. Next chunk is processed while the previous one is uploaded.",
+    )
+    args_parser.add_argument(
+        "--bulk",
+        dest="bulk",
+        help="Bulk load mode: cached folder tree, concurrent existence checks and uploads, retries.",
+        action="store_true",
+        default=False,
+    )
+    args_parser.add_argument(
+        "--workers",
+        dest="workers",
+        type=int,
+        default=8,
+        help="(bulk mode) Number of concurrent Document AI Warehouse requests.",
+    )
+    args_parser.add_argument(
+        "--retries",
+        dest="retries",
+        type=int,
+        default=3,
+        help="(bulk mode) Number of retries on transient API errors.",
+    )
+    args_parser.add_argument(
+        "--manifest",
+        dest="manifest_path",
+        help="(bulk mode) Path to a manifest file. Loaded files are recorded there and skipped on re-run.",
+    )
 
     return args_parser
 
@@ -498,5 +808,12 @@ if __name__ == "__main__":
     overwrite = args.overwrite
     options = args.options
     flatten = args.flatten
-
-    main(root_name, new_schema_name)
+    chunk_size = args.chunk_size
+
+    if args.bulk:
+        workers = args.workers
+        retries = args.retries
+        manifest_path = args.manifest_path
+        bulk_load(root_name, new_schema_name)
+    else:
+        main(root_name, new_schema_name)
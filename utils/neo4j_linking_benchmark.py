@@ -0,0 +1,165 @@
+"""
+Copyright 2024 Google LLC
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    https://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Benchmarks claim graph writes and incremental claim linking against a local
+Neo4j, using synthetic claims.
+
+  docker run -d -p 7687:7687 -e NEO4J_AUTH=neo4j/benchmark neo4j:4.4
+  python utils/neo4j_linking_benchmark.py --claims 10000 --clean
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "../common/src"))
+os.environ.setdefault("PROJECT_ID", "neo4j-benchmark")
+
+# pylint: disable=wrong-import-position
+from neo4j import GraphDatabase
+from common.utils import neo4j_claim_linking
+from common.utils.neo4j_new_incoming_claim import add_to_graph, batches
+
+
+def parsers():
+  parser = argparse.ArgumentParser(description="Neo4j claim linking benchmark")
+  parser.add_argument("--uri", default="bolt://localhost:7687")
+  parser.add_argument("--user", default="neo4j")
+  parser.add_argument("--password", default="benchmark")
+  parser.add_argument("--claims", type=int, default=10000,
+                      help="Number of synthetic claims")
+  parser.add_argument("--incremental", type=int, default=100,
+                      help="Claims added after the initial load to measure "
+                           "an incremental linking run")
+  parser.add_argument("--batch-size", type=int, default=500,
+                      help="Claims per transaction")
+  parser.add_argument("--shared-ratio", type=float, default=0.05,
+                      help="Share of claims re-using attributes of another "
+                           "claim, i.e. expected to be linked")
+  parser.add_argument("--clean", action="store_true",
+                      help="Delete all nodes before the run")
+  return parser.parse_args()
+
+
+def random_token(length: int) -> str:
+  return "".join(random.choices(string.ascii_lowercase + string.digits,
+                                k=length))
+
+
+def synthetic_claim(prefix: str, i: int, claims: list, shared_ratio: float):
+  if claims and random.random() < shared_ratio:
+    # Same person filing again - re-use identity and contact details
+    claim = dict(random.choice(claims))
+  else:
+    first, last = random_token(6), random_token(8)
+    email_username = f"{first}.{last}"
+    claim = {
+        "full_name": f"{first}  {last}",
+        "date_of_birth": f"19{random.randint(40, 99)}-"
+                         f"{random.randint(1, 12):02d}-"
+                         f"{random.randint(1, 28):02d}",
+        "res_address": f"{random.randint(1, 9999)} {random_token(8)} st",
+        "mail_address": f"po box {random.randint(1, 9999)}",
+        "res_address_zipcode": f"{random.randint(10000, 99999)}",
+        "email_address": f"{email_username}@example.com",
+        "email_username": email_username,
+        "email_tokenised": f"{first}{last}",
+        "phone_num": f"555{random.randint(1000000, 9999999)}",
+        "itin_number": random.choice(["", f"9{random.randint(10**7, 10**8)}"]),
+        "tf_number": "",
+        "driver_license_id_number": f"D{random.randint(10**6, 10**7)}",
+        "register_ip_address": f"10.{random.randint(0, 255)}."
+                               f"{random.randint(0, 255)}."
+                               f"{random.randint(0, 255)}",
+        "rec_id_number": "",
+        "foreign_passport_number": "",
+        "us_passport_document_id": random.choice(
+            ["", f"P{random.randint(10**7, 10**8)}"]),
+    }
+  claim["claim_id"] = f"{prefix}-{i}"
+  return claim
+
+
+def clean(driver):
+  with driver.session() as graph_session:
+    while True:
+      deleted = graph_session.run("""
+        MATCH (n) WITH n LIMIT 10000 DETACH DELETE n RETURN count(*) AS deleted
+      """).single()["deleted"]
+      if deleted == 0:
+        break
+
+
+def write(driver, claims, batch_size) -> float:
+  start_time = time.time()
+  with driver.session() as graph_session:
+    for batch in batches(claims, batch_size):
+      graph_session.write_transaction(add_to_graph, batch)
+  return time.time() - start_time
+
+
+def link(driver, batch_size) -> float:
+  start_time = time.time()
+  neo4j_claim_linking.link_pending_claims(driver, batch_size)
+  return time.time() - start_time
+
+
+def count_links(driver) -> int:
+  with driver.session() as graph_session:
+    return graph_session.run("""
+      MATCH (:claim)-[r]-(:claim) WHERE type(r) STARTS WITH "SAME_"
+      RETURN count(r) / 2 AS links
+    """).single()["links"]
+
+
+def report(name, count, seconds):
+  print(f"{name:<24} {count:>8} claims {seconds:>9.2f} s "
+        f"{count / max(seconds, 1e-9):>10.1f} claims/s")
+
+
+def main():
+  args = parsers()
+  driver = GraphDatabase.driver(args.uri, auth=(args.user, args.password))
+  try:
+    if args.clean:
+      clean(driver)
+    neo4j_claim_linking.create_constraints(driver)
+
+    prefix = f"bench{int(time.time())}"
+    claims = []
+    for i in range(args.claims):
+      claims.append(synthetic_claim(prefix, i, claims, args.shared_ratio))
+    report("write", len(claims), write(driver, claims, args.batch_size))
+    report("link (initial)", len(claims), link(driver, args.batch_size))
+
+    new_claims = [synthetic_claim(prefix, args.claims + i, claims,
+                                  args.shared_ratio)
+                  for i in range(args.incremental)]
+    report("write (incremental)", len(new_claims),
+           write(driver, new_claims, args.batch_size))
+    report("link (incremental)", len(new_claims),
+           link(driver, args.batch_size))
+    print(f"claim links in graph: {count_links(driver)}")
+  finally:
+    driver.close()
+
+
+if __name__ == "__main__":
+  main()
@@ -22,13 +22,12 @@ This script is used for Updating the Validation Rules
 import argparse
 from sys import argv
 import os
+import re
 import json
-from copy import deepcopy
-from six import string_types
-from jinjasql import JinjaSql
 from google.cloud import storage
-from commmon.utils.logging_handler import Logger
-from common.config import PATH,BUCKET_NAME_VALIDATION,PATH_TEMPLATE,PROJECT_ID
+from common.utils.logging_handler import Logger
+from common.utils.rule_compiler import compile_rule
+from common.config import PATH,BUCKET_NAME_VALIDATION,PROJECT_ID
 file_name=PATH.rsplit('/', 1)[-1]
 logger = Logger.get_logger(__name__)
 
@@ -119,106 +118,44 @@ def read_json(path):
   return data_dict
 
 
-def get_params(args):
+def get_rule(args):
   '''
-  Assign the Appropriate Parameters according to the input taken fron the Command Line
+  Build the structured Rule from the input taken from the Command Line.
+  The validation service compiles it into a parameterized query and a local
+  predicate, so no SQL text is generated here.
   Input :
     args:Command Line input taken from the User
   Output:
-    params : Dictionary conisting of the necessary fields to plug into the SQL Query
+    rule : Dictionary with the template and its parameters
   '''
-  if args.delete:
-    datak[args.doc_type].pop(args.ruleid)
-
-  elif args.template == 'Template1':
-    params={
+  if args.template == 'Template1':
+    rule = {
+    'template' : args.template,
     'key' : args.key,
-    'BQ_Table' :"`project_table`",
-    'doc_type' : args.doc_type,
     'value_before' : args.value_before,
     'value_after' : args.value_after}
 
   elif args.template == 'Template2':
-    params = {
+    rule = {
+    'template' : args.template,
     'key' : args.key_list,
-    'BQ_Table' : '`project_table`',
-    'value' : args.value_list,
-    'operator' : args.operator_list}
+    'operator' : args.operator_list,
+    'value' : args.value_list}
+
+  elif args.template == 'Template5':
+    rule = {
+    'template' : args.template,
+    'key' : args.key,
+    'value' : args.value}
+
   else:
-      params={
+    rule = {
+    'template' : args.template,
     'key' : args.key,
-    'BQ_Table' :"`project_table`",
-    'doc_type' : args.doc_type,
     'operator' : args.operator,
     'value' : args.value}
 
-  return params
-
-
-def check_float(potential_float):
-  '''
-  Check if the value passed to the function is a float or not
-  '''
-  try:
-    float(potential_float)
-    return True
-  except ValueError:
-    return False
-
-
-def get_sql_from_template(query, bind_params):
-  '''
-  Get the Parameters Json and select the appropriate fields where single quote needs to be applied
-  Input:
-    query : Is the SQL Query prepared using teamplates
-    bind_params : list of parameters
-  Output:
-    query%params : complete sql query with quotes added in appropriate location
-  '''
-
-  if not bind_params:
-    return query
-  params = deepcopy(bind_params)
-  # Used for iterating on the key value dictionary
-  for key, val in params.items():
-    if "doc_type" in key or ("key" not in key and not check_float(val)):
-      if "BQ_Table" in key:
-        continue
-      if "dim" in key:
-        continue
-      params[key] = quote_sql_string(val)
-  return query % params
-
-
-def quote_sql_string(value):
-  '''
-  If `value` is a string type, escapes single quotes in the string
-  and returns the string enclosed in single quotes.
-  '''
-  if isinstance(value, string_types):
-    if value in ['>','<','==','!=','=']:
-      return value
-    new_value = str(value)
-    new_value = new_value.replace("'", "''")
-    return "'{}'".format(new_value)
-  return value
-
-
-def prep_sql(template,params):
-  '''
-  Apply a JinjaSql template (string) substituting parameters (dict) and return
-  the final SQL.
-  Input:
-    template : Template used for query Generation
-    params: parameter dict to plug into the joinja template
-
-  Output:
-    jinn : the generated SQL Query
-  '''
-  j = JinjaSql(param_style='pyformat')
-  query, bind_params = j.prepare_query(template, params)
-  jinn = get_sql_from_template(query, bind_params)
-  return jinn
+  return rule
 
 
 def get_var(var):
@@ -235,11 +172,11 @@ def get_var(var):
 
 
 
-def update_json(jinn,args):
+def update_json(rule,args):
   '''
-  Add the newly create Sql Query(Rule) to the already existing Rules json
+  Add the newly created Rule to the already existing Rules json
   Input:
-    jinn: Newly Generated SQL Query(Rule)
+    rule: Newly created structured Rule
     args" Command Line arguments recevied from the user
   Output:
     data : Updated Rule Dict
@@ -252,7 +189,7 @@ def update_json(jinn,args):
   try:
     get_list = list(data[args.doc_type].keys())
   except KeyError as e:
-    data[args.doc_type]={rule_no : jinn}
+    data[args.doc_type]={rule_no : rule}
     return data
 
   var=get_list[-1]
@@ -261,23 +198,11 @@ def update_json(jinn,args):
   else:
       rule_no = get_var(var)
   if args.doc_type in data:
-    data[args.doc_type][rule_no] = jinn
+    data[args.doc_type][rule_no] = rule
   return data
 
 
 
-def load_template(data,args):
-  '''
-  As per the user input, the appropriate jinja template is loaded from the template file
-  Input:
-        data: dict consisting of the jinja templates
-        args : Command Line input taken from the user
-  Ouput:
-        template : The Template selected as per the user input
-  '''
-  template = data[args.template]
-  return template
-
 def dump_updated_json(data):
   '''
   Update the newly created rules json
@@ -306,11 +231,6 @@ def main():
   Main Function Used to control the code flow
   '''
   args=parsers()
-  try:
-    data = read_json(PATH_TEMPLATE)
-  except FileNotFoundError:
-    logger.info(f"Template File Does not exist or the file path is incorrect")
-    return
   if args.view:
     try:
       data = read_json(PATH)
@@ -334,14 +254,14 @@ def main():
     except FileNotFoundError:
       logger.info(f"File Does not exist or the file path is incorrect")
     return
-  params = get_params(args)
-  template = load_template(data,args)
+  rule = get_rule(args)
   try:
-    jinn = prep_sql(template,params)
-  except TypeError as e:
-    logger.info(f"Incorrect Input Format")
+    # Fails on unsupported operators, entity names or values
+    compile_rule(args.ruleid, rule, "project_table")
+  except (KeyError, TypeError, ValueError, re.error) as e:
+    logger.info(f"Incorrect Input Format: {e}")
     return
-  data = update_json(jinn,args)
+  data = update_json(rule,args)
   dump_updated_json(data)
   upload_bucket()
   os.remove(file_name)